@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.PerformanceMiddleware",  # Per-view latency histograms
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",  # For language switching
@@ -85,12 +86,81 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite by default; set DB_ENGINE=postgresql and the DB_* variables below for
+# production. Connections are kept open for DB_CONN_MAX_AGE seconds and
+# checked before reuse, so opening a connection is not part of every request.
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config('DB_NAME', default='fakti'),
+            "USER": config('DB_USER', default='fakti'),
+            "PASSWORD": config('DB_PASSWORD', default=''),
+            "HOST": config('DB_HOST', default='localhost'),
+            "PORT": config('DB_PORT', default='5432'),
+            "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=60, cast=int),
+            "CONN_HEALTH_CHECKS": config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            "OPTIONS": {},
+        }
     }
-}
+    # Django's psycopg 3 connection pool (needs psycopg[pool]); it replaces
+    # persistent connections, so CONN_MAX_AGE must be 0 when it is enabled
+    if config('DB_POOL', default=False, cast=bool):
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            "max_size": config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            "timeout": config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+
+    # Optional read replica for the dashboard and list pages (see core/db_routers.py)
+    DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+    if DB_REPLICA_HOST:
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": DB_REPLICA_HOST,
+            "PORT": config('DB_REPLICA_PORT', default=DATABASES["default"]["PORT"]),
+            "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": config('DB_NAME', default=str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=60, cast=int),
+            "CONN_HEALTH_CHECKS": config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            "OPTIONS": {},
+        }
+    }
+
+    # Opt-in tuning for deployments that stay on SQLite. WAL lets readers run
+    # while a write is in progress, and BEGIN IMMEDIATE takes the write lock
+    # when a transaction starts, so concurrent writers queue on busy_timeout
+    # instead of failing with "database is locked" when a read lock cannot be
+    # upgraded. synchronous=NORMAL is durable across crashes in WAL mode and
+    # only syncs at checkpoints.
+    SQLITE_TUNING_OPTIONS = {
+        "init_command": ";".join((
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            f"PRAGMA busy_timeout={config('DB_SQLITE_BUSY_TIMEOUT', default=5000, cast=int)}",
+            f"PRAGMA mmap_size={config('DB_SQLITE_MMAP_SIZE', default=128 * 1024 * 1024, cast=int)}",
+            # Negative sizes are in KiB
+            f"PRAGMA cache_size=-{config('DB_SQLITE_CACHE_KB', default=20000, cast=int)}",
+        )),
+        "transaction_mode": "IMMEDIATE",
+    }
+    if config('DB_SQLITE_TUNED', default=False, cast=bool):
+        DATABASES["default"]["OPTIONS"].update(SQLITE_TUNING_OPTIONS)
+
+DATABASE_ROUTERS = ['core.db_routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they write, so pages do not
+# show data the replica has not received yet
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
 
 
 # Password validation
@@ -146,6 +216,52 @@ STATIC_ROOT = BASE_DIR / "staticfiles"  # Production static files
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Cache (local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a
+# file-based, Memcached or Redis cache to share it between processes)
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default='fakti'),
+    }
+}
+# Backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Cache used for per-user pages and fragments (see invoices/cache.py). The
+# version bumps that invalidate them must reach every worker process, so
+# outside development they are only cached in a shared cache by default;
+# 0 turns the page cache off
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = config(
+    'PAGE_CACHE_TIMEOUT',
+    default=300 if DEBUG or CACHE_BACKEND not in PROCESS_LOCAL_CACHE_BACKENDS else 0,
+    cast=int,
+)
+
+# Mark overdue invoices every N seconds from the web process (0 disables it;
+# prefer running the mark_overdue_invoices command from cron)
+OVERDUE_SWEEP_INTERVAL = config('OVERDUE_SWEEP_INTERVAL', default=0, cast=int)
+
+# Rendered invoice PDFs (see invoices/pdf.py)
+PDF_CACHE_DIR = config('PDF_CACHE_DIR', default=str(BASE_DIR / 'pdf_cache'))
+# Render PDFs in the run_pdf_worker process pool instead of inside the
+# request. Opt-in: without a running worker, queued PDFs are never rendered
+PDF_ASYNC_RENDERING = config('PDF_ASYNC_RENDERING', default=False, cast=bool)
+# Rendering processes used by the bulk PDF export endpoint
+PDF_EXPORT_PROCESSES = config('PDF_EXPORT_PROCESSES', default=2, cast=int)
+# Most invoices one bulk PDF export request may select; missing PDFs are
+# rendered before the download starts, so this bounds how long it waits.
+# Larger exports go through the export_invoice_pdfs command
+PDF_EXPORT_MAX_INVOICES = config('PDF_EXPORT_MAX_INVOICES', default=200, cast=int)
+
+# Requests slower than this are logged with their slowest query (see core/middleware.py)
+PERF_SLOW_REQUEST_MS = config('PERF_SLOW_REQUEST_MS', default=1000, cast=int)
+# Bearer token that lets a Prometheus scraper read /metrics/ (staff users can always)
+PERF_METRICS_TOKEN = config('PERF_METRICS_TOKEN', default='')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.OVERDUE_SWEEP_INTERVAL:
+    from invoices.overdue import start_periodic_sweeper  # noqa: E402
+
+    start_periodic_sweeper(settings.OVERDUE_SWEEP_INTERVAL)
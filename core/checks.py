@@ -0,0 +1,24 @@
+"""
+System checks for the database routing in db_routers.py.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .db_routers import replica_configured
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """Primary pins are kept in the default cache, which every worker process must see"""
+    backend = settings.CACHES['default']['BACKEND']
+    if replica_configured() and backend in settings.PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f'A read replica is configured but the default cache uses {backend}, '
+            f'which is not shared between processes.',
+            hint=(
+                'A write pins the user to the primary only in the process that handled it. '
+                'Set CACHE_BACKEND to a shared cache (Redis, Memcached, file based).'
+            ),
+            id='core.E001',
+        )]
+    return []
@@ -0,0 +1,82 @@
+"""
+Routing of read-heavy pages to an optional read replica.
+
+Only code running inside ``use_replica()`` (or a view wrapped with
+``read_from_replica``) reads from the ``replica`` database, and only when one
+is configured; everything else, including every write, uses ``default``.
+A user who has just written is kept on the primary for
+``DB_REPLICA_PIN_SECONDS`` (see ``record_write``), so replication lag never
+shows them stale pages or lets stale pages into the page cache.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+REPLICA_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f'fakti:primary-pin:{user_id}'
+
+
+def record_write(user_id):
+    """Keep the reads of ``user_id`` on the primary until the replica has caught up"""
+    if replica_configured():
+        cache.set(_pin_key(user_id), True, settings.DB_REPLICA_PIN_SECONDS)
+
+
+def pinned_to_primary(user_id):
+    return replica_configured() and cache.get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def use_replica():
+    """Send the reads made inside the block to the replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view):
+    """Serve a view's reads from the replica unless the user wrote recently"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_configured() or pinned_to_primary(request.user.pk):
+            return view(request, *args, **kwargs)
+        with use_replica():
+            response = view(request, *args, **kwargs)
+            # Template responses run their queries while rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA_ALIAS
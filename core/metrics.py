@@ -0,0 +1,223 @@
+"""
+In-process performance metrics.
+
+Histograms with fixed buckets are kept per metric and label set in this
+process only; every worker process of a deployment reports its own numbers
+on the metrics endpoint, which Prometheus aggregates when scraping them all.
+Quantiles (p50/p95/p99) are estimated from the buckets, the same way
+Prometheus' ``histogram_quantile`` does.
+
+``PerformanceMiddleware`` (core/middleware.py) records the per-view request
+metrics; code doing expensive work outside the database and templates, such
+as PDF rendering, reports it with ``timed()``.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.template.backends.django import Template as DjangoTemplate
+
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, math.inf)
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRICS = {
+    'fakti_request_duration_seconds': ('Time spent in the view and middleware', SECONDS_BUCKETS),
+    'fakti_request_db_queries': ('Database queries per request', COUNT_BUCKETS),
+    'fakti_request_db_duration_seconds': ('Time spent in database queries per request', SECONDS_BUCKETS),
+    'fakti_request_template_duration_seconds': ('Time spent rendering templates per request', SECONDS_BUCKETS),
+    'fakti_request_pdf_duration_seconds': ('Time spent rendering PDFs per request that rendered one', SECONDS_BUCKETS),
+    'fakti_pdf_render_duration_seconds': ('Time spent rendering one PDF', SECONDS_BUCKETS),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram safe to update from several threads"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile by interpolating inside the bucket that holds it"""
+        counts, _sum, count = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0
+                upper = self.buckets[index]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-2]
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def observe(name, value, **labels):
+    """Record ``value`` in the histogram of metric ``name`` for ``labels``"""
+    key = (name, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram(METRICS[name][1]))
+    histogram.observe(value)
+
+
+def get_histogram(name, **labels):
+    return _histograms.get((name, tuple(sorted(labels.items()))))
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class RequestStats:
+    """Figures collected while one request is being handled"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.worst_sql = None
+        self.worst_sql_time = 0.0
+        self.template_time = 0.0
+        self.pdf_time = 0.0
+        # Nested template renders are already part of the outer one
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query of the request"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            if duration > self.worst_sql_time:
+                self.worst_sql, self.worst_sql_time = sql, duration
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def collect_request_stats():
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """Time a PDF render: ``with timed('pdf'): ...``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        observe(f'fakti_{kind}_render_duration_seconds', duration)
+        stats = _current.get()
+        if stats is not None:
+            setattr(stats, f'{kind}_time', getattr(stats, f'{kind}_time') + duration)
+
+
+def instrument_templates():
+    """Add the render time of Django templates to the current request's stats"""
+    render = DjangoTemplate.render
+    if getattr(render, 'instrumented', False):
+        return
+
+    @wraps(render)
+    def timed_render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return render(self, context, request)
+        started = time.perf_counter()
+        stats.template_depth += 1
+        try:
+            return render(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+
+    timed_render.instrumented = True
+    DjangoTemplate.render = timed_render
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in items
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Return every histogram and its quantile estimates in the Prometheus text format"""
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+
+    lines = []
+    for name, (description, _buckets) in METRICS.items():
+        series = [(labels, histogram) for (metric, labels), histogram in histograms if metric == name]
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, histogram in series:
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bucket, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, le=_format_number(bucket))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        lines.append(f'# HELP {name}_quantile Estimated quantiles of {name}')
+        lines.append(f'# TYPE {name}_quantile gauge')
+        for labels, histogram in series:
+            for q in QUANTILES:
+                value = histogram.quantile(q)
+                if value is not None:
+                    lines.append(f'{name}_quantile{_format_labels(labels, quantile=q)} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,56 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL statement quoted in the slow request log
+SLOW_LOG_SQL_LENGTH = 1000
+
+
+class PerformanceMiddleware:
+    """
+    Record latency, database queries and time, template render time and PDF
+    render time of every request in per-view histograms (see core/metrics.py),
+    and log requests slower than PERF_SLOW_REQUEST_MS with their slowest query.
+
+    The body of a streaming response is produced after the middleware
+    returns, so only the time until its first byte is measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.instrument_templates()
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with metrics.collect_request_stats() as stats, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.observe('fakti_request_duration_seconds', duration, view=view)
+        metrics.observe('fakti_request_db_queries', stats.queries, view=view)
+        metrics.observe('fakti_request_db_duration_seconds', stats.db_time, view=view)
+        metrics.observe('fakti_request_template_duration_seconds', stats.template_time, view=view)
+        if stats.pdf_time:
+            metrics.observe('fakti_request_pdf_duration_seconds', stats.pdf_time, view=view)
+
+        if duration * 1000 >= settings.PERF_SLOW_REQUEST_MS:
+            logger.warning(
+                'Slow request: %s %s (%s) took %.0fms: %d queries in %.0fms, templates %.0fms, PDF %.0fms; '
+                'slowest query (%.0fms): %s',
+                request.method, request.path, view, duration * 1000,
+                stats.queries, stats.db_time * 1000, stats.template_time * 1000, stats.pdf_time * 1000,
+                stats.worst_sql_time * 1000, (stats.worst_sql or '-')[:SLOW_LOG_SQL_LENGTH],
+            )
+        return response
@@ -1,3 +1,138 @@
-from django.test import TestCase
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from invoices.models import Invoice
+
+from . import metrics
+from .checks import check_replica_pin_cache
+from .db_routers import REPLICA_ALIAS, ReplicaRouter, read_from_replica, record_write, use_replica
+
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+
+    def replica(self):
+        return mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: settings.DATABASES['default']})
+
+    def test_reads_stay_on_the_primary_without_a_replica(self):
+        with use_replica():
+            self.assertIsNone(self.router.db_for_read(Invoice))
+
+    def test_only_reads_inside_use_replica_go_to_the_replica(self):
+        with self.replica():
+            self.assertIsNone(self.router.db_for_read(Invoice))
+            with use_replica():
+                self.assertEqual(self.router.db_for_read(Invoice), REPLICA_ALIAS)
+                self.assertEqual(self.router.db_for_write(Invoice), 'default')
+            self.assertIsNone(self.router.db_for_read(Invoice))
+            self.assertFalse(self.router.allow_migrate(REPLICA_ALIAS, 'invoices'))
+
+    def test_users_who_just_wrote_read_from_the_primary(self):
+        routed = []
+        view = read_from_replica(lambda request: routed.append(self.router.db_for_read(Invoice)))
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        with self.replica():
+            view(request)
+            record_write(self.user.pk)
+            view(request)
+        self.assertEqual(routed, [REPLICA_ALIAS, None])
+
+    def test_check_requires_a_shared_cache_with_a_replica(self):
+        self.assertEqual(check_replica_pin_cache(None), [])
+        with self.replica():
+            self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['core.E001'])
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+            with override_settings(CACHES=shared):
+                self.assertEqual(check_replica_pin_cache(None), [])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite tuning only applies to SQLite')
+class SqliteTuningTests(SimpleTestCase):
+
+    def test_tuning_options_are_applied_to_new_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper({
+                **settings.DATABASES['default'],
+                'NAME': str(Path(directory) / 'tuned.sqlite3'),
+                'OPTIONS': settings.SQLITE_TUNING_OPTIONS,
+            }, alias='tuned')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertGreater(cursor.fetchone()[0], 0)
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+
+
+class PerformanceMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_histogram_quantiles(self):
+        histogram = metrics.Histogram(metrics.SECONDS_BUCKETS)
+        for _ in range(90):
+            histogram.observe(0.003)
+        for _ in range(10):
+            histogram.observe(0.7)
+        self.assertLessEqual(histogram.quantile(0.5), 0.005)
+        self.assertTrue(0.5 < histogram.quantile(0.95) <= 1)
+        self.assertIsNone(metrics.Histogram(metrics.SECONDS_BUCKETS).quantile(0.5))
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+
+        self.assertEqual(metrics.get_histogram('fakti_request_duration_seconds', view='dashboard').count, 2)
+        queries = metrics.get_histogram('fakti_request_db_queries', view='dashboard')
+        self.assertGreater(queries.sum, 0)
+        self.assertGreater(metrics.get_histogram('fakti_request_template_duration_seconds', view='dashboard').sum, 0)
+        self.assertIsNone(metrics.get_histogram('fakti_request_pdf_duration_seconds', view='dashboard'))
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        with override_settings(PERF_METRICS_TOKEN='scrape-token'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('fakti_request_duration_seconds_bucket{view="dashboard",le="+Inf"} 1', body)
+        self.assertIn('fakti_request_duration_seconds_quantile{view="dashboard",quantile="0.95"}', body)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_slowest_query(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertIn('(dashboard)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
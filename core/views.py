@@ -1,7 +1,14 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.utils.crypto import constant_time_compare
 from django.views.generic import TemplateView
 
+from .db_routers import read_from_replica
+from .metrics import render_prometheus
+
 # Home Page View
 def home(request):
     """
@@ -11,25 +18,36 @@ def home(request):
 
 # Dashboard View
 @login_required
+@read_from_replica
 def dashboard(request):
     """
     Dashboard view - Shows dashboard for authenticated users
     Retrieves real invoice statistics from the invoices app
     """
     # Import here to avoid circular imports
-    from django.db.models import Sum, Count
-    from invoices.models import Invoice
-    
-    # Get user's invoices
-    invoices = Invoice.objects.filter(user=request.user)
+    from invoices.stats import get_cached_invoice_stats
     
-    # Calculate stats
+    # Stats from the summary table, cached until the user's invoices change
+    stats = get_cached_invoice_stats(request.user)
     context = {
-        'total_invoices': invoices.count(),
-        'paid_invoices': invoices.filter(status='paid').count(),
-        'unpaid_invoices': invoices.exclude(status='paid').count(),
-        'total_revenue': invoices.filter(status='paid').aggregate(Sum('total'))['total__sum'] or 0,
+        'total_invoices': stats['total_invoices'],
+        'paid_invoices': stats['paid_count'],
+        'unpaid_invoices': stats['unpaid_count'],
+        'total_revenue': stats['total_paid'],
+        'currency_totals': stats['currency_totals'],
     }
     
     return render(request, 'core/dashboard.html', context)
 
+
+# Metrics View
+def metrics(request):
+    """
+    Request metrics of this process in the Prometheus text format, for staff
+    users and for scrapers sending the PERF_METRICS_TOKEN bearer token
+    """
+    token = settings.PERF_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(authorization, f'Bearer {token}')) and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -9,7 +9,8 @@ class InvoiceItemInline(admin.TabularInline):
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'email', 'phone', 'country', 'created_at')
+    list_display = ('name', 'user', 'email', 'phone', 'country', 'invoices_count', 'total_billed', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('created_at', 'country')
     search_fields = ('name', 'email', 'phone', 'address')
     readonly_fields = ('created_at', 'updated_at')
@@ -24,11 +25,25 @@ class ClientAdmin(admin.ModelAdmin):
             'fields': ('notes', 'created_at', 'updated_at')
         }),
     )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_billing_stats()
+    
+    @admin.display(description='Invoices', ordering='num_invoices')
+    def invoices_count(self, obj):
+        return obj.invoices_count()
+    
+    @admin.display(description='Total billed')
+    def total_billed(self, obj):
+        return ', '.join(
+            f"{totals['billed']:.2f} {totals['currency']}" for totals in obj.billing_totals()
+        ) or '-'
 
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ('invoice_number', 'user', 'client', 'issue_date', 'due_date', 'status', 'total')
+    list_select_related = ('user', 'client')
     list_filter = ('status', 'issue_date', 'due_date')
     search_fields = ('invoice_number', 'client__name', 'notes')
     readonly_fields = ('subtotal', 'tax_amount', 'discount_amount', 'total', 'created_at', 'updated_at')
@@ -49,5 +64,7 @@ class InvoiceAdmin(admin.ModelAdmin):
 @admin.register(InvoiceItem)
 class InvoiceItemAdmin(admin.ModelAdmin):
     list_display = ('invoice', 'description', 'quantity', 'unit_price', 'line_total')
-    list_filter = ('invoice',)
+    list_select_related = ('invoice__client',)
+    # Filtering on the invoice itself would render (and query the client of) every invoice
+    list_filter = ('invoice__status', 'invoice__currency')
     search_fields = ('description', 'invoice__invoice_number')
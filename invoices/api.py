@@ -0,0 +1,302 @@
+"""
+Read-only JSON API over a user's invoices, line items and clients.
+
+Responses contain the fields named in ``?fields=`` (or each resource's
+defaults) and the queries load only what those fields need: the columns
+behind them, a ``select_related`` join for an embedded ``client`` and a
+prefetch for ``line_items``. Lists are keyset paginated on
+``(created_at, id)`` like the HTML lists.
+
+Every response carries a weak ETag derived from the ``updated_at`` of the
+objects it contains and of their embedded client, the requested fields and
+the page. It is computed from a narrow query before anything else is
+loaded, so a request whose ``If-None-Match`` still matches costs that one
+query and a 304, with no serialization. Line item changes move their
+invoice's ``updated_at`` (see totals.apply_line_total_delta), so they are
+covered by the invoice's ETag.
+"""
+import hashlib
+from functools import wraps
+from operator import attrgetter
+
+from django.db.models import F, Prefetch
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from core.db_routers import read_from_replica
+
+from .forms import parse_id
+from .models import Client, Invoice, InvoiceItem
+from .pagination import paginate_keyset
+
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Columns every invoice and client query loads for cursors and ETags
+STAMP_COLUMNS = ('id', 'created_at', 'updated_at')
+
+
+class ApiError(Exception):
+    """A malformed request, answered with a 400 and the message"""
+
+
+class ApiField:
+    """
+    How one API field is loaded and serialized: the model columns it needs,
+    the relation it joins or prefetches, and the extra timestamps (as
+    annotations) that must change the ETag when its value changes.
+    """
+
+    def __init__(self, columns, serialize, select_related=None, prefetch=None, versions=None):
+        self.columns = columns
+        self.serialize = serialize
+        self.select_related = select_related
+        self.prefetch = prefetch
+        self.versions = versions or {}
+
+
+def column(name):
+    return ApiField((name,), attrgetter(name))
+
+
+LINE_ITEM_FIELDS = {
+    name: column(name)
+    for name in ('id', 'invoice_id', 'description', 'quantity', 'unit_price', 'line_total')
+}
+# Columns of line items, which are always served whole
+LINE_ITEM_COLUMNS = ('id', 'invoice', 'description', 'quantity', 'unit_price', 'line_total')
+
+
+def _embedded_client(invoice):
+    return {'id': invoice.client_id, 'name': invoice.client.name, 'email': invoice.client.email}
+
+
+def _embedded_line_items(invoice):
+    return [LINE_ITEMS.serialize(item, LINE_ITEMS.list_fields) for item in invoice.line_items.all()]
+
+
+INVOICE_FIELDS = {
+    'id': column('id'),
+    'invoice_number': column('invoice_number'),
+    'client_id': ApiField(('client',), attrgetter('client_id')),
+    'client': ApiField(
+        ('client', 'client__name', 'client__email'),
+        _embedded_client,
+        select_related='client',
+        versions={'client_updated_at': F('client__updated_at')},
+    ),
+    **{
+        name: column(name)
+        for name in (
+            'issue_date', 'due_date', 'status', 'currency', 'subtotal', 'tax_percent', 'tax_amount',
+            'discount_percent', 'discount_amount', 'total', 'notes', 'created_at', 'updated_at',
+        )
+    },
+    'line_items': ApiField(
+        (),
+        _embedded_line_items,
+        prefetch=lambda: Prefetch(
+            'line_items', queryset=InvoiceItem.objects.only(*LINE_ITEM_COLUMNS).order_by('id'),
+        ),
+    ),
+}
+
+CLIENT_FIELDS = {
+    name: column(name)
+    for name in (
+        'id', 'name', 'email', 'phone', 'address', 'city', 'country', 'notes', 'created_at', 'updated_at',
+    )
+}
+
+
+class Resource:
+    """Invoices, line items or clients, as served by the list and detail endpoints"""
+
+    def __init__(self, name, model, fields, list_fields, detail_fields):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.list_fields = list_fields
+        self.detail_fields = detail_fields
+
+    def parse_fields(self, value, default):
+        """The fields named in a ``?fields=`` value, in the given order"""
+        if not value:
+            return default
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+        return names or default
+
+    def stamps(self, queryset, fields):
+        """``queryset`` loading only what cursors and ETags need"""
+        versions = {}
+        for name in fields:
+            versions.update(self.fields[name].versions)
+        return queryset.only(*STAMP_COLUMNS).annotate(**versions), tuple(versions)
+
+    def load(self, queryset, fields):
+        """``queryset`` loading the columns and relations of ``fields``"""
+        columns = set(STAMP_COLUMNS)
+        for name in fields:
+            field = self.fields[name]
+            columns.update(field.columns)
+            if field.select_related:
+                queryset = queryset.select_related(field.select_related)
+            if field.prefetch:
+                queryset = queryset.prefetch_related(field.prefetch())
+        return queryset.only(*columns)
+
+    def serialize(self, obj, fields):
+        return {name: self.fields[name].serialize(obj) for name in fields}
+
+
+INVOICES = Resource(
+    'invoices', Invoice, INVOICE_FIELDS,
+    list_fields=[name for name in INVOICE_FIELDS if name != 'line_items'],
+    detail_fields=list(INVOICE_FIELDS),
+)
+CLIENTS = Resource('clients', Client, CLIENT_FIELDS, list_fields=list(CLIENT_FIELDS), detail_fields=list(CLIENT_FIELDS))
+LINE_ITEMS = Resource(
+    'line-items', InvoiceItem, LINE_ITEM_FIELDS,
+    list_fields=list(LINE_ITEM_FIELDS), detail_fields=list(LINE_ITEM_FIELDS),
+)
+
+
+def make_etag(*parts):
+    """A weak ETag identifying ``parts``"""
+    return f'W/"{hashlib.sha256(repr(parts).encode()).hexdigest()[:32]}"'
+
+
+def _stamp(obj, versions):
+    return (obj.pk, obj.updated_at.isoformat(), *(str(getattr(obj, name)) for name in versions))
+
+
+def _conditional(request, etag, build):
+    """A 304 if ``If-None-Match`` matches ``etag``, otherwise the JSON of ``build()``"""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    # Per-user data: clients may keep it but must revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def api_view(view):
+    """GET-only view answering with JSON errors instead of login redirects, reading from the replica"""
+    replica_view = read_from_replica(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        try:
+            return replica_view(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+    return require_safe(wrapper)
+
+
+def _not_found():
+    return JsonResponse({'error': 'Not found'}, status=404)
+
+
+def _page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be a number')
+
+
+def _list(request, resource, queryset):
+    fields = resource.parse_fields(request.GET.get('fields'), resource.list_fields)
+    cursor = request.GET.get('cursor')
+    stamps, versions = resource.stamps(queryset, fields)
+    page = paginate_keyset(stamps, cursor, _page_size(request))
+    etag = make_etag(
+        resource.name, fields, page.has_next(), page.has_previous(),
+        [_stamp(obj, versions) for obj in page.object_list],
+    )
+
+    def build():
+        ids = [obj.pk for obj in page.object_list]
+        objects = resource.load(queryset.filter(pk__in=ids), fields).in_bulk()
+        return {
+            'results': [resource.serialize(objects[pk], fields) for pk in ids if pk in objects],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    return _conditional(request, etag, build)
+
+
+def _detail(request, resource, queryset, pk):
+    fields = resource.parse_fields(request.GET.get('fields'), resource.detail_fields)
+    if parse_id(pk) is None:
+        # Beyond the id range: no such object, and too large for the database
+        return _not_found()
+    stamps, versions = resource.stamps(queryset.filter(pk=pk), fields)
+    obj = stamps.first()
+    if obj is None:
+        return _not_found()
+    etag = make_etag(resource.name, fields, _stamp(obj, versions))
+    return _conditional(
+        request, etag, lambda: resource.serialize(resource.load(queryset.filter(pk=pk), fields).get(), fields),
+    )
+
+
+@api_view
+def invoice_list(request):
+    """The user's invoices, newest first; filter with ?status= and ?client="""
+    invoices = Invoice.objects.filter(user=request.user)
+    status = request.GET.get('status')
+    if status:
+        if status not in dict(Invoice.STATUS_CHOICES):
+            raise ApiError(f'Unknown status: {status}')
+        invoices = invoices.filter(status=status)
+    client = request.GET.get('client')
+    if client:
+        client_id = parse_id(client)
+        if client_id is None:
+            raise ApiError('client must be a client id')
+        invoices = invoices.filter(client_id=client_id)
+    return _list(request, INVOICES, invoices)
+
+
+@api_view
+def invoice_detail(request, pk):
+    """One invoice of the user, with its line items by default"""
+    return _detail(request, INVOICES, Invoice.objects.filter(user=request.user), pk)
+
+
+@api_view
+def invoice_line_items(request, pk):
+    """All line items of one invoice of the user, in the order they were added"""
+    fields = LINE_ITEMS.parse_fields(request.GET.get('fields'), LINE_ITEMS.list_fields)
+    if parse_id(pk) is None:
+        return _not_found()
+    updated_at = Invoice.objects.filter(pk=pk, user=request.user).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return _not_found()
+    etag = make_etag(LINE_ITEMS.name, pk, fields, updated_at.isoformat())
+
+    def build():
+        items = InvoiceItem.objects.filter(invoice_id=pk).only(*LINE_ITEM_COLUMNS).order_by('id')
+        return {'results': [LINE_ITEMS.serialize(item, fields) for item in items]}
+
+    return _conditional(request, etag, build)
+
+
+@api_view
+def client_list(request):
+    """The user's clients, newest first"""
+    return _list(request, CLIENTS, Client.objects.filter(user=request.user))
+
+
+@api_view
+def client_detail(request, pk):
+    """One client of the user"""
+    return _detail(request, CLIENTS, Client.objects.filter(user=request.user), pk)
@@ -0,0 +1,344 @@
+"""
+Benchmark scenarios for the invoice pages and comparable JSON reports.
+
+Each scenario is one kind of request (list, dashboard, detail, create, edit,
+PDF, search) built for a given user. ``run_client_benchmark`` drives the scenarios
+through Django's test client and records latency and query counts;
+``run_http_benchmark`` replays them from concurrent threads over real HTTP,
+against a server started in this process or an already running one, and
+records latency and throughput. ``build_report`` wraps the results with the
+environment and data set they were measured on, and ``compare_reports``
+lists the scenarios that got slower than a baseline report.
+"""
+import math
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.middleware.csrf import CSRF_SECRET_LENGTH
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import Client, Invoice, InvoiceItem
+from .pdf import WEASYPRINT_INSTALLED
+
+
+REPORT_VERSION = 1
+# Latency percentiles compared between reports
+COMPARED_PERCENTILES = ('p50_ms', 'p95_ms')
+# Searches of the search scenario: common and rare words of the demo data, and prefixes
+SEARCH_QUERIES = ('consulting', 'repair hours', 'jacmel', 'boul', 'inv 2026', 'payment moncash')
+
+
+class Scenario:
+    """A kind of request; ``build(rng)`` returns ``(method, path, data)``"""
+
+    def __init__(self, name, build, available=True):
+        self.name = name
+        self.build = build
+        self.available = available
+
+
+def invoice_form_data(invoice, client_id, items, initial_items=()):
+    """POST payload of the invoice form"""
+    data = {
+        'client': client_id,
+        'invoice_number': invoice.invoice_number if invoice else '',
+        'issue_date': (invoice.issue_date if invoice else timezone.localdate()).isoformat(),
+        'due_date': (invoice.due_date if invoice else timezone.localdate() + timedelta(days=30)).isoformat(),
+        'currency': invoice.currency if invoice else 'HTG',
+        'tax_percent': '10',
+        'discount_percent': '0',
+        'status': invoice.status if invoice else 'draft',
+        'notes': '',
+        'line_items-TOTAL_FORMS': str(len(initial_items) + len(items)),
+        'line_items-INITIAL_FORMS': str(len(initial_items)),
+        'line_items-MIN_NUM_FORMS': '1',
+        'line_items-MAX_NUM_FORMS': '1000',
+    }
+    for index, row in enumerate(list(initial_items) + list(items)):
+        for key, value in row.items():
+            data[f'line_items-{index}-{key}'] = value
+    return data
+
+
+def _random_item(rng):
+    return {
+        'description': rng.choice(('Consulting', 'Delivery', 'Repair', 'Supplies')),
+        'quantity': str(rng.randint(1, 5)),
+        'unit_price': f'{rng.uniform(10, 5000):.2f}',
+    }
+
+
+def build_scenarios(user):
+    """The benchmark scenarios for ``user``, whose existing data they draw from"""
+    invoice_ids = list(Invoice.objects.filter(user=user).order_by('-created_at').values_list('pk', flat=True)[:1000])
+    client_ids = list(Client.objects.filter(user=user).values_list('pk', flat=True)[:1000])
+
+    def get(name, **kwargs):
+        return lambda rng: ('GET', reverse(name, **kwargs), None)
+
+    def detail(rng):
+        return 'GET', reverse('invoice_detail', args=[rng.choice(invoice_ids)]), None
+
+    def create(rng):
+        items = [_random_item(rng) for _ in range(rng.randint(1, 5))]
+        return 'POST', reverse('invoice_create'), invoice_form_data(None, rng.choice(client_ids), items)
+
+    def edit(rng):
+        invoice = Invoice.objects.get(pk=rng.choice(invoice_ids))
+        existing = [
+            {
+                'id': item.pk, 'invoice': invoice.pk, 'description': item.description,
+                'quantity': str(rng.randint(1, 5)), 'unit_price': str(item.unit_price),
+            }
+            for item in InvoiceItem.objects.filter(invoice=invoice).order_by('pk')
+        ]
+        data = invoice_form_data(invoice, invoice.client_id, [] if existing else [_random_item(rng)], existing)
+        return 'POST', reverse('invoice_update', args=[invoice.pk]), data
+
+    def pdf(rng):
+        return 'GET', reverse('invoice_pdf', args=[rng.choice(invoice_ids)]), None
+
+    def search(rng):
+        query = rng.choice(SEARCH_QUERIES)
+        return 'GET', f'{reverse("search")}?{urllib.parse.urlencode({"q": query})}', None
+
+    has_invoices = bool(invoice_ids)
+    return [
+        Scenario('invoice_list', get('invoice_list')),
+        Scenario('invoice_list_paid', lambda rng: ('GET', reverse('invoice_list') + '?status=paid', None)),
+        Scenario('invoice_dashboard', get('invoice_dashboard')),
+        Scenario('client_list', get('client_list')),
+        Scenario('invoice_detail', detail, has_invoices),
+        Scenario('invoice_create', create, bool(client_ids)),
+        Scenario('invoice_edit', edit, has_invoices),
+        Scenario('invoice_pdf', pdf, has_invoices and WEASYPRINT_INSTALLED),
+        Scenario('search', search),
+    ]
+
+
+def summarize(timings, queries=None, elapsed=None, errors=0):
+    """Latency percentiles in milliseconds, plus query counts and throughput when known"""
+    timings = sorted(timings)
+    stats = {'requests': len(timings), 'errors': errors}
+    if timings:
+        def percentile(q):
+            return round(timings[min(len(timings) - 1, math.ceil(q * len(timings)) - 1)] * 1000, 3)
+
+        stats.update({
+            'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(timings[-1] * 1000, 3),
+        })
+    if queries:
+        stats['queries_median'] = statistics.median(queries)
+        stats['queries_max'] = max(queries)
+    if elapsed:
+        stats['throughput_rps'] = round(len(timings) / elapsed, 2)
+    return stats
+
+
+def run_client_benchmark(user, scenarios, requests, seed=0):
+    """Run every scenario ``requests`` times through the test client; return stats per scenario"""
+    rng = random.Random(seed)
+    browser = TestClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    browser.force_login(user)
+
+    results = {}
+    for scenario in scenarios:
+        timings, queries, errors = [], [], 0
+        # One untimed request warms up templates, caches and connections
+        for index in range(requests + 1):
+            method, path, data = scenario.build(rng)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = browser.post(path, data) if method == 'POST' else browser.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                duration = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors += 1
+            elif index:
+                timings.append(duration)
+                queries.append(len(captured))
+        results[scenario.name] = summarize(timings, queries, errors=errors)
+    return results
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """Serve the project over HTTP from a background thread of this process"""
+
+    def __enter__(self):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        self.server.set_app(WSGIHandler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def session_cookies(user):
+    """Cookie header values logging ``user`` in: the session and a CSRF token"""
+    browser = TestClient()
+    browser.force_login(user)
+    return {
+        settings.SESSION_COOKIE_NAME: browser.cookies[settings.SESSION_COOKIE_NAME].value,
+        # Any well-formed token works as long as the header repeats it
+        settings.CSRF_COOKIE_NAME: get_random_string(CSRF_SECRET_LENGTH),
+    }
+
+
+def run_http_benchmark(base_url, user, scenarios, concurrency, duration, seed=0):
+    """
+    Replay each scenario from ``concurrency`` threads for ``duration`` seconds
+    over HTTP; return stats per scenario including throughput.
+    """
+    cookies = session_cookies(user)
+    cookie_header = '; '.join(f'{name}={value}' for name, value in cookies.items())
+    host = urllib.parse.urlsplit(base_url).hostname
+
+    results = {}
+    for scenario in scenarios:
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def worker(worker_seed):
+            rng = random.Random(worker_seed)
+            # No redirects: a created invoice answers 302, which is the measured response
+            opener = urllib.request.build_opener(NoRedirects)
+            local_timings, local_errors = [], 0
+            deadline = time.perf_counter() + duration
+            try:
+                while time.perf_counter() < deadline:
+                    method, path, data = scenario.build(rng)
+                    request = urllib.request.Request(
+                        base_url + path,
+                        data=urllib.parse.urlencode(data).encode() if data is not None else None,
+                        headers={
+                            'Cookie': cookie_header,
+                            'X-CSRFToken': cookies[settings.CSRF_COOKIE_NAME],
+                            'Referer': base_url + path,
+                            'Host': host,
+                        },
+                        method=method,
+                    )
+                    started = time.perf_counter()
+                    try:
+                        with opener.open(request) as response:
+                            response.read()
+                        local_timings.append(time.perf_counter() - started)
+                    except urllib.error.HTTPError as exc:
+                        if exc.code in (301, 302, 303):
+                            local_timings.append(time.perf_counter() - started)
+                        else:
+                            local_errors += 1
+                    except OSError:
+                        local_errors += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    timings.extend(local_timings)
+                    errors.append(local_errors)
+
+        threads = [
+            threading.Thread(target=worker, args=(seed * 1000 + index,))
+            for index in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[scenario.name] = summarize(timings, elapsed=time.perf_counter() - started, errors=sum(errors))
+    return results
+
+
+def dataset_counts(user):
+    return {
+        'clients': Client.objects.filter(user=user).count(),
+        'invoices': Invoice.objects.filter(user=user).count(),
+        'line_items': InvoiceItem.objects.filter(invoice__user=user).count(),
+    }
+
+
+def build_report(user, client_results=None, http_results=None, http_options=None):
+    """A JSON-serializable report of the results and what they were measured on"""
+    report = {
+        'version': REPORT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'cpus': os.cpu_count(),
+            'platform': platform.platform(),
+        },
+        'dataset': dataset_counts(user),
+    }
+    if client_results is not None:
+        report['client'] = client_results
+    if http_results is not None:
+        report['http'] = {**(http_options or {}), 'scenarios': http_results}
+    return report
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Return a message for every scenario whose latency percentiles grew by more
+    than ``threshold`` percent, or whose query count grew at all, since ``baseline``
+    """
+    regressions = []
+    sections = (
+        ('client', baseline.get('client', {}), current.get('client', {})),
+        ('http', baseline.get('http', {}).get('scenarios', {}), current.get('http', {}).get('scenarios', {})),
+    )
+    for section, before_scenarios, after_scenarios in sections:
+        for name, after in after_scenarios.items():
+            before = before_scenarios.get(name)
+            if not before:
+                continue
+            for key in COMPARED_PERCENTILES:
+                if before.get(key) and after.get(key):
+                    change = (after[key] - before[key]) / before[key] * 100
+                    if change > threshold:
+                        regressions.append(
+                            f'{section} {name}: {key} {before[key]:.2f} -> {after[key]:.2f} ({change:+.1f}%)'
+                        )
+            if after.get('queries_max', 0) > before.get('queries_max', math.inf):
+                regressions.append(
+                    f'{section} {name}: queries {before["queries_max"]} -> {after["queries_max"]}'
+                )
+    return regressions
@@ -0,0 +1,119 @@
+"""
+Status changes and deletions of many invoices at once.
+
+``bulk_change_status`` and ``bulk_delete`` work through the requested ids in
+batches. Each batch locks the user's matching invoices, then changes them
+with one set-based UPDATE, or deletes them with ``QuerySet.delete()``, which
+removes the dependent rows (line items, PDF jobs, search documents) with one
+DELETE per table and honours every relation's ``on_delete``. The UPDATE
+bypasses the per-invoice signals and the summary and cache receivers are
+muted during the DELETE, so every batch moves its counts and amounts in the
+summary table and bumps the owner's cache version itself, in the same
+transaction.
+
+Both return ``{id: outcome}`` for every requested id.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_user_cache_version
+from .models import Invoice
+from .signals import batched_invoice_deletes
+from .summary import apply_summary_delta
+
+
+BATCH_SIZE = 500
+# Ids accepted by one request
+MAX_IDS = 5000
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+# Ids that are not invoice ids at all
+INVALID = 'invalid'
+
+
+def _batches(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _locked_rows(user, ids):
+    """``(pk, status, currency, total)`` of the user's invoices among ``ids``, locked"""
+    return list(
+        Invoice.objects
+        .filter(user=user, pk__in=ids)
+        .select_for_update()
+        .order_by('pk')
+        .values_list('pk', 'status', 'currency', 'total')
+    )
+
+
+def _apply_moves(user_id, moves):
+    """Apply ``{(status, currency): (count, amount)}`` summary deltas"""
+    for (status, currency), (count, amount) in moves.items():
+        apply_summary_delta(user_id, status, currency, count, amount)
+
+
+def _add(moves, key, count, amount):
+    current_count, current_amount = moves.get(key, (0, Decimal('0')))
+    moves[key] = (current_count + count, current_amount + amount)
+
+
+def bulk_change_status(user, ids, status, batch_size=BATCH_SIZE):
+    """Set the status of the user's invoices among ``ids``; return ``{id: outcome}``"""
+    if status not in dict(Invoice.STATUS_CHOICES):
+        raise ValueError(f'Unknown status: {status}')
+    ids = list(dict.fromkeys(ids))
+    outcomes = dict.fromkeys(ids, NOT_FOUND)
+
+    for batch in _batches(ids, batch_size):
+        with transaction.atomic():
+            rows = _locked_rows(user, batch)
+            changed = [row for row in rows if row[1] != status]
+            outcomes.update((row[0], UNCHANGED) for row in rows)
+            if not changed:
+                continue
+
+            Invoice.objects.filter(pk__in=[row[0] for row in changed]).update(
+                status=status,
+                updated_at=timezone.now(),
+            )
+            moves = {}
+            for _pk, previous, currency, total in changed:
+                _add(moves, (previous, currency), -1, -total)
+                _add(moves, (status, currency), 1, total)
+            _apply_moves(user.pk, moves)
+            bump_user_cache_version(user.pk)
+            outcomes.update((row[0], UPDATED) for row in changed)
+    return outcomes
+
+
+def bulk_delete(user, ids, batch_size=BATCH_SIZE):
+    """Delete the user's invoices among ``ids`` with their line items; return ``{id: outcome}``"""
+    ids = list(dict.fromkeys(ids))
+    outcomes = dict.fromkeys(ids, NOT_FOUND)
+
+    for batch in _batches(ids, batch_size):
+        with transaction.atomic():
+            rows = _locked_rows(user, batch)
+            if not rows:
+                continue
+            found = [row[0] for row in rows]
+
+            # The dependent models have no delete signals, so each of them is
+            # cleared with a single DELETE ... WHERE invoice_id IN (...); the
+            # summary and cache are updated for the whole batch below
+            with batched_invoice_deletes():
+                Invoice.objects.filter(pk__in=found).delete()
+
+            moves = {}
+            for _pk, status, currency, total in rows:
+                _add(moves, (status, currency), -1, -total)
+            _apply_moves(user.pk, moves)
+            bump_user_cache_version(user.pk)
+            outcomes.update((pk, DELETED) for pk in found)
+    return outcomes
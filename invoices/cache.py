@@ -0,0 +1,124 @@
+"""
+Per-user caching of page data and template fragments.
+
+Every cache key embeds a per-user version number. Any write to one of the
+user's invoices, line items or clients bumps that version (see signals.py
+and the bulk code paths), so entries cached before the write are never read
+again and simply expire. Only ``get``/``set``/``add``/``incr`` are used, so
+any Django cache backend works: local memory, file based, Memcached or Redis.
+With several worker processes the cache must be shared by all of them, or a
+bump in one process never reaches the others (see checks.py); with
+``PAGE_CACHE_TIMEOUT = 0`` nothing is cached.
+
+Hits and misses are counted per cache name; ``cache_stats()`` and the
+``cache_stats`` management command report the hit rates.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from core.db_routers import record_write
+
+
+# Names of everything cached through cached_for_user, for the hit-rate report
+CACHE_NAMES = ('invoice-stats', 'client-list', 'invoice-dashboard-recent')
+
+
+def get_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'fakti:user-version:{user_id}'
+
+
+def get_user_cache_version(user_id):
+    """Return the current cache version of a user"""
+    cache = get_cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from a clock value rather than 1 so a version evicted from the
+        # cache never comes back and revives entries written under it
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _incr_version(user_id):
+    # Pages rebuilt from here on must not come from a lagging read replica
+    record_write(user_id)
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # No version stored yet: nothing cached under the old one can be read
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def bump_user_cache_version(user_id):
+    """
+    Invalidate everything cached for a user.
+
+    The version is bumped right away and again once the current transaction
+    commits, so a page rendered from the old data by a concurrent request
+    before the commit cannot stay cached under the new version.
+    """
+    _incr_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr_version(user_id))
+
+
+def bump_cache_versions(user_ids):
+    for user_id in set(user_ids):
+        bump_user_cache_version(user_id)
+
+
+def _count(name, outcome):
+    cache = get_cache()
+    key = f'fakti:cache-stats:{name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cached_for_user(user_id, name, compute, *key_parts, timeout=None):
+    """
+    Return ``compute()`` cached under ``name`` for the user's current version.
+
+    ``key_parts`` distinguish variants of the same data, e.g. a page cursor.
+    """
+    timeout = settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+    if not timeout:
+        return compute()
+
+    cache = get_cache()
+    parts = ':'.join(str(part) for part in key_parts)
+    key = f'fakti:{name}:{user_id}:{get_user_cache_version(user_id)}:{parts}'
+
+    value = cache.get(key)
+    if value is not None:
+        _count(name, 'hits')
+        return value
+
+    _count(name, 'misses')
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+def cache_stats():
+    """Return ``{name: (hits, misses, hit_rate)}`` for every cache name"""
+    keys = [f'fakti:cache-stats:{name}:{outcome}' for name in CACHE_NAMES for outcome in ('hits', 'misses')]
+    counts = get_cache().get_many(keys)
+    stats = {}
+    for name in CACHE_NAMES:
+        hits = counts.get(f'fakti:cache-stats:{name}:hits', 0)
+        misses = counts.get(f'fakti:cache-stats:{name}:misses', 0)
+        total = hits + misses
+        stats[name] = (hits, misses, hits / total if total else None)
+    return stats
@@ -0,0 +1,22 @@
+"""
+System checks for settings the invoice pages depend on.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_page_cache(app_configs, **kwargs):
+    """The page cache must be shared by every worker process to be invalidated in all of them"""
+    backend = settings.CACHES[settings.PAGE_CACHE_ALIAS]['BACKEND']
+    if settings.PAGE_CACHE_TIMEOUT and backend in settings.PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f'The page cache uses {backend}, which is not shared between processes.',
+            hint=(
+                'Other worker processes would keep serving pages cached before a write. '
+                'Set CACHE_BACKEND to a shared cache (Redis, Memcached, file based) or '
+                'PAGE_CACHE_TIMEOUT=0.'
+            ),
+            id='invoices.E001',
+        )]
+    return []
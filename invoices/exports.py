@@ -0,0 +1,160 @@
+"""
+Streaming CSV exports of a user's invoices, line items and clients; the
+Excel exports in xlsx.py write the same rows.
+
+Rows are read with ``values_list().iterator()`` so only one chunk of rows is
+in memory at a time, and encoded by a generator-based CSV writer so the
+response starts with the header row before the first query has finished.
+
+Spreadsheets run cells starting with ``=``, ``+``, ``-`` or ``@`` as
+formulas, so text cells starting with one of them (after any quotes) get a
+leading ``'``, which spreadsheets hide; the CSV import removes it again.
+"""
+import csv
+import re
+
+from django.db.models import Q
+
+from .models import Client, Invoice, InvoiceItem
+
+
+CHUNK_SIZE = 2000
+# Rows encoded per chunk of the response
+ROWS_PER_WRITE = 500
+# Text a spreadsheet would read as a formula, also once a leading ' is removed
+FORMULA_PREFIX = re.compile(r"'*[=+\-@\t\r]")
+
+
+class Echo:
+    """File-like object whose write() returns the value instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+INVOICE_COLUMNS = (
+    ('invoice_number', 'invoice_number'),
+    ('client', 'client__name'),
+    ('issue_date', 'issue_date'),
+    ('due_date', 'due_date'),
+    ('status', 'status'),
+    ('currency', 'currency'),
+    ('subtotal', 'subtotal'),
+    ('tax_percent', 'tax_percent'),
+    ('tax_amount', 'tax_amount'),
+    ('discount_percent', 'discount_percent'),
+    ('discount_amount', 'discount_amount'),
+    ('total', 'total'),
+    ('notes', 'notes'),
+)
+
+LINE_ITEM_COLUMNS = (
+    ('invoice_number', 'invoice__invoice_number'),
+    ('client', 'invoice__client__name'),
+    ('issue_date', 'invoice__issue_date'),
+    ('status', 'invoice__status'),
+    ('currency', 'invoice__currency'),
+    ('description', 'description'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('line_total', 'line_total'),
+)
+
+CLIENT_COLUMNS = (
+    ('name', 'name'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('address', 'address'),
+    ('city', 'city'),
+    ('country', 'country'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+)
+
+
+def invoice_filter(user, client=None, date_from=None, date_to=None, status=None, prefix=''):
+    """
+    The export filters of InvoiceExportForm as a Q object on the invoices of
+    ``user``, or on the invoices reached through ``prefix`` (e.g.
+    ``'invoice__'`` for line items). The CSV and PDF exports share it.
+    """
+    conditions = Q(**{f'{prefix}user': user})
+    if client:
+        conditions &= Q(**{f'{prefix}client': client})
+    if date_from:
+        conditions &= Q(**{f'{prefix}issue_date__gte': date_from})
+    if date_to:
+        conditions &= Q(**{f'{prefix}issue_date__lte': date_to})
+    if status:
+        conditions &= Q(**{f'{prefix}status': status})
+    return conditions
+
+
+def _invoice_rows(user, **filters):
+    invoices = Invoice.objects.filter(invoice_filter(user, **filters))
+    return invoices.order_by('issue_date', 'id'), INVOICE_COLUMNS
+
+
+def _line_item_rows(user, **filters):
+    items = InvoiceItem.objects.filter(invoice_filter(user, prefix='invoice__', **filters))
+    return items.order_by('invoice__issue_date', 'invoice_id', 'id'), LINE_ITEM_COLUMNS
+
+
+def _client_rows(user, client=None, date_from=None, date_to=None, status=None):
+    # Clients have no status; the dates filter on when the client was added
+    clients = Client.objects.filter(user=user)
+    if client:
+        clients = clients.filter(pk=client.pk)
+    if date_from:
+        clients = clients.filter(created_at__date__gte=date_from)
+    if date_to:
+        clients = clients.filter(created_at__date__lte=date_to)
+    return clients.order_by('created_at', 'id'), CLIENT_COLUMNS
+
+
+DATASETS = {
+    'invoices': _invoice_rows,
+    'line-items': _line_item_rows,
+    'clients': _client_rows,
+}
+
+
+def escape_formula(value):
+    """``value`` with a leading ``'`` if a spreadsheet would run it as a formula"""
+    if isinstance(value, str) and FORMULA_PREFIX.match(value):
+        return f"'{value}"
+    return value
+
+
+def unescape_formula(value):
+    """Undo ``escape_formula`` on a cell read back from an export"""
+    if value.startswith("'") and FORMULA_PREFIX.match(value):
+        return value[1:]
+    return value
+
+
+def stream_csv(header, rows):
+    """Yield CSV text for ``header`` followed by ``rows``, a few hundred rows per chunk"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow([escape_formula(value) for value in row]))
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def export_rows(dataset, user, **filters):
+    """The header and a lazy iterator over the rows of ``dataset`` for ``user``"""
+    queryset, columns = DATASETS[dataset](user, **filters)
+    rows = queryset.values_list(*(field for _header, field in columns)).iterator(chunk_size=CHUNK_SIZE)
+    return [header for header, _field in columns], rows
+
+
+def stream_export(dataset, user, **filters):
+    """Yield the CSV export of ``dataset`` ('invoices', 'line-items' or 'clients') for ``user``"""
+    return stream_csv(*export_rows(dataset, user, **filters))
@@ -1,9 +1,26 @@
+from decimal import Decimal
+
 from django import forms
+from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.forms import inlineformset_factory
+from django.db import transaction
+from django.forms import BaseInlineFormSet, inlineformset_factory
 
 from .models import Client, Invoice, InvoiceItem
+from .numbering import next_invoice_number
+
+
+# Primary keys are signed 64-bit integers in every supported database
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(value):
+    """``value`` as a primary key, or None if it cannot be one"""
+    try:
+        return forms.IntegerField(min_value=1, max_value=MAX_ID).clean(value)
+    except forms.ValidationError:
+        return None
 
 
 class ClientForm(forms.ModelForm):
@@ -18,6 +35,27 @@ class ClientForm(forms.ModelForm):
         }
 
 
+class ClientAutocompleteWidget(forms.Widget):
+    """Text box that looks the user's clients up by name as they type
+    
+    Only the chosen client's id is submitted, in a hidden input, and the
+    field's queryset validates it like a select would. No options are
+    rendered: the only query is the chosen client's name.
+    """
+    template_name = 'invoices/widgets/client_autocomplete.html'
+    url = reverse_lazy('client_autocomplete')
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = ''
+        pk = parse_id(value) if value not in (None, '') else None
+        if pk is not None:
+            # choices is the field's ModelChoiceIterator, already scoped to the user
+            label = self.choices.queryset.filter(pk=pk).values_list('name', flat=True).first() or ''
+        context['widget'].update({'label': label, 'url': self.url})
+        return context
+
+
 class InvoiceForm(forms.ModelForm):
     """Form for creating and updating invoices"""
     
@@ -39,6 +77,7 @@ class InvoiceForm(forms.ModelForm):
             'tax_percent', 'discount_percent', 'notes', 'status'
         ]
         widgets = {
+            'client': ClientAutocompleteWidget,
             'notes': forms.Textarea(attrs={'rows': 3}),
         }
     
@@ -50,17 +89,42 @@ class InvoiceForm(forms.ModelForm):
         if self.user:
             self.fields['client'].queryset = Client.objects.filter(user=self.user)
             
-            # Generate next invoice number
+            # Preview the next invoice number; the actual number is allocated at save time
             if not self.instance.pk:  # Only for new invoices
-                year = timezone.now().year
-                # Count invoices for this user this year and add 1
-                count = Invoice.objects.filter(
-                    user=self.user, 
-                    created_at__year=year
-                ).count() + 1
-                
-                # Format: INV-YYYY-00001
-                self.fields['invoice_number'].initial = f"INV-{year}-{count:05d}"
+                self.fields['invoice_number'].required = False
+                self.fields['invoice_number'].initial = next_invoice_number(self.user)
+                # Submit the previewed number too, so keeping it can be told
+                # apart from typing a number of the series by hand
+                self.fields['invoice_number'].show_hidden_initial = True
+                self.fields['invoice_number'].help_text = _(
+                    "Keep the suggested number to get the next free number when saving."
+                )
+    
+    def clean_invoice_number(self):
+        invoice_number = self.cleaned_data.get('invoice_number', '').strip()
+        if not self.user:
+            return invoice_number
+        
+        if not self.instance.pk and self._keeps_suggested_number(invoice_number):
+            # The number is allocated atomically by Invoice.save(); a number
+            # typed by hand is kept and Invoice.save() reserves it
+            return ''
+        
+        duplicates = Invoice.objects.filter(user=self.user, invoice_number=invoice_number)
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise forms.ValidationError(_("You already have an invoice with this number."))
+        return invoice_number
+    
+    def _keeps_suggested_number(self, invoice_number):
+        """Whether the number was left blank or as the previewed suggestion"""
+        if not invoice_number:
+            return True
+        suggestions = {self.fields['invoice_number'].initial}
+        if 'invoice_number' not in self.changed_data:
+            suggestions.add(invoice_number)
+        return invoice_number in suggestions
 
 
 class InvoiceItemForm(forms.ModelForm):
@@ -76,13 +140,118 @@ class InvoiceItemForm(forms.ModelForm):
         }
 
 
+class BaseInvoiceItemFormSet(BaseInlineFormSet):
+    """Inline formset that saves line items with bulk queries"""
+    
+    def save_with_invoice(self, invoice):
+        """
+        Save ``invoice`` and its line items in one transaction.
+        
+        Totals are computed from the items in memory, the invoice row is
+        written exactly once, and line items are inserted, updated and
+        deleted with one bulk query each instead of one save() per item.
+        """
+        new_items, changed_items, deleted_items, kept_items = [], [], [], []
+        
+        for form in self.forms:
+            item = form.instance
+            if self.can_delete and self._should_delete_form(form):
+                if item.pk is not None:
+                    deleted_items.append(item)
+                continue
+            if item.pk is None:
+                if not form.has_changed():
+                    continue
+                new_items.append(item)
+            elif form.has_changed():
+                changed_items.append(item)
+            item.line_total = (item.quantity * item.unit_price).quantize(Decimal('0.01'))
+            kept_items.append(item)
+        
+        with transaction.atomic():
+            invoice.calculate_totals(kept_items)
+            invoice.save(update_totals=False)
+            
+            for item in new_items:
+                item.invoice = invoice
+            InvoiceItem.objects.bulk_create(new_items, batch_size=500)
+            InvoiceItem.objects.bulk_update(
+                changed_items,
+                ['description', 'quantity', 'unit_price', 'line_total'],
+                batch_size=500,
+            )
+            if deleted_items:
+                InvoiceItem.objects.filter(
+                    invoice=invoice,
+                    pk__in=[item.pk for item in deleted_items]
+                ).delete()
+        
+        return invoice
+
+
 # Create a formset for invoice items
 InvoiceItemFormSet = inlineformset_factory(
     Invoice,
     InvoiceItem,
     form=InvoiceItemForm,
+    formset=BaseInvoiceItemFormSet,
     extra=1,
     min_num=1,
     validate_min=True,
     can_delete=True
-)
\ No newline at end of file
+)
+
+class InvoiceExportForm(forms.Form):
+    """Filters for bulk invoice exports"""
+    
+    client = forms.ModelChoiceField(label=_("Client"), queryset=Client.objects.none(), required=False)
+    date_from = forms.DateField(
+        label=_("From"),
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    date_to = forms.DateField(
+        label=_("To"),
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    status = forms.ChoiceField(
+        label=_("Status"),
+        choices=[('', _('All'))] + list(Invoice.STATUS_CHOICES),
+        required=False
+    )
+    
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user')
+        super().__init__(*args, **kwargs)
+        self.fields['client'].queryset = Client.objects.filter(user=self.user)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError(_("The start date must be before the end date."))
+        return cleaned_data
+
+
+class InvoiceImportForm(forms.ModelForm):
+    """Validates the invoice columns of one imported CSV row; client and number are resolved by the importer"""
+    
+    class Meta:
+        model = Invoice
+        fields = [
+            'issue_date', 'due_date', 'currency', 'tax_percent', 'discount_percent', 'notes', 'status'
+        ]
+
+
+class CsvImportForm(forms.Form):
+    """Upload form for bulk CSV imports"""
+    
+    DATASET_CHOICES = (
+        ('clients', _('Clients')),
+        ('invoices', _('Invoices')),
+    )
+    
+    dataset = forms.ChoiceField(label=_("Import"), choices=DATASET_CHOICES)
+    file = forms.FileField(label=_("CSV file"))
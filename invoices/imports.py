@@ -0,0 +1,327 @@
+"""
+Bulk CSV import of clients and invoices.
+
+Rows are parsed one at a time with ``csv.DictReader`` and validated with the
+fields of the forms the web pages use plus the model field checks. Valid rows
+are written with ``bulk_create`` in chunks inside one transaction, and every
+rejected row is reported with its line number instead of aborting the import.
+
+Client CSVs have the columns of ClientForm (``name`` is required).
+
+Invoice CSVs have one row per line item: ``client`` (a client name),
+``description``, ``quantity`` and ``unit_price``, plus the invoice columns
+``invoice_number``, ``issue_date``, ``due_date``, ``status``, ``currency``,
+``tax_percent``, ``discount_percent`` and ``notes`` taken from the first
+row of each invoice. Consecutive rows with the same ``invoice_number`` form
+one invoice; rows without a number each become a one-line invoice with the
+next automatic number. Numbers given in the file are imported as they are,
+and numbers of the automatic series move its sequence past them. The line
+items export can be imported back as is.
+"""
+import csv
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .cache import bump_user_cache_version
+from .exports import unescape_formula
+from .forms import ClientForm, InvoiceImportForm, InvoiceItemForm
+from .models import Client, Invoice, InvoiceItem
+from .numbering import allocate_invoice_numbers, reserve_invoice_numbers
+from .search import index_clients, index_invoices
+from .summary import apply_summary_delta
+from .totals import expected_totals
+
+
+CHUNK_SIZE = 2000
+MAX_AMOUNT = Decimal('99999999.99')
+
+CLIENT_FIELDS = ('name', 'email', 'phone', 'address', 'city', 'country', 'notes')
+INVOICE_FIELDS = ('issue_date', 'due_date', 'currency', 'tax_percent', 'discount_percent', 'notes', 'status')
+ITEM_FIELDS = ('description', 'quantity', 'unit_price')
+
+
+class RowValidator:
+    """
+    Validates CSV rows with the fields of a ModelForm and the model's own field checks.
+
+    Building a form deep-copies all of its fields, which dominates the cost of
+    a large import, so the fields of one form instance are reused for every row.
+    """
+
+    def __init__(self, form_class):
+        form = form_class()
+        self.fields = form.fields
+        self.model = form._meta.model
+        self.exclude = [field.name for field in self.model._meta.fields if field.name not in self.fields]
+
+    def validate(self, data):
+        """Return ``(instance, errors)``; ``instance`` is an unsaved model built from the row"""
+        cleaned = {}
+        errors = {}
+        for name, field in self.fields.items():
+            try:
+                cleaned[name] = field.clean(data.get(name))
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        if errors:
+            return None, errors
+
+        instance = self.model(**cleaned)
+        try:
+            instance.full_clean(exclude=self.exclude, validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            return None, exc.message_dict
+        return instance, {}
+
+
+class ImportResult:
+    """Number of created objects and the ``(line, message)`` errors of rejected rows"""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    def add_field_errors(self, line, errors):
+        for field, messages in errors.items():
+            label = field if field != '__all__' else _('row')
+            self.add_error(line, f'{label}: {" ".join(messages)}')
+
+
+def _read_rows(reader):
+    """The rows of ``reader`` without the ``'`` the exports put before formula-like text"""
+    for row in reader:
+        yield {
+            column: unescape_formula(value) if isinstance(value, str) else value
+            for column, value in row.items()
+        }
+
+
+def _row_data(row, fields, defaults=None):
+    """Form data from a CSV row, with blank cells replaced by ``defaults``"""
+    data = dict(defaults or {})
+    for field in fields:
+        value = (row.get(field) or '').strip()
+        if value:
+            data[field] = value
+    return data
+
+
+def _check_columns(reader, required, result):
+    missing = [column for column in required if column not in (reader.fieldnames or ())]
+    if missing:
+        result.add_error(1, _('Missing columns: %s') % ', '.join(missing))
+    return not missing
+
+
+def import_clients(user, lines, chunk_size=CHUNK_SIZE):
+    """Import clients for ``user`` from an iterable of CSV lines"""
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    if not _check_columns(reader, ('name',), result):
+        return result
+
+    validator = RowValidator(ClientForm)
+    pending, created_ids = [], []
+    with transaction.atomic():
+        for row in _read_rows(reader):
+            client, errors = validator.validate(_row_data(row, CLIENT_FIELDS, {'country': 'Haiti'}))
+            if errors:
+                result.add_field_errors(reader.line_num, errors)
+                continue
+
+            client.user = user
+            pending.append(client)
+            if len(pending) >= chunk_size:
+                Client.objects.bulk_create(pending)
+                result.created += len(pending)
+                created_ids.extend(client.pk for client in pending)
+                pending = []
+
+        Client.objects.bulk_create(pending)
+        result.created += len(pending)
+        created_ids.extend(client.pk for client in pending)
+        # bulk_create bypasses the signals that invalidate the user's cached
+        # pages and keep the search documents in sync
+        bump_user_cache_version(user.pk)
+        index_clients(created_ids, replace=False)
+    return result
+
+
+def _group_rows(reader):
+    """Yield lists of ``(line, row)`` that make up one invoice each"""
+    group = []
+    for row in _read_rows(reader):
+        number = (row.get('invoice_number') or '').strip()
+        if group and not (number and number == group[0][1]):
+            yield [(line, row) for line, _number, row in group]
+            group = []
+        group.append((reader.line_num, number, row))
+    if group:
+        yield [(line, row) for line, _number, row in group]
+
+
+class InvoiceImporter:
+    """Validates grouped invoice rows and writes them in chunks"""
+
+    def __init__(self, user, result, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.result = result
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.pending_items = 0
+        self.summary_deltas = {}
+        self.created_ids = []
+        self.invoice_validator = RowValidator(InvoiceImportForm)
+        self.item_validator = RowValidator(InvoiceItemForm)
+
+        clients = {}
+        for pk, name in Client.objects.filter(user=user).values_list('pk', 'name'):
+            key = name.strip().casefold()
+            # Clients sharing a name cannot be told apart by the CSV
+            clients[key] = None if key in clients else pk
+        self.clients = clients
+        self.numbers = set(Invoice.objects.filter(user=user).values_list('invoice_number', flat=True))
+
+    def add(self, group):
+        invoice = self.build_invoice(group)
+        if invoice is not None:
+            self.pending.append(invoice)
+            self.pending_items += len(invoice.imported_items)
+            if self.pending_items >= self.chunk_size:
+                self.flush()
+
+    def resolve_number(self, line, number):
+        if len(number) > Invoice._meta.get_field('invoice_number').max_length:
+            self.result.add_error(line, _('invoice_number: Ensure this value has at most 50 characters.'))
+            return None
+        if number in self.numbers:
+            self.result.add_error(line, _('invoice_number: You already have an invoice with this number.'))
+            return None
+        return number
+
+    def build_invoice(self, group):
+        """Return an unsaved invoice with its ``imported_items``, or None if any row is invalid"""
+        first_line, first = group[0]
+        errors_before = len(self.result.errors)
+
+        today = timezone.localdate()
+        data = _row_data(first, INVOICE_FIELDS, {
+            'issue_date': today, 'status': 'draft', 'currency': 'HTG',
+            'tax_percent': '0', 'discount_percent': '0',
+        })
+        if 'due_date' not in data:
+            # Same default as InvoiceForm: 30 days after the issue date
+            try:
+                issue_date = self.invoice_validator.fields['issue_date'].clean(data['issue_date'])
+            except ValidationError:
+                issue_date = today
+            data['due_date'] = issue_date + timedelta(days=30)
+        invoice, errors = self.invoice_validator.validate(data)
+        self.result.add_field_errors(first_line, errors)
+
+        client_id = self.clients.get((first.get('client') or '').strip().casefold())
+        if client_id is None:
+            self.result.add_error(first_line, _('client: Unknown or ambiguous client "%s".') % first.get('client', ''))
+
+        number = self.resolve_number(first_line, (first.get('invoice_number') or '').strip())
+
+        items = []
+        for line, row in group:
+            item, errors = self.item_validator.validate(_row_data(row, ITEM_FIELDS, {'quantity': '1'}))
+            if errors:
+                self.result.add_field_errors(line, errors)
+                continue
+            item.line_total = (item.quantity * item.unit_price).quantize(Decimal('0.01'))
+            items.append(item)
+
+        if len(self.result.errors) > errors_before:
+            return None
+
+        invoice.user = self.user
+        invoice.client_id = client_id
+        invoice.invoice_number = number
+        # Totals in a single pass over the rows, rounded as the columns store them
+        totals = expected_totals(
+            sum((item.line_total for item in items), Decimal('0')),
+            invoice.tax_percent,
+            invoice.discount_percent,
+        )
+        if any(abs(value) > MAX_AMOUNT for value in totals.values()):
+            self.result.add_error(first_line, _('total: The invoice total is too large.'))
+            return None
+        for field, value in totals.items():
+            setattr(invoice, field, value)
+
+        invoice.imported_items = items
+        if number:
+            self.numbers.add(number)
+        return invoice
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        # bulk_create skips Invoice.save(), so numbers of the automatic series
+        # from the file are reserved here, before any are allocated
+        reserve_invoice_numbers(self.user.pk, [invoice.invoice_number for invoice in self.pending])
+        unnumbered = [invoice for invoice in self.pending if not invoice.invoice_number]
+        if unnumbered:
+            numbers = allocate_invoice_numbers(self.user.pk, len(unnumbered))
+            for invoice, number in zip(unnumbered, numbers):
+                invoice.invoice_number = number
+            # Later rows cannot reuse them
+            self.numbers.update(numbers)
+
+        Invoice.objects.bulk_create(self.pending, batch_size=500)
+        items = []
+        for invoice in self.pending:
+            key = (invoice.status, invoice.currency)
+            count, amount = self.summary_deltas.get(key, (0, Decimal('0')))
+            self.summary_deltas[key] = (count + 1, amount + invoice.total)
+            for item in invoice.imported_items:
+                item.invoice = invoice
+                items.append(item)
+        InvoiceItem.objects.bulk_create(items, batch_size=500)
+        self.created_ids.extend(invoice.pk for invoice in self.pending)
+
+        self.result.created += len(self.pending)
+        self.pending = []
+        self.pending_items = 0
+
+    def finish(self):
+        self.flush()
+        # bulk_create bypasses the signals that keep the summary, caches and
+        # search documents in sync
+        for (status, currency), (count, amount) in self.summary_deltas.items():
+            apply_summary_delta(self.user.pk, status, currency, count, amount)
+        bump_user_cache_version(self.user.pk)
+        index_invoices(self.created_ids, replace=False)
+
+
+def import_invoices(user, lines, chunk_size=CHUNK_SIZE):
+    """Import invoices and their line items for ``user`` from an iterable of CSV lines"""
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    if not _check_columns(reader, ('client', 'description', 'unit_price'), result):
+        return result
+
+    with transaction.atomic():
+        importer = InvoiceImporter(user, result, chunk_size)
+        for group in _group_rows(reader):
+            importer.add(group)
+        importer.finish()
+    return result
+
+
+IMPORTERS = {
+    'clients': import_clients,
+    'invoices': import_invoices,
+}
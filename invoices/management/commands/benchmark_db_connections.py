@@ -0,0 +1,125 @@
+import statistics
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a page through the WSGI handler with a new database connection per request '
+        'and with the configured connection reuse (persistent connections or pool)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to log in as (default: the owner of the latest invoice)')
+        parser.add_argument('--url', default=reverse('invoice_dashboard'), help='Path to request')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent worker threads')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            user = users.filter(username=options['user']).first()
+        else:
+            user = users.order_by('-invoices__id').first()
+        if user is None:
+            raise CommandError('No user to log in as')
+
+        # A real session cookie, so the session and user lookups are measured too
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        database = settings.DATABASES['default']
+        configured = (database['CONN_MAX_AGE'], database.get('OPTIONS', {}))
+        pooled = bool(configured[1].get('pool'))
+        reused = configured if pooled or configured[0] != 0 else (600, configured[1])
+        options_without_pool = {key: value for key, value in configured[1].items() if key != 'pool'}
+
+        modes = (
+            ('connect per request', (0, options_without_pool)),
+            ('pool' if pooled else 'persistent', reused),
+        )
+        results = {}
+        try:
+            for label, (max_age, db_options) in modes:
+                database['CONN_MAX_AGE'] = max_age
+                database['OPTIONS'] = db_options
+                results[label] = self.run(options['url'], cookie, options['requests'], options['threads'])
+        finally:
+            database['CONN_MAX_AGE'], database['OPTIONS'] = configured
+
+        for label, (timings, opened, elapsed) in results.items():
+            self.stdout.write(
+                f'{label:<20} median={statistics.median(timings):.2f}ms '
+                f'p95={statistics.quantiles(timings, n=20)[-1]:.2f}ms '
+                f'{len(timings) / elapsed:.0f} req/s, {opened} connections opened'
+            )
+
+        (before, _b, _e), (after, _a, _f) = results.values()
+        before, after = statistics.median(before), statistics.median(after)
+        self.stdout.write(self.style.SUCCESS(
+            f'Median latency {before:.2f}ms -> {after:.2f}ms ({before / after:.2f}x)'
+        ))
+
+    def run(self, path, cookie, total, threads):
+        """Send ``total`` GET requests from ``threads`` threads; return (timings in ms, connections opened, seconds)"""
+        handler = WSGIHandler()
+        opened = []
+        timings = []
+        errors = []
+        lock = threading.Lock()
+
+        def count_connection(sender, connection, **kwargs):
+            with lock:
+                opened.append(connection.alias)
+
+        def start_response(status, headers, exc_info=None):
+            if not status.startswith('200'):
+                raise RuntimeError(f'{path} answered {status}')
+
+        def worker(count):
+            # Like a threaded WSGI server, each thread keeps its own connection between requests
+            local = []
+            try:
+                for _ in range(count):
+                    environ = {'PATH_INFO': path, 'HTTP_COOKIE': cookie}
+                    setup_testing_defaults(environ)
+                    started = time.perf_counter()
+                    response = handler(environ, start_response)
+                    b''.join(response)
+                    response.close()
+                    local.append((time.perf_counter() - started) * 1000)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+                with lock:
+                    timings.extend(local)
+
+        connection_created.connect(count_connection)
+        try:
+            workers = [
+                threading.Thread(target=worker, args=(total // threads + (index < total % threads),))
+                for index in range(threads)
+            ]
+            started = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connection)
+        if errors:
+            raise CommandError(errors[0])
+        return timings, len(opened), elapsed
@@ -0,0 +1,146 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from invoices.models import Client, Invoice
+from invoices.seeding import bulk_create_backdated
+from invoices.stats import _aggregate_rows
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded benchmark data and dropped indexes"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed invoices and report EXPLAIN plans and timings of the hot invoice queries '
+        'with and without the composite indexes. Everything is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1_000_000, help='Number of invoices to seed')
+        parser.add_argument('--users', type=int, default=100, help='Number of owners to spread invoices over')
+        parser.add_argument('--iterations', type=int, default=10, help='Number of timed runs per query')
+        parser.add_argument('--no-explain', action='store_true', help='Only print timings')
+
+    def handle(self, *args, **options):
+        self.iterations = options['iterations']
+        self.explain = not options['no_explain']
+        self.stdout.write(f'Database vendor: {connection.vendor}')
+
+        try:
+            with transaction.atomic():
+                user, client = self.seed(options['invoices'], options['users'])
+                queries = self.hot_queries(user, client)
+
+                self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+                with_indexes = self.run(queries)
+
+                self.drop_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+                without_indexes = self.run(queries)
+
+                self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+                for label in queries:
+                    self.stdout.write(
+                        f'{label:<24} before={without_indexes[label]:9.2f} after={with_indexes[label]:9.2f}'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count, users):
+        """Spread ``count`` invoices over ``users`` owners; the first owner gets the largest share"""
+        User = get_user_model()
+        prefix = f'benchmark-{time.time_ns()}'
+        owners = User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(users)])
+        clients = Client.objects.bulk_create([
+            Client(user=owner, name=f'Client {i}')
+            for owner in owners
+            for i in range(10)
+        ])
+        clients_by_owner = {}
+        for client in clients:
+            clients_by_owner.setdefault(client.user_id, []).append(client)
+
+        statuses = [status for status, _label in Invoice.STATUS_CHOICES]
+        currencies = [currency for currency, _label in Invoice.CURRENCY_CHOICES]
+        weights = [len(owners)] + [1] * (len(owners) - 1)
+        start = date.today() - timedelta(days=3 * 365)
+        now = timezone.now()
+
+        def batch(size, offset):
+            for i in range(offset, offset + size):
+                owner = random.choices(owners, weights)[0]
+                issued = start + timedelta(days=random.randint(0, 3 * 365))
+                yield Invoice(
+                    user=owner,
+                    client=random.choice(clients_by_owner[owner.pk]),
+                    invoice_number=f'BENCH-{i:08d}',
+                    issue_date=issued,
+                    due_date=issued + timedelta(days=30),
+                    status=random.choice(statuses),
+                    currency=random.choice(currencies),
+                    total=Decimal(random.randint(100, 1_000_000)) / 100,
+                    created_at=now - timedelta(seconds=random.randint(0, 3 * 365 * 86400)),
+                )
+
+        started = time.perf_counter()
+        for offset in range(0, count, 10_000):
+            invoices = list(batch(min(10_000, count - offset), offset))
+            # Keep the spread-out created_at values instead of stamping every row with now()
+            bulk_create_backdated(Invoice, invoices, ['created_at'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f'Seeded {count} invoices in {time.perf_counter() - started:.1f}s')
+        return owners[0], clients_by_owner[owners[0].pk][0]
+
+    def hot_queries(self, user, client):
+        """The query shapes the invoice pages run, keyed by label"""
+        today = date.today()
+        invoices = Invoice.objects.filter(user=user)
+        middle = invoices.order_by('-created_at', '-id').values_list('created_at', flat=True)[
+            invoices.count() // 2
+        ]
+        return {
+            'list first page': invoices.order_by('-created_at', '-id')[:51],
+            'list deep page': invoices.filter(created_at__lt=middle).order_by('-created_at', '-id')[:51],
+            'list by status': invoices.filter(status='paid').order_by('-created_at', '-id')[:51],
+            'stats aggregate': _aggregate_rows(user),
+            'numbering year count': invoices.filter(created_at__year=today.year).order_by().values('id'),
+            'unpaid by due date': invoices.exclude(status='paid').filter(due_date__lt=today).order_by('due_date')[:51],
+            'client invoices': Invoice.objects.filter(client=client).order_by('-created_at')[:51],
+            'client list': Client.objects.filter(user=user).order_by('-created_at', '-id')[:51],
+        }
+
+    def run(self, queries):
+        medians = {}
+        for label, queryset in queries.items():
+            if self.explain:
+                self.stdout.write(f'-- {label}')
+                self.stdout.write(queryset.explain())
+
+            timings = []
+            for _ in range(self.iterations):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            medians[label] = timings[len(timings) // 2] * 1000
+            self.stdout.write(f'{label:<24} median={medians[label]:.2f}ms min={timings[0] * 1000:.2f}ms')
+        return medians
+
+    def drop_indexes(self):
+        """Drop the composite indexes inside the benchmark transaction"""
+        with connection.cursor() as cursor:
+            for model in (Client, Invoice):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+            cursor.execute('ANALYZE')
@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.models import Invoice
+from invoices.pdf import WEASYPRINT_INSTALLED, PdfRenderer, downscaled_image, get_renderer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-PDF latency of rebuilding fonts, stylesheets and logos for every invoice '
+        'against the shared per-process renderer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, help='Invoice id to render (default: the latest invoice)')
+        parser.add_argument('--iterations', type=int, default=20, help='Number of timed renders per mode')
+
+    def handle(self, *args, **options):
+        if not WEASYPRINT_INSTALLED:
+            raise CommandError('WeasyPrint is not installed; PDFs cannot be rendered.')
+
+        invoices = Invoice.objects.select_related('client', 'user').prefetch_related('line_items')
+        if options['invoice']:
+            invoice = invoices.filter(pk=options['invoice']).first()
+        else:
+            invoice = invoices.order_by('-created_at').first()
+        if invoice is None:
+            raise CommandError('No invoice to render')
+
+        def cold():
+            # What every request paid before: new fonts, reparsed CSS, logo decoded again
+            downscaled_image.cache_clear()
+            PdfRenderer().render(invoice)
+
+        def warm():
+            get_renderer().render(invoice)
+
+        # Warm up imports, the template loader and the shared renderer
+        warm()
+
+        results = {}
+        for label, render in (('per-call setup', cold), ('shared renderer', warm)):
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                render()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = statistics.median(timings)
+            self.stdout.write(
+                f'{label:<16} median={results[label]:.1f}ms min={min(timings):.1f}ms max={max(timings):.1f}ms'
+            )
+
+        before, after = results['per-call setup'], results['shared renderer']
+        self.stdout.write(self.style.SUCCESS(f'Per-PDF latency {before:.1f}ms -> {after:.1f}ms ({before / after:.2f}x)'))
@@ -0,0 +1,125 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
+
+from invoices.models import SearchDocument
+from invoices.search import RANKED_RESULTS, SearchResults, optimize_search_index, search_terms, words
+from invoices.seeding import BUSINESS_WORDS, CITIES, NAMES, SERVICES
+from invoices.views import SEARCH_RESULTS_PER_PAGE
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded benchmark documents"""
+
+
+# Less common words mixed into some documents, so queries of every selectivity exist
+RARE_WORDS = ('generator', 'solar', 'cistern', 'mango', 'vetiver', 'cassava', 'rebar', 'tarpaulin')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed search documents and time ranked full-text searches against the '
+        'equivalent icontains scan. Everything is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1_000_000, help='Number of documents to seed')
+        parser.add_argument('--users', type=int, default=100, help='Number of owners to spread documents over')
+        parser.add_argument('--iterations', type=int, default=10, help='Number of timed runs per query')
+        parser.add_argument(
+            '--query', action='append', dest='queries',
+            help='Query to time; repeat for several (default: a mix of common, rare and prefix queries)',
+        )
+
+    def handle(self, *args, **options):
+        self.iterations = options['iterations']
+        self.stdout.write(f'Database vendor: {connection.vendor}')
+        queries = options['queries'] or [
+            'consulting', 'vetiver', 'jacmel transport', 'boul', 'inv-2026', '509 23', 'doesnotexist',
+        ]
+
+        try:
+            with transaction.atomic():
+                user = self.seed(options['documents'], options['users'])
+                self.stdout.write(
+                    f'Searching as the largest owner: '
+                    f'{SearchDocument.objects.filter(user=user).count()} documents'
+                )
+                self.stdout.write(f'At most {RANKED_RESULTS} matches are counted and ranked')
+                self.stdout.write(
+                    f'{"query":<20} {"matches":>8} {"page 1":>9} {"page 10":>9} {"icontains":>10}  (median ms)'
+                )
+                for query in queries:
+                    self.run(user, query)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count, users):
+        """Spread ``count`` documents over ``users`` owners; the first owner gets the largest share"""
+        User = get_user_model()
+        prefix = f'benchmark-{time.time_ns()}'
+        owners = User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(users)])
+        weights = [len(owners)] + [1] * (len(owners) - 1)
+        rng = random.Random(0)
+
+        def document(i):
+            owner = rng.choices(owners, weights)[0]
+            if i % 10 == 0:
+                # One client for every nine invoices
+                title = f'{rng.choice(BUSINESS_WORDS)} {rng.choice(NAMES)} {i}'
+                phone = f'+509 {rng.randint(2000, 4999)} {rng.randint(0, 9999):04d}'
+                body = f'{title.replace(" ", ".")}@example.com\n{phone}\n{rng.choice(CITIES)}'
+            else:
+                title = f'INV-{2024 + i % 3}-{i:07d}'
+                lines = [f'{rng.choice(SERVICES)} {rng.choice(("service", "package", "hours"))}' for _ in range(3)]
+                if rng.random() < 0.01:
+                    lines.append(rng.choice(RARE_WORDS))
+                body = '\n'.join(lines)
+            return SearchDocument(user=owner, title=' '.join(words(title)), body=' '.join(words(body)))
+
+        started = time.perf_counter()
+        for offset in range(0, count, 10_000):
+            SearchDocument.objects.bulk_create(
+                [document(i) for i in range(offset, min(offset + 10_000, count))], batch_size=1000,
+            )
+        optimize_search_index()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Seeded {count} documents in {time.perf_counter() - started:.1f}s')
+        return owners[0]
+
+    def timed(self, function):
+        timings = []
+        for _ in range(self.iterations):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return result, statistics.median(timings) * 1000
+
+    def run(self, user, query):
+        def page(number):
+            # A fresh Paginator per run, like a request: one count and one page query
+            return lambda: list(Paginator(SearchResults(user, query), SEARCH_RESULTS_PER_PAGE).get_page(number))
+
+        results = SearchResults(user, query)
+        matches = f'{results.count()}{"+" if results.truncated else ""}'
+        _, first_page = self.timed(page(1))
+        _, tenth_page = self.timed(page(10))
+
+        # What a search without the index costs: a substring scan of every document
+        condition = Q()
+        for term in search_terms(query):
+            condition &= Q(title__icontains=term) | Q(body__icontains=term)
+        scan = SearchDocument.objects.filter(condition, user=user).order_by('-id')
+        _, icontains = self.timed(lambda: list(scan[:SEARCH_RESULTS_PER_PAGE]) and scan.count())
+
+        self.stdout.write(
+            f'{query:<20} {matches:>8} {first_page:>9.2f} {tenth_page:>9.2f} {icontains:>10.2f}'
+        )
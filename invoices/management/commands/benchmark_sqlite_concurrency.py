@@ -0,0 +1,152 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test import Client as TestClient
+from django.urls import reverse
+from django.utils import timezone
+
+from invoices.models import Client
+from invoices.workers import process_pool
+
+
+def invoice_data(rng, client_ids):
+    """POST payload of the invoice form for a three-line invoice"""
+    today = timezone.localdate().isoformat()
+    data = {
+        'client': rng.choice(client_ids),
+        'invoice_number': '',
+        'issue_date': today,
+        'due_date': today,
+        'currency': 'HTG',
+        'tax_percent': '10',
+        'discount_percent': '0',
+        'status': 'draft',
+        'notes': '',
+        'line_items-TOTAL_FORMS': '3',
+        'line_items-INITIAL_FORMS': '0',
+        'line_items-MIN_NUM_FORMS': '1',
+        'line_items-MAX_NUM_FORMS': '1000',
+    }
+    for index in range(3):
+        data[f'line_items-{index}-description'] = f'Item {index}'
+        data[f'line_items-{index}-quantity'] = str(rng.randint(1, 5))
+        data[f'line_items-{index}-unit_price'] = f'{rng.uniform(1, 500):.2f}'
+    return data
+
+
+def run_client(seed, seconds, write_ratio):
+    """
+    Browse as the benchmark user for ``seconds``; runs in a worker process.
+
+    Returns (read timings, write timings, failed requests, seconds).
+    """
+    rng = random.Random(seed)
+    user = get_user_model().objects.get(username='benchmark')
+    client_ids = list(Client.objects.filter(user=user).values_list('pk', flat=True))
+    browser = TestClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    browser.force_login(user)
+
+    reads, writes, failures = [], [], 0
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < seconds:
+            write = rng.random() < write_ratio
+            request_started = time.perf_counter()
+            try:
+                if write:
+                    response = browser.post(reverse('invoice_create'), invoice_data(rng, client_ids))
+                else:
+                    response = browser.get(reverse('invoice_list'))
+            except OperationalError:
+                failures += 1
+                continue
+            if response.status_code not in (200, 302):
+                raise RuntimeError(f'Unexpected status {response.status_code}')
+            (writes if write else reads).append((time.perf_counter() - request_started) * 1000)
+    finally:
+        connections.close_all()
+    return reads, writes, failures, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Run mixed invoice list reads and invoice creation from several worker processes against '
+        'a scratch SQLite database, with the default settings and with DB_SQLITE_TUNED'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8, help='Concurrent worker processes')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each run')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of requests that create an invoice')
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The default database is not SQLite.')
+
+        configured_name = database['NAME']
+        environ = {name: os.environ.get(name) for name in ('DB_NAME', 'DB_SQLITE_TUNED')}
+        results = {}
+        try:
+            # Next to the configured database, so the runs see the same disk and fsync costs
+            with tempfile.TemporaryDirectory(dir=Path(configured_name).parent) as directory:
+                template = Path(directory) / 'template.sqlite3'
+                self.use_database(database, template)
+                call_command('migrate', verbosity=0, interactive=False)
+                user = get_user_model().objects.create_user('benchmark')
+                Client.objects.bulk_create(
+                    Client(user=user, name=f'Benchmark client {index}') for index in range(20)
+                )
+                connections.close_all()
+
+                for label, tuned in (('default', '0'), ('tuned', '1')):
+                    path = Path(directory) / f'{label}.sqlite3'
+                    shutil.copy(template, path)
+                    # Worker processes read the database settings from the environment
+                    os.environ['DB_NAME'] = str(path)
+                    os.environ['DB_SQLITE_TUNED'] = tuned
+                    results[label] = self.run(options['processes'], options['seconds'], options['write_ratio'])
+        finally:
+            for name, value in environ.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            self.use_database(database, configured_name)
+
+        for label, (reads, writes, failures, rate) in results.items():
+            self.stdout.write(
+                f'{label:<8} {rate:6.1f} req/s  '
+                f'read median={statistics.median(reads or [0]):.1f}ms  '
+                f'write median={statistics.median(writes or [0]):.1f}ms  '
+                f'{failures} failed with "database is locked"'
+            )
+
+        before, after = results['default'][3], results['tuned'][3]
+        self.stdout.write(self.style.SUCCESS(f'Throughput {before:.1f} -> {after:.1f} req/s ({after / before:.2f}x)'))
+
+    def use_database(self, database, name):
+        connections.close_all()
+        database['NAME'] = name
+
+    def run(self, processes, seconds, write_ratio):
+        """Return (read timings, write timings, failed requests, successful requests per second) of one run"""
+        reads, writes, failures, rate = [], [], 0, 0
+        with process_pool(processes) as pool:
+            runs = pool.map(run_client, range(processes), [seconds] * processes, [write_ratio] * processes)
+            for run_reads, run_writes, run_failures, elapsed in runs:
+                reads += run_reads
+                writes += run_writes
+                failures += run_failures
+                rate += (len(run_reads) + len(run_writes)) / elapsed
+        return reads, writes, failures, rate
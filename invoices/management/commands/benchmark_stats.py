@@ -0,0 +1,105 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+
+from invoices.models import Client, Invoice
+from invoices.stats import aggregate_invoice_stats, get_invoice_stats
+from invoices.summary import rebuild_summary
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded benchmark data"""
+
+
+def legacy_stats(user):
+    """The per-figure COUNT/SUM queries the dashboards used to run"""
+    invoices = Invoice.objects.filter(user=user)
+    return {
+        'total_invoices': invoices.count(),
+        'draft_count': invoices.filter(status='draft').count(),
+        'sent_count': invoices.filter(status='sent').count(),
+        'paid_count': invoices.filter(status='paid').count(),
+        'overdue_count': invoices.filter(status='overdue').count(),
+        'total_amount': invoices.aggregate(Sum('total'))['total__sum'] or 0,
+        'total_paid': invoices.filter(status='paid').aggregate(Sum('total'))['total__sum'] or 0,
+        'total_outstanding': invoices.exclude(status='paid').aggregate(Sum('total'))['total__sum'] or 0,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare query count and latency of the legacy per-status queries, the single aggregate and the summary table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=10000, help='Number of invoices to seed')
+        parser.add_argument('--iterations', type=int, default=20, help='Number of timed runs per strategy')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.seed(options['invoices'])
+                strategies = (
+                    ('legacy', legacy_stats),
+                    ('aggregated', aggregate_invoice_stats),
+                    ('summary', get_invoice_stats),
+                )
+                for label, func in strategies:
+                    self.measure(label, func, user, options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        """Create a throwaway user with ``count`` invoices spread over every status and currency"""
+        User = get_user_model()
+        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        client = Client.objects.create(user=user, name='Benchmark Client')
+        statuses = [status for status, _label in Invoice.STATUS_CHOICES]
+        currencies = [currency for currency, _label in Invoice.CURRENCY_CHOICES]
+        today = date.today()
+
+        Invoice.objects.bulk_create(
+            (
+                Invoice(
+                    user=user,
+                    client=client,
+                    invoice_number=f'BENCH-{i:07d}',
+                    issue_date=today,
+                    due_date=today + timedelta(days=30),
+                    status=random.choice(statuses),
+                    currency=random.choice(currencies),
+                    subtotal=Decimal(random.randint(100, 100000)) / 100,
+                    total=Decimal(random.randint(100, 100000)) / 100,
+                )
+                for i in range(count)
+            ),
+            batch_size=1000,
+        )
+        # bulk_create bypasses the save signals that maintain the summary
+        rebuild_summary(users=[user])
+        self.stdout.write(f'Seeded {count} invoices')
+        return user
+
+    def measure(self, label, func, user, iterations):
+        with CaptureQueriesContext(connection) as queries:
+            func(user)
+        query_count = len(queries)
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func(user)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+
+        self.stdout.write(
+            f'{label:<12} queries={query_count:<3} '
+            f'median={timings[len(timings) // 2] * 1000:.2f}ms '
+            f'min={timings[0] * 1000:.2f}ms'
+        )
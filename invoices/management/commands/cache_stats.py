@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from invoices.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Report hit rates of the per-user page and fragment caches'
+
+    def handle(self, *args, **options):
+        for name, (hits, misses, hit_rate) in cache_stats().items():
+            rate = f'{hit_rate:.1%}' if hit_rate is not None else '-'
+            self.stdout.write(f'{name:<26} hits={hits:<8} misses={misses:<8} hit rate={rate}')
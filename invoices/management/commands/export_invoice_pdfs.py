@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.models import Client, Invoice
+from invoices.pdf import WEASYPRINT_INSTALLED
+from invoices.pdf_export import export_queryset, measure_throughput, stream_invoice_zip
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the PDFs of a user\'s invoices in a process pool and write them to a ZIP archive. '
+        'With --benchmark, report rendering throughput for increasing process counts instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the invoices to export')
+        parser.add_argument('--output', default='invoices.zip', help='Path of the ZIP archive to write')
+        parser.add_argument('--client', type=int, help='Only export invoices of this client id')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='Earliest issue date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Latest issue date (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=[status for status, _label in Invoice.STATUS_CHOICES])
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of rendering processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Re-render the selection with 1, 2, 4, ... up to --processes workers and report PDFs/sec',
+        )
+
+    def handle(self, *args, **options):
+        if not WEASYPRINT_INSTALLED:
+            raise CommandError('WeasyPrint is not installed; PDFs cannot be rendered.')
+
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user {options['username']}")
+
+        client = None
+        if options['client']:
+            client = Client.objects.filter(user=user, pk=options['client']).first()
+            if client is None:
+                raise CommandError(f"User {user.username} has no client {options['client']}")
+
+        invoices = export_queryset(
+            user,
+            client=client,
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            status=options['status'],
+        )
+
+        if options['benchmark']:
+            self.benchmark([invoice.pk for invoice in invoices], options['processes'])
+            return
+
+        started = time.perf_counter()
+        with open(options['output'], 'wb') as output:
+            for chunk in stream_invoice_zip(invoices, processes=options['processes']):
+                output.write(chunk)
+        count = len(invoices)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count} PDFs to {options['output']} in {elapsed:.1f}s "
+            f"({count / elapsed:.1f} PDFs/sec with {options['processes']} processes)"
+        ))
+
+    def benchmark(self, invoice_ids, max_processes):
+        if not invoice_ids:
+            raise CommandError('No invoices match the filters')
+
+        counts = []
+        processes = 1
+        while processes < max_processes:
+            counts.append(processes)
+            processes *= 2
+        counts.append(max_processes)
+
+        self.stdout.write(f'Rendering {len(invoice_ids)} PDFs on {os.cpu_count()} CPUs (includes pool startup)')
+        baseline = None
+        for processes in counts:
+            throughput = measure_throughput(invoice_ids, processes)
+            baseline = baseline or throughput
+            self.stdout.write(
+                f'processes={processes:<3} {throughput:8.2f} PDFs/sec  speedup={throughput / baseline:.2f}x'
+            )
@@ -0,0 +1,46 @@
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.imports import IMPORTERS
+
+
+class Command(BaseCommand):
+    help = 'Import clients or invoices for a user from a CSV file and report rejected rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the imported records')
+        parser.add_argument('dataset', choices=sorted(IMPORTERS), help='What the CSV file contains')
+        parser.add_argument('path', help='Path of the CSV file')
+        parser.add_argument('--errors', help='Write the rejected rows to this CSV file instead of the console')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user {options['username']}")
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                result = IMPORTERS[options['dataset']](user, lines, chunk_size=options['chunk_size'])
+        except (OSError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f'Cannot read {options["path"]}: {exc}')
+        elapsed = time.perf_counter() - started
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for line, message in result.errors:
+                self.stderr.write(f'line {line}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} {options['dataset']} in {elapsed:.1f}s, "
+            f'{len(result.errors)} errors'
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoices.overdue import BATCH_SIZE, mark_overdue_invoices
+
+
+class Command(BaseCommand):
+    help = 'Mark sent invoices whose due date has passed as overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Invoices updated per UPDATE')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and sweep every INTERVAL seconds (default: sweep once and exit)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            changed = mark_overdue_invoices(batch_size=options['batch_size'])
+            self.stdout.write(
+                f'Marked {changed} invoices as overdue in {(time.perf_counter() - started) * 1000:.0f}ms'
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
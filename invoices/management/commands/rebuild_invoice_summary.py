@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.summary import rebuild_summary, verify_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user invoice summary table from the invoices and verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Only rebuild the summary of this username (can be repeated)',
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Report drift between the summary and the invoices without rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = get_user_model().objects.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        if not options['verify_only']:
+            count = rebuild_summary(users)
+            self.stdout.write(f'Rebuilt {count} summary rows')
+
+        drift = verify_summary(users)
+        for (user_id, status, currency), stored, expected in drift:
+            self.stdout.write(
+                f'user={user_id} status={status} currency={currency}: '
+                f'stored={stored[0]}/{stored[1]} expected={expected[0]}/{expected[1]}'
+            )
+
+        if drift:
+            raise CommandError(f'{len(drift)} summary rows do not match the invoices')
+        self.stdout.write(self.style.SUCCESS('Invoice summary is consistent'))
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.models import Invoice
+from invoices.totals import find_total_drift, repair_totals
+
+
+class Command(BaseCommand):
+    help = 'Detect invoices whose stored totals drifted from their line items, and optionally repair them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Only check the invoices of this username (can be repeated)',
+        )
+        parser.add_argument('--fix', action='store_true', help='Rewrite the drifted totals')
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.all()
+        if options['usernames']:
+            users = get_user_model().objects.filter(username__in=options['usernames'])
+            if users.count() != len(set(options['usernames'])):
+                raise CommandError('Unknown user in --user')
+            invoices = invoices.filter(user__in=users)
+
+        drifted = 0
+        for invoice, expected in find_total_drift(invoices):
+            drifted += 1
+            self.stdout.write(
+                f'invoice={invoice.pk} total={invoice.total} expected={expected["total"]} '
+                f'subtotal={invoice.subtotal} expected={expected["subtotal"]}'
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All invoice totals match their line items'))
+            return
+
+        if not options['fix']:
+            raise CommandError(f'{drifted} invoices have drifted totals; run with --fix to repair them')
+
+        repaired = repair_totals(invoices)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} invoices'))
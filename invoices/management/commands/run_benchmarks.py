@@ -0,0 +1,110 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from invoices.benchmarks import (
+    LocalServer, build_report, build_scenarios, compare_reports, run_client_benchmark, run_http_benchmark,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the invoice list, dashboard, detail, create/edit, PDF and search pages through the '
+        'test client and over concurrent HTTP, write a JSON report and compare it to a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to log in as (default: the owner of the latest invoice)')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help='Scenario to run; repeat for several (default: all)',
+        )
+        parser.add_argument('--requests', type=int, default=50, help='Test client requests per scenario')
+        parser.add_argument('--http', action='store_true', help='Also run the concurrent HTTP load test')
+        parser.add_argument(
+            '--base-url',
+            help='Server for the HTTP load test (default: one started in this process)',
+        )
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent HTTP clients')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds of HTTP load per scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the chosen invoices and clients')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Percent by which p50/p95 latency may grow before it is a regression',
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.all()
+        if options['user']:
+            user = users.filter(username=options['user']).first()
+        else:
+            user = users.order_by('-invoices__id').first()
+        if user is None:
+            raise CommandError('No user to log in as; run seed_demo_data first')
+
+        scenarios = [scenario for scenario in build_scenarios(user) if scenario.available]
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in build_scenarios(user)}
+            if unknown:
+                raise CommandError(f'Unknown or unavailable scenario: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        # PDFs are measured rendered inline, not handed to the worker
+        with override_settings(PDF_ASYNC_RENDERING=False):
+            client_results = run_client_benchmark(user, scenarios, options['requests'], options['seed'])
+            self.write_results('Test client', client_results)
+
+            http_results = http_options = None
+            if options['http']:
+                http_options = {'concurrency': options['concurrency'], 'duration': options['duration']}
+                if options['base_url']:
+                    base_url = options['base_url'].rstrip('/')
+                    http_results = run_http_benchmark(
+                        base_url, user, scenarios, options['concurrency'], options['duration'], options['seed'],
+                    )
+                else:
+                    with LocalServer() as base_url:
+                        http_results = run_http_benchmark(
+                            base_url, user, scenarios, options['concurrency'], options['duration'], options['seed'],
+                        )
+                self.write_results(f'HTTP ({options["concurrency"]} concurrent)', http_results)
+
+        report = build_report(user, client_results, http_results, http_options)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(f'Report written to {options["output"]}')
+
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+            regressions = compare_reports(baseline, report, options['threshold'])
+            if regressions:
+                for message in regressions:
+                    self.stderr.write(message)
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}'))
+
+    def write_results(self, title, results):
+        self.stdout.write(title)
+        for name, stats in results.items():
+            if not stats['requests']:
+                self.stdout.write(f'  {name}: no successful requests ({stats["errors"]} errors)')
+                continue
+            line = (
+                f'  {name}: p50 {stats["p50_ms"]:.1f}ms, p95 {stats["p95_ms"]:.1f}ms, '
+                f'p99 {stats["p99_ms"]:.1f}ms over {stats["requests"]} requests'
+            )
+            if 'queries_median' in stats:
+                line += f', {stats["queries_median"]:g} queries'
+            if 'throughput_rps' in stats:
+                line += f', {stats["throughput_rps"]:.1f} req/s'
+            if stats['errors']:
+                line += f', {stats["errors"]} errors'
+            self.stdout.write(line)
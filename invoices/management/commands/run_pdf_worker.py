@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from invoices.pdf import WEASYPRINT_INSTALLED
+from invoices.pdf_queue import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Render queued invoice PDFs into the PDF cache using a local process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of rendering processes (default: number of CPUs)',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        if not WEASYPRINT_INSTALLED:
+            self.stderr.write('WeasyPrint is not installed; PDFs cannot be rendered.')
+            return
+
+        self.stdout.write(f"Rendering PDFs with {options['processes']} processes")
+        try:
+            run_worker(
+                processes=options['processes'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+                log=self.stdout.write,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
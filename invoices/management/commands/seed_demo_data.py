@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.seeding import seed_demo_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Create demo users with realistically distributed clients, invoices and line items '
+        'for load tests and benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help='Number of users')
+        parser.add_argument('--clients', type=int, default=100, help='Clients per user')
+        parser.add_argument('--invoices', type=int, default=10, help='Average invoices per client')
+        parser.add_argument('--items', type=int, default=3, help='Average line items per invoice')
+        parser.add_argument('--prefix', default='demo', help='Usernames are <prefix>-<n>')
+        parser.add_argument('--password', default='demo-pass-123', help='Password of the demo users')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible data sets')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if get_user_model().objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named {prefix}-<n> already exist; choose another --prefix')
+
+        started = time.perf_counter()
+        counts = seed_demo_data(
+            options['users'], options['clients'], options['invoices'], options['items'],
+            prefix=prefix, password=options['password'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {counts["users"]} users, {counts["clients"]} clients, {counts["invoices"]} invoices '
+            f'and {counts["line_items"]} line items in {time.perf_counter() - started:.1f}s'
+        ))
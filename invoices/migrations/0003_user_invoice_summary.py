@@ -0,0 +1,113 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_summary(apps, schema_editor):
+    Invoice = apps.get_model("invoices", "Invoice")
+    UserInvoiceSummary = apps.get_model("invoices", "UserInvoiceSummary")
+
+    rows = (
+        Invoice.objects.order_by()
+        .values("user_id", "status", "currency")
+        .annotate(invoice_count=Count("id"), total_amount=Sum("total"))
+    )
+    UserInvoiceSummary.objects.bulk_create(
+        [
+            UserInvoiceSummary(
+                user_id=row["user_id"],
+                status=row["status"],
+                currency=row["currency"],
+                invoice_count=row["invoice_count"],
+                total_amount=row["total_amount"] or 0,
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0002_invoice_currency"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserInvoiceSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("draft", "Draft"),
+                            ("sent", "Sent"),
+                            ("paid", "Paid"),
+                            ("overdue", "Overdue"),
+                            ("canceled", "Canceled"),
+                        ],
+                        max_length=20,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(
+                        choices=[
+                            ("HTG", "Haitian Gourdes (HTG)"),
+                            ("USD", "US Dollars (USD)"),
+                        ],
+                        max_length=3,
+                        verbose_name="Currency",
+                    ),
+                ),
+                (
+                    "invoice_count",
+                    models.IntegerField(default=0, verbose_name="Invoice Count"),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Total Amount",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="invoice_summaries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Owner",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Invoice Summary",
+                "verbose_name_plural": "Invoice Summaries",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "status", "currency"),
+                        name="unique_invoice_summary_per_user_status_currency",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
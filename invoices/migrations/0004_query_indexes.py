@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0003_user_invoice_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="client_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="invoice_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["user", "status", "-created_at", "-id"],
+                name="invoice_user_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["user", "status", "currency", "total"],
+                name="invoice_user_totals_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(("status", "paid"), _negated=True),
+                fields=["user", "due_date"],
+                name="invoice_user_unpaid_due_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["client", "-created_at"], name="invoice_client_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_invoice_numbers(apps, schema_editor):
+    """Suffix repeated invoice numbers with the invoice id so the unique constraint applies"""
+    Invoice = apps.get_model("invoices", "Invoice")
+
+    duplicates = (
+        Invoice.objects.order_by()
+        .values("user_id", "invoice_number")
+        .annotate(copies=Count("id"))
+        .filter(copies__gt=1)
+    )
+    for duplicate in duplicates:
+        invoices = Invoice.objects.filter(
+            user_id=duplicate["user_id"], invoice_number=duplicate["invoice_number"]
+        ).order_by("created_at", "id")
+        # The oldest invoice keeps its number
+        for invoice in invoices[1:]:
+            suffix = f"-{invoice.pk}"
+            invoice.invoice_number = invoice.invoice_number[: 50 - len(suffix)] + suffix
+            invoice.save(update_fields=["invoice_number"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0004_query_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceNumberSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveIntegerField(verbose_name="Year")),
+                (
+                    "last_number",
+                    models.PositiveIntegerField(default=0, verbose_name="Last Number"),
+                ),
+            ],
+            options={
+                "verbose_name": "Invoice Number Sequence",
+                "verbose_name_plural": "Invoice Number Sequences",
+            },
+        ),
+        migrations.RunPython(deduplicate_invoice_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="invoice",
+            constraint=models.UniqueConstraint(
+                fields=("user", "invoice_number"), name="unique_invoice_number_per_user"
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoicenumbersequence",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="invoice_number_sequences",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Owner",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="invoicenumbersequence",
+            constraint=models.UniqueConstraint(
+                fields=("user", "year"),
+                name="unique_invoice_number_sequence_per_user_year",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0006_pdf_render_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["status", "due_date"], name="invoice_status_due_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,181 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:20
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _owner_words(column):
+    """SQL prefixing every space-separated word of ``column`` with u<user id>_"""
+    prefix = "'u' || new.user_id || '_'"
+    return f"CASE WHEN new.{column} = '' THEN '' ELSE {prefix} || replace(new.{column}, ' ', ' ' || {prefix}) END"
+
+
+SQLITE_INDEX = [
+    # Words are indexed as u<user id>_<word> so every posting list belongs to one user
+    """
+    CREATE VIRTUAL TABLE invoices_searchdocument_fts USING fts5(
+        title, body, tokenize = "unicode61 tokenchars '_'"
+    )
+    """,
+    f"""
+    CREATE TRIGGER invoices_searchdocument_fts_insert AFTER INSERT ON invoices_searchdocument BEGIN
+        INSERT INTO invoices_searchdocument_fts (rowid, title, body)
+        VALUES (new.id, {_owner_words("title")}, {_owner_words("body")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER invoices_searchdocument_fts_update AFTER UPDATE ON invoices_searchdocument BEGIN
+        UPDATE invoices_searchdocument_fts
+        SET title = {_owner_words("title")}, body = {_owner_words("body")}
+        WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER invoices_searchdocument_fts_delete AFTER DELETE ON invoices_searchdocument BEGIN
+        DELETE FROM invoices_searchdocument_fts WHERE rowid = old.id;
+    END
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS invoices_searchdocument_fts_insert",
+    "DROP TRIGGER IF EXISTS invoices_searchdocument_fts_update",
+    "DROP TRIGGER IF EXISTS invoices_searchdocument_fts_delete",
+    "DROP TABLE IF EXISTS invoices_searchdocument_fts",
+]
+POSTGRESQL_INDEX = [
+    """
+    ALTER TABLE invoices_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX invoices_searchdocument_vector_idx ON invoices_searchdocument USING GIN (search_vector)",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS invoices_searchdocument_vector_idx",
+    "ALTER TABLE invoices_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _execute(schema_editor, statements):
+    vendor = schema_editor.connection.vendor
+    for sql in statements.get(vendor, ()):
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    _execute(schema_editor, {"sqlite": SQLITE_INDEX, "postgresql": POSTGRESQL_INDEX})
+
+
+def drop_search_index(apps, schema_editor):
+    _execute(schema_editor, {"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP})
+
+
+def words(text):
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    return " ".join(re.findall(r"\w+", folded))
+
+
+def populate_documents(apps, schema_editor):
+    Client = apps.get_model("invoices", "Client")
+    Invoice = apps.get_model("invoices", "Invoice")
+    InvoiceItem = apps.get_model("invoices", "InvoiceItem")
+    SearchDocument = apps.get_model("invoices", "SearchDocument")
+
+    documents = []
+    clients = Client.objects.values("id", "user_id", "name", "email", "phone", "address", "city")
+    for row in clients.iterator():
+        phone = row["phone"] or ""
+        body = [row["email"], phone, re.sub(r"\D", "", phone), row["address"], row["city"]]
+        documents.append(
+            SearchDocument(
+                user_id=row["user_id"],
+                client_id=row["id"],
+                title=words(row["name"]),
+                body=words(" ".join(part for part in body if part)),
+            )
+        )
+
+    descriptions = {}
+    items = InvoiceItem.objects.order_by("pk").values_list("invoice_id", "description")
+    for invoice_id, description in items.iterator():
+        descriptions.setdefault(invoice_id, {})[description] = None
+    for row in Invoice.objects.values("id", "user_id", "invoice_number", "notes").iterator():
+        body = [row["notes"] or ""] + list(descriptions.get(row["id"], ()))
+        documents.append(
+            SearchDocument(
+                user_id=row["user_id"],
+                invoice_id=row["id"],
+                title=words(row["invoice_number"]),
+                body=words(" ".join(body)),
+            )
+        )
+    SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0007_overdue_sweep_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("title", models.CharField(max_length=255, verbose_name="Title")),
+                ("body", models.TextField(blank=True, verbose_name="Body")),
+                (
+                    "client",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_document",
+                        to="invoices.client",
+                        verbose_name="Client",
+                    ),
+                ),
+                (
+                    "invoice",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_document",
+                        to="invoices.invoice",
+                        verbose_name="Invoice",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_documents",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Owner",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Search Document",
+                "verbose_name_plural": "Search Documents",
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(populate_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:42
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(folded.lower().split())
+
+
+def populate_names(apps, schema_editor):
+    Client = apps.get_model("invoices", "Client")
+    clients = []
+    for client in Client.objects.only("id", "name").iterator(chunk_size=1000):
+        client.name_normalized = normalize_name(client.name)
+        clients.append(client)
+        if len(clients) >= 1000:
+            Client.objects.bulk_update(clients, ["name_normalized"])
+            clients = []
+    Client.objects.bulk_update(clients, ["name_normalized"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoices", "0008_search_document"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="name_normalized",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=255,
+                verbose_name="Normalized Name",
+            ),
+        ),
+        migrations.RunPython(populate_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(
+                fields=["user", "name_normalized"], name="client_user_name_idx"
+            ),
+        ),
+    ]
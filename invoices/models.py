@@ -1,8 +1,63 @@
-from django.db import models
+import unicodedata
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
 
+def normalize_name(name):
+    """``name`` lowercased, stripped of accents and with single spaces, as
+    stored in ``Client.name_normalized`` for prefix lookups"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(folded.lower().split())
+
+
+class ClientQuerySet(models.QuerySet):
+    """QuerySet for clients with database-side billing statistics"""
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        # save() is bypassed, so the normalized names are filled in here
+        objs = list(objs)
+        for client in objs:
+            client.name_normalized = normalize_name(client.name)
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def name_startswith(self, prefix):
+        """Clients whose normalized name starts with the normalized ``prefix``
+        
+        The range on ``name_normalized`` is answered from the (user,
+        name_normalized) index on every backend, unlike LIKE, which SQLite
+        only indexes for case-insensitive columns; startswith keeps the match
+        exact whatever the column's collation.
+        """
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return self
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.filter(
+            name_normalized__gte=prefix,
+            name_normalized__lt=upper,
+            name_normalized__startswith=prefix,
+        )
+    
+    def with_billing_stats(self):
+        """Annotate the invoice count and the billed, paid and outstanding
+        amounts per currency (``billed_htg``, ``paid_usd``, ...) in SQL"""
+        annotations = {'num_invoices': Count('invoices')}
+        for currency, _label in Invoice.CURRENCY_CHOICES:
+            code = currency.lower()
+            in_currency = Q(invoices__currency=currency)
+            annotations[f'num_invoices_{code}'] = Count('invoices', filter=in_currency)
+            annotations[f'billed_{code}'] = Sum('invoices__total', filter=in_currency)
+            annotations[f'paid_{code}'] = Sum(
+                'invoices__total', filter=in_currency & Q(invoices__status='paid')
+            )
+        return self.annotate(**annotations)
+
+
 class Client(models.Model):
     """Client model for storing client information"""
     
@@ -13,6 +68,7 @@ class Client(models.Model):
         verbose_name=_("Owner")
     )
     name = models.CharField(_("Name"), max_length=255)
+    name_normalized = models.CharField(_("Normalized Name"), max_length=255, editable=False, default='')
     email = models.EmailField(_("Email"), blank=True, null=True)
     phone = models.CharField(_("Phone"), max_length=50, blank=True, null=True)
     address = models.TextField(_("Address"), blank=True, null=True)
@@ -22,14 +78,29 @@ class Client(models.Model):
     created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
     updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
     
+    objects = ClientQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _("Client")
         verbose_name_plural = _("Clients")
         ordering = ['-created_at']
+        indexes = [
+            # Client list: WHERE user ORDER BY created_at DESC, id DESC (keyset pages)
+            models.Index(fields=['user', '-created_at', '-id'], name='client_user_created_idx'),
+            # Client picker: WHERE user AND name_normalized in a prefix range
+            models.Index(fields=['user', 'name_normalized'], name='client_user_name_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        super().save(*args, **kwargs)
+    
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse('client_detail', kwargs={'pk': self.pk})
@@ -48,11 +119,40 @@ class Client(models.Model):
     
     def invoices_count(self):
         """Return the number of invoices for this client"""
+        # Use the num_invoices annotation when the queryset provides one
+        if hasattr(self, 'num_invoices'):
+            return self.num_invoices
         return self.invoices.count()
     
     def total_billed(self):
         """Return the total amount billed to this client"""
-        return sum(invoice.total for invoice in self.invoices.all())
+        return sum((totals['billed'] for totals in self.billing_totals()), Decimal('0'))
+    
+    def billing_totals(self):
+        """Return the billed, paid and outstanding amounts for each currency
+        this client was invoiced in"""
+        if not hasattr(self, 'num_invoices_htg'):
+            # Not loaded through with_billing_stats(): aggregate for this client only
+            stats = Client.objects.filter(pk=self.pk).with_billing_stats().values().first() or {}
+            for key, value in stats.items():
+                if key.startswith(('num_invoices', 'billed_', 'paid_')):
+                    setattr(self, key, value)
+        
+        totals = []
+        for currency, _label in Invoice.CURRENCY_CHOICES:
+            code = currency.lower()
+            if not getattr(self, f'num_invoices_{code}', 0):
+                continue
+            billed = getattr(self, f'billed_{code}') or Decimal('0')
+            paid = getattr(self, f'paid_{code}') or Decimal('0')
+            totals.append({
+                'currency': currency,
+                'invoice_count': getattr(self, f'num_invoices_{code}'),
+                'billed': billed,
+                'paid': paid,
+                'outstanding': billed - paid,
+            })
+        return totals
 
 
 class Invoice(models.Model):
@@ -142,19 +242,64 @@ class Invoice(models.Model):
         verbose_name = _("Invoice")
         verbose_name_plural = _("Invoices")
         ordering = ['-created_at']
+        indexes = [
+            # Invoice list and yearly numbering: WHERE user [AND created_at range]
+            # ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='invoice_user_created_idx'),
+            # Invoice list filtered by ?status=
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='invoice_user_status_idx'),
+            # Per-status counts and amounts, answered from the index alone
+            models.Index(fields=['user', 'status', 'currency', 'total'], name='invoice_user_totals_idx'),
+            # Unpaid invoices by due date (outstanding and overdue lists)
+            models.Index(
+                fields=['user', 'due_date'],
+                name='invoice_user_unpaid_due_idx',
+                condition=~Q(status='paid'),
+            ),
+            # Client detail: WHERE client ORDER BY created_at DESC
+            models.Index(fields=['client', '-created_at'], name='invoice_client_created_idx'),
+            # Overdue sweep: WHERE status = 'sent' AND due_date < today
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'invoice_number'],
+                name='unique_invoice_number_per_user'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.client.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_summary_state()
+        if 'invoice_number' not in instance.get_deferred_fields():
+            instance._saved_invoice_number = instance.invoice_number
+        return instance
+    
+    def _remember_summary_state(self):
+        """Remember the values the invoice summary currently accounts for"""
+        deferred = self.get_deferred_fields()
+        if not deferred.intersection({'user_id', 'status', 'currency', 'total'}):
+            self._summary_state = (self.user_id, self.status, self.currency, self.total)
+    
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse('invoice_detail', kwargs={'pk': self.pk})
     
-    def save(self, *args, **kwargs):
-        """Override save to calculate totals before saving"""
+    def save(self, *args, update_totals=True, **kwargs):
+        """Override save to calculate totals before saving
+        
+        Pass ``update_totals=False`` when the totals were already computed,
+        e.g. with ``calculate_totals(line_items)`` from unsaved line items.
+        """
         # Only calculate totals if the invoice already exists in DB
         # Otherwise, set defaults and calculate after line items are added
-        if self.pk:
+        if not update_totals:
+            pass
+        elif self.pk:
             self.calculate_totals()
         else:
             # Set default values for new invoices
@@ -162,13 +307,35 @@ class Invoice(models.Model):
             self.tax_amount = 0
             self.discount_amount = 0
             self.total = 0
+        
+        # Keep the row, its number allocation and its UserInvoiceSummary delta
+        # (post_save) in one transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            from .numbering import allocate_invoice_number, reserve_invoice_number
+            allocated = not self.pk and not self.invoice_number
+            if allocated:
+                self.invoice_number = allocate_invoice_number(self.user_id)
+            super().save(*args, **kwargs)
             
-        super().save(*args, **kwargs)
+            # A future number of the automatic series chosen by hand must not
+            # be allocated again to the next new invoice
+            update_fields = kwargs.get('update_fields')
+            number_saved = update_fields is None or 'invoice_number' in update_fields
+            if number_saved:
+                if not allocated and self.invoice_number != getattr(self, '_saved_invoice_number', None):
+                    reserve_invoice_number(self.user_id, self.invoice_number)
+                self._saved_invoice_number = self.invoice_number
     
-    def calculate_totals(self):
-        """Calculate invoice subtotal, tax, discount, and total"""
+    def calculate_totals(self, line_items=None):
+        """Calculate invoice subtotal, tax, discount, and total
+        
+        ``line_items`` lets callers pass the (possibly unsaved) items in
+        memory instead of reading them back from the database.
+        """
         # Calculate subtotal from line items
-        if self.pk:  # Only calculate if invoice is already saved
+        if line_items is not None:
+            self.subtotal = sum(item.line_total for item in line_items)
+        elif self.pk:  # Only calculate if invoice is already saved
             line_items = self.line_items.all()
             self.subtotal = sum(item.line_total for item in line_items)
         
@@ -193,6 +360,120 @@ class Invoice(models.Model):
         return self.status != 'paid' and self.due_date < timezone.now().date()
 
 
+class InvoiceNumberSequence(models.Model):
+    """Last automatic invoice number allocated to a user for a given year"""
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='invoice_number_sequences',
+        verbose_name=_("Owner")
+    )
+    year = models.PositiveIntegerField(_("Year"))
+    last_number = models.PositiveIntegerField(_("Last Number"), default=0)
+    
+    class Meta:
+        verbose_name = _("Invoice Number Sequence")
+        verbose_name_plural = _("Invoice Number Sequences")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'year'],
+                name='unique_invoice_number_sequence_per_user_year'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.year}: {self.last_number}"
+
+
+class UserInvoiceSummary(models.Model):
+    """Denormalized invoice count and amount per user, status and currency
+    
+    Maintained incrementally by the Invoice save/delete signals so dashboards
+    can read a handful of rows instead of aggregating every invoice.
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='invoice_summaries',
+        verbose_name=_("Owner")
+    )
+    status = models.CharField(_("Status"), max_length=20, choices=Invoice.STATUS_CHOICES)
+    currency = models.CharField(_("Currency"), max_length=3, choices=Invoice.CURRENCY_CHOICES)
+    invoice_count = models.IntegerField(_("Invoice Count"), default=0)
+    total_amount = models.DecimalField(
+        _("Total Amount"),
+        max_digits=14,
+        decimal_places=2,
+        default=0
+    )
+    
+    class Meta:
+        verbose_name = _("Invoice Summary")
+        verbose_name_plural = _("Invoice Summaries")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'status', 'currency'],
+                name='unique_invoice_summary_per_user_status_currency'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.status} ({self.currency})"
+
+
+class PdfRenderJob(models.Model):
+    """Queued background rendering of an invoice PDF into the PDF cache"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    )
+    
+    invoice = models.ForeignKey(
+        'Invoice',
+        on_delete=models.CASCADE,
+        related_name='pdf_jobs',
+        verbose_name=_("Invoice")
+    )
+    version = models.CharField(_("PDF Version"), max_length=32)
+    status = models.CharField(
+        _("Status"),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0)
+    error = models.TextField(_("Error"), blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    started_at = models.DateTimeField(_("Started At"), blank=True, null=True)
+    finished_at = models.DateTimeField(_("Finished At"), blank=True, null=True)
+    
+    class Meta:
+        verbose_name = _("PDF Render Job")
+        verbose_name_plural = _("PDF Render Jobs")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['invoice', 'version'],
+                name='unique_pdf_render_job_per_version'
+            ),
+        ]
+        indexes = [
+            # Workers poll for the oldest pending jobs
+            models.Index(fields=['status', 'created_at'], name='pdf_job_status_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.invoice_id} ({self.version}): {self.status}"
+
+
 class InvoiceItem(models.Model):
     """Model for storing invoice line items"""
     
@@ -214,21 +495,94 @@ class InvoiceItem(models.Model):
     def __str__(self):
         return f"{self.description} ({self.quantity})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'line_total' not in instance.get_deferred_fields():
+            instance._saved_line_total = instance.line_total
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Calculate line total before saving"""
-        self.line_total = self.quantity * self.unit_price
-        super().save(*args, **kwargs)
+        """Calculate line total before saving and shift the invoice totals by its change"""
+        from .totals import apply_line_total_delta
+        
+        self.line_total = (Decimal(str(self.quantity)) * Decimal(str(self.unit_price))).quantize(Decimal('0.01'))
         
-        # Update the parent invoice totals, but avoid circular saving
-        # Get the invoice instance from the database again to avoid recursion
-        from django.db import connection
-        if connection.in_atomic_block:
-            # Don't trigger a save during atomic operations (like formset saving)
-            return
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk and not self._state.adding:
+                previous = getattr(self, '_saved_line_total', None)
+                if previous is None:
+                    previous = (
+                        InvoiceItem.objects.filter(pk=self.pk)
+                        .values_list('line_total', flat=True)
+                        .first()
+                    ) or Decimal('0')
+            else:
+                previous = Decimal('0')
+            
+            super().save(*args, **kwargs)
             
-        # Only update the parent invoice if it already exists
-        if self.invoice_id:
-            Invoice = self.invoice.__class__
-            invoice = Invoice.objects.get(pk=self.invoice_id)
-            invoice.calculate_totals()
-            invoice.save()
+            # Shift the parent totals by the change in this line total (a
+            # locked read and one UPDATE) instead of re-summing every line item
+            cached_invoice = self.invoice if InvoiceItem.invoice.is_cached(self) else None
+            apply_line_total_delta(self.invoice_id, self.line_total - previous, cached_invoice)
+        
+        self._saved_line_total = self.line_total
+    
+    def delete(self, *args, **kwargs):
+        """Delete the line item, remove its line total from the invoice totals
+        and drop its description from the invoice's search document"""
+        from .search import schedule_index
+        from .totals import apply_line_total_delta
+        
+        with transaction.atomic(using=kwargs.get('using')):
+            line_total = getattr(self, '_saved_line_total', self.line_total)
+            invoice_id = self.invoice_id
+            cached_invoice = self.invoice if InvoiceItem.invoice.is_cached(self) else None
+            result = super().delete(*args, **kwargs)
+            apply_line_total_delta(invoice_id, -line_total, cached_invoice)
+            schedule_index(invoice_ids=[invoice_id])
+        return result
+
+
+class SearchDocument(models.Model):
+    """Searchable text of one client or invoice
+    
+    Kept up to date by invoices/search.py. The full-text index over it lives
+    outside the ORM: an FTS5 table filled by triggers on SQLite, a tsvector
+    column with a GIN index on PostgreSQL (see migration 0008). Altering this
+    table on SQLite makes Django rebuild it, which drops the triggers: a
+    migration doing so must create them again.
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='search_documents',
+        verbose_name=_("Owner")
+    )
+    client = models.OneToOneField(
+        'Client',
+        on_delete=models.CASCADE,
+        related_name='search_document',
+        blank=True,
+        null=True,
+        verbose_name=_("Client")
+    )
+    invoice = models.OneToOneField(
+        'Invoice',
+        on_delete=models.CASCADE,
+        related_name='search_document',
+        blank=True,
+        null=True,
+        verbose_name=_("Invoice")
+    )
+    title = models.CharField(_("Title"), max_length=255)
+    body = models.TextField(_("Body"), blank=True)
+    
+    class Meta:
+        verbose_name = _("Search Document")
+        verbose_name_plural = _("Search Documents")
+    
+    def __str__(self):
+        return self.title
@@ -0,0 +1,139 @@
+"""
+Allocation of automatic invoice numbers (``INV-YYYY-NNNNN``).
+
+Each user has one InvoiceNumberSequence row per year. A number is allocated
+by incrementing that row with an atomic ``UPDATE ... SET last_number =
+last_number + 1`` and reading it back in the same transaction. The UPDATE
+holds the row lock until commit, so parallel workers can never get the same
+number, and the cost does not depend on how many invoices the user has.
+
+Numbers of the series typed in by hand move the sequence past them when the
+invoice is saved (``reserve_invoice_number``), so they are never allocated
+again. Bulk writes, which skip ``Invoice.save()``, call
+``reserve_invoice_numbers`` instead.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Invoice, InvoiceNumberSequence
+
+
+def format_invoice_number(year, number):
+    """Format: INV-YYYY-00001"""
+    return f"INV-{year}-{number:05d}"
+
+
+# Numbers as format_invoice_number writes them; only these can collide with
+# an allocated number
+SERIES_NUMBER = r'[0-9]{5}|[1-9][0-9]{5,}'
+SERIES_PATTERN = re.compile(rf'INV-([0-9]{{4}})-({SERIES_NUMBER})')
+
+
+def _parse_number(year, invoice_number):
+    """Return the sequence number of an automatic invoice number for ``year``, or None"""
+    match = re.fullmatch(rf'INV-{year}-(\d+)', invoice_number or '')
+    return int(match.group(1)) if match else None
+
+
+def _highest_existing_number(user_id, year):
+    """Highest automatic number already used, for users created before sequences existed"""
+    # Longer numbers are higher: INV-2026-100000 sorts before INV-2026-99999
+    highest = (
+        Invoice.objects
+        .filter(user_id=user_id, invoice_number__regex=rf'^INV-{year}-({SERIES_NUMBER})$')
+        .order_by(Length('invoice_number').desc(), '-invoice_number')
+        .values_list('invoice_number', flat=True)
+        .first()
+    )
+    return _parse_number(year, highest) or 0
+
+
+def _last_number(user_id, year):
+    last = (
+        InvoiceNumberSequence.objects
+        .filter(user_id=user_id, year=year)
+        .values_list('last_number', flat=True)
+        .first()
+    )
+    if last is None:
+        last = _highest_existing_number(user_id, year)
+    return last
+
+
+def next_invoice_number(user, year=None):
+    """Preview the next automatic number without reserving it"""
+    year = year or timezone.localdate().year
+    return format_invoice_number(year, _last_number(user.pk, year) + 1)
+
+
+def allocate_invoice_numbers(user_id, count, year=None):
+    """Reserve ``count`` consecutive automatic invoice numbers for a user and return them"""
+    year = year or timezone.localdate().year
+    sequences = InvoiceNumberSequence.objects.filter(user_id=user_id, year=year)
+
+    with transaction.atomic():
+        if not sequences.update(last_number=F('last_number') + count):
+            try:
+                with transaction.atomic():
+                    InvoiceNumberSequence.objects.create(
+                        user_id=user_id,
+                        year=year,
+                        last_number=_highest_existing_number(user_id, year) + count,
+                    )
+            except IntegrityError:
+                # A parallel transaction created the sequence first
+                sequences.update(last_number=F('last_number') + count)
+        last = sequences.values_list('last_number', flat=True).get()
+
+    return [format_invoice_number(year, number) for number in range(last - count + 1, last + 1)]
+
+
+def allocate_invoice_number(user_id, year=None):
+    """Reserve and return the next automatic invoice number for a user"""
+    return allocate_invoice_numbers(user_id, 1, year)[0]
+
+
+def reserve_invoice_number(user_id, invoice_number):
+    """
+    Move the user's sequence past ``invoice_number`` when it is a number of
+    the automatic series that has not been allocated yet. Call it in the
+    transaction that saves the invoice with that number.
+    """
+    match = SERIES_PATTERN.fullmatch(invoice_number or '')
+    if not match:
+        return
+    year, number = int(match.group(1)), int(match.group(2))
+    sequences = InvoiceNumberSequence.objects.filter(user_id=user_id, year=year)
+
+    with transaction.atomic():
+        if sequences.filter(last_number__lt=number).update(last_number=number) or sequences.exists():
+            return
+        try:
+            with transaction.atomic():
+                # Starts after the saved invoice, which is the highest number
+                # so far unless older invoices went further
+                InvoiceNumberSequence.objects.create(
+                    user_id=user_id,
+                    year=year,
+                    last_number=max(_highest_existing_number(user_id, year), number),
+                )
+        except IntegrityError:
+            # A parallel transaction created the sequence first
+            sequences.filter(last_number__lt=number).update(last_number=number)
+
+
+def reserve_invoice_numbers(user_id, invoice_numbers):
+    """``reserve_invoice_number`` for many numbers: only the highest of each year moves its sequence"""
+    highest = {}
+    for invoice_number in invoice_numbers:
+        match = SERIES_PATTERN.fullmatch(invoice_number or '')
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            if number > highest.get(year, (0, ''))[0]:
+                highest[year] = (number, invoice_number)
+    for _number, invoice_number in highest.values():
+        reserve_invoice_number(user_id, invoice_number)
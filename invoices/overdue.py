@@ -0,0 +1,97 @@
+"""
+Marking sent invoices whose due date has passed as overdue.
+
+``mark_overdue_invoices`` flips ``sent`` invoices with ``due_date < today``
+to ``overdue`` with one set-based UPDATE per batch (served by the
+``(status, due_date)`` index) and moves their counts and amounts between
+the per-user summary rows. Running it again changes nothing, so it can be
+scheduled as often as needed: from cron through the
+``mark_overdue_invoices`` command, or in-process with
+``start_periodic_sweeper``.
+"""
+import logging
+import threading
+from decimal import Decimal
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import bump_cache_versions
+from .models import Invoice
+from .summary import apply_summary_delta
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _overdue_candidates(today):
+    return Invoice.objects.filter(status='sent', due_date__lt=today)
+
+
+def mark_overdue_batch(today, batch_size=BATCH_SIZE):
+    """Mark up to ``batch_size`` sent invoices due before ``today`` as overdue; return the number changed"""
+    with transaction.atomic():
+        rows = list(
+            _overdue_candidates(today)
+            .select_for_update()
+            .order_by('due_date', 'id')
+            .values_list('pk', 'user_id', 'currency', 'total')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        updated = Invoice.objects.filter(pk__in=[row[0] for row in rows], status='sent').update(
+            status='overdue',
+            updated_at=timezone.now(),
+        )
+
+        # The UPDATE bypasses the signals that keep the summary and caches in sync
+        moved = {}
+        for _pk, user_id, currency, total in rows:
+            count, amount = moved.get((user_id, currency), (0, Decimal('0')))
+            moved[(user_id, currency)] = (count + 1, amount + total)
+        for (user_id, currency), (count, amount) in moved.items():
+            apply_summary_delta(user_id, 'sent', currency, -count, -amount)
+            apply_summary_delta(user_id, 'overdue', currency, count, amount)
+        bump_cache_versions(user_id for user_id, _currency in moved)
+
+    return updated
+
+
+def mark_overdue_invoices(today=None, batch_size=BATCH_SIZE):
+    """Mark every sent invoice due before ``today`` as overdue; return the number changed"""
+    today = today or timezone.localdate()
+    changed = 0
+    while True:
+        updated = mark_overdue_batch(today, batch_size)
+        if not updated:
+            return changed
+        changed += updated
+
+
+def start_periodic_sweeper(interval):
+    """
+    Run ``mark_overdue_invoices`` every ``interval`` seconds in a daemon thread.
+
+    Meant for single-process deployments without cron; with several processes
+    each one sweeps, which is harmless because the sweep is idempotent.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                changed = mark_overdue_invoices()
+            except Exception:
+                logger.exception('Overdue sweep failed')
+            else:
+                if changed:
+                    logger.info('Marked %d invoices as overdue', changed)
+            finally:
+                close_old_connections()
+
+    thread = threading.Thread(target=run, name='overdue-sweeper', daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,114 @@
+"""
+Keyset (cursor) pagination on ``(created_at, id)``.
+
+Pages are fetched with a ``WHERE (created_at, id) < cursor`` condition that
+matches the models' ``-created_at`` ordering, so every page costs the same
+index range scan no matter how deep it is, unlike OFFSET pagination.
+"""
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, obj):
+    """Return an opaque cursor pointing before or after ``obj``"""
+    value = f'{direction}|{obj.created_at.isoformat()}|{obj.pk}'
+    return urlsafe_base64_encode(value.encode())
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, created_at, pk)`` or None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        direction, created_at, pk = force_str(urlsafe_base64_decode(cursor)).split('|')
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error):
+        return None
+
+
+class KeysetPage:
+    """A page of results with opaque cursors to its neighbours"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if self.has_next_page and self.object_list:
+            return encode_cursor(NEXT, self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous_page and self.object_list:
+            return encode_cursor(PREVIOUS, self.object_list[0])
+        return None
+
+
+def paginate_keyset(queryset, cursor, per_page):
+    """Return the KeysetPage of ``queryset`` that ``cursor`` points to"""
+    position = decode_cursor(cursor)
+
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=False)
+
+    direction, created_at, pk = position
+    if direction == NEXT:
+        rows = list(
+            queryset
+            .filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            .order_by('-created_at', '-id')[:per_page + 1]
+        )
+        return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=True)
+
+    rows = list(
+        queryset
+        .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        .order_by('created_at', 'id')[:per_page + 1]
+    )
+    page = rows[:per_page]
+    page.reverse()
+    return KeysetPage(page, has_next=True, has_previous=len(rows) > per_page)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that replaces OFFSET pagination with keyset pagination.
+
+    The current position is read from the ``cursor`` query parameter and the
+    page is exposed as ``page_obj`` with ``next_cursor``/``previous_cursor``.
+    """
+    paginate_by = 50
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(queryset, self.request.GET.get(self.cursor_kwarg), page_size)
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,248 @@
+"""
+Invoice PDF rendering and the on-disk PDF cache.
+
+Rendered PDFs are stored in ``settings.PDF_CACHE_DIR`` under a name built
+from the invoice id and a version derived from the ``updated_at`` of the
+invoice, its client and its owner's profile, so a cached file is served as
+long as none of them has changed and is never served once one has. The
+cached PDFs of deleted invoices are removed once the delete commits.
+
+Rendering goes through one PdfRenderer per process, which keeps the font
+configuration, the parsed stylesheets and downscaled logos between calls
+and reads static and media files straight from disk.
+"""
+import functools
+import hashlib
+import io
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.template.loader import get_template
+from PIL import Image
+
+from core import metrics
+
+# Try to import weasyprint for PDF generation
+try:
+    from weasyprint import HTML, CSS, default_url_fetcher
+    from weasyprint.text.fonts import FontConfiguration
+    WEASYPRINT_INSTALLED = True
+except ImportError:
+    WEASYPRINT_INSTALLED = False
+
+
+# Relative URLs in the invoice template (e.g. the logo) resolve against this
+BASE_URL = 'http://localhost/'
+# Twice the size of the .logo box in invoice_pdf.css, enough for print quality
+LOGO_MAX_SIZE = (400, 160)
+
+
+def version_timestamps(invoice):
+    """When anything an invoice's page or PDF shows last changed: the invoice
+    and its line items, the client's details, and the owner's business
+    profile and logo"""
+    return (invoice.updated_at, invoice.client.updated_at, invoice.user.profile_updated_at)
+
+
+def last_modified(invoice):
+    return max(version_timestamps(invoice))
+
+
+def pdf_version(invoice):
+    """Return a short token that changes whenever the rendered PDF would change"""
+    parts = [timestamp.isoformat() for timestamp in version_timestamps(invoice)]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def cache_dir():
+    path = Path(settings.PDF_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def cached_pdf_path(invoice, version=None):
+    """Return the cache path of the current version of an invoice's PDF"""
+    return cache_dir() / f'{invoice.pk}-{version or pdf_version(invoice)}.pdf'
+
+
+def get_cached_pdf(invoice):
+    """Return the path of the cached PDF for the current version, or None"""
+    path = cached_pdf_path(invoice)
+    return path if path.exists() else None
+
+
+def open_cached_pdf(invoice, render=False):
+    """
+    Open the cached PDF of the current version for reading, or return None
+    if there is none. With ``render``, a missing PDF is rendered first.
+
+    A concurrent render_to_cache() can replace or remove the file at any
+    moment, so it is opened straight away rather than checked for first;
+    once open, it stays readable.
+    """
+    try:
+        return open(cached_pdf_path(invoice), 'rb')
+    except FileNotFoundError:
+        if not render:
+            return None
+    return open(render_to_cache(invoice), 'rb')
+
+
+def delete_cached_pdfs(invoice_ids):
+    """Remove every cached version of the PDFs of ``invoice_ids``"""
+    prefixes = {f'{pk}-' for pk in invoice_ids}
+    try:
+        entries = list(os.scandir(settings.PDF_CACHE_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        prefix = entry.name.partition('-')[0] + '-'
+        if prefix in prefixes and entry.name.endswith('.pdf'):
+            Path(entry.path).unlink(missing_ok=True)
+
+
+def _pending_deletes():
+    db = transaction.get_connection()
+    if not hasattr(db, 'pdf_cache_pending_deletes'):
+        db.pdf_cache_pending_deletes = set()
+    return db.pdf_cache_pending_deletes
+
+
+def _delete_pending():
+    pending = _pending_deletes()
+    invoice_ids = list(pending)
+    pending.clear()
+    delete_cached_pdfs(invoice_ids)
+
+
+def schedule_pdf_deletion(invoice_ids):
+    """
+    Remove the cached PDFs of deleted invoices once the current transaction
+    commits; the cache directory is listed once however many were deleted.
+    """
+    _pending_deletes().update(invoice_ids)
+    if transaction.get_connection().in_atomic_block:
+        # As in search.schedule_index, the first callback to run takes
+        # everything pending. Ids left behind by a rollback only cost a
+        # render of those PDFs after the next commit.
+        transaction.on_commit(_delete_pending)
+    else:
+        _delete_pending()
+
+
+def _file_under(root, relative):
+    if not root:
+        return None
+    root = Path(root).resolve()
+    candidate = (root / relative).resolve()
+    return candidate if candidate.is_relative_to(root) and candidate.is_file() else None
+
+
+def local_path(url):
+    """Return the file behind a static or media URL, or None if it is not a local file"""
+    path = unquote(urlsplit(url).path)
+    media_prefix = '/' + settings.MEDIA_URL.lstrip('/')
+    static_prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    if path.startswith(media_prefix):
+        return _file_under(settings.MEDIA_ROOT, path[len(media_prefix):])
+    if path.startswith(static_prefix):
+        relative = path[len(static_prefix):]
+        try:
+            # Fall back to the finders for static files that have not been collected
+            found = _file_under(settings.STATIC_ROOT, relative) or finders.find(relative)
+        except SuspiciousFileOperation:
+            return None
+        return Path(found) if found else None
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def downscaled_image(path, mtime):
+    """
+    Decode an image and shrink it to LOGO_MAX_SIZE, returning PNG bytes.
+
+    ``mtime`` is only part of the cache key, so a replaced file is decoded again.
+    """
+    with Image.open(path) as image:
+        image.thumbnail(LOGO_MAX_SIZE)
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def fetch_local_url(url):
+    """Fetch a static or media URL from disk for WeasyPrint; None if the URL is not local"""
+    path = local_path(url)
+    if path is None:
+        return None
+
+    mime_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    if mime_type.startswith('image/') and mime_type != 'image/svg+xml':
+        content = downscaled_image(str(path), path.stat().st_mtime_ns)
+        mime_type = 'image/png'
+    else:
+        content = path.read_bytes()
+    return {'string': content, 'mime_type': mime_type, 'redirected_url': url}
+
+
+class PdfRenderer:
+    """Renders invoices to PDF; build it once per process through get_renderer()"""
+
+    def __init__(self):
+        self.template = get_template('invoices/invoice_pdf.html')
+        self.font_config = FontConfiguration()
+        # The page box (letter, 2cm margins) is set by the @page rule in there
+        self.stylesheets = [
+            CSS(filename=finders.find('css/invoice_pdf.css'), font_config=self.font_config),
+        ]
+
+    def url_fetcher(self, url, *args, **kwargs):
+        return fetch_local_url(url) or default_url_fetcher(url, *args, **kwargs)
+
+    def render(self, invoice):
+        """Render an invoice to PDF bytes"""
+        with metrics.timed('pdf'):
+            html = self.template.render({
+                'invoice': invoice,
+                'user': invoice.user,
+                'line_items': invoice.line_items.all(),
+            })
+            document = HTML(string=html, base_url=BASE_URL, url_fetcher=self.url_fetcher)
+            return document.write_pdf(stylesheets=self.stylesheets, font_config=self.font_config)
+
+
+@functools.cache
+def get_renderer():
+    return PdfRenderer()
+
+
+def render_invoice_pdf(invoice):
+    """Render an invoice to PDF bytes"""
+    return get_renderer().render(invoice)
+
+
+def render_to_cache(invoice):
+    """Render an invoice into the cache and drop older versions; return the file path"""
+    path = cached_pdf_path(invoice)
+    content = render_invoice_pdf(invoice)
+
+    # Write to a temporary file first so readers never see a partial PDF
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(content)
+    os.replace(tmp_path, path)
+
+    for stale in path.parent.glob(f'{invoice.pk}-*.pdf'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path
@@ -0,0 +1,134 @@
+"""
+Bulk export of invoice PDFs as a ZIP archive.
+
+Missing PDFs are rendered into the PDF cache by the process's shared worker
+pool before the archive starts, so a rendering error can still be reported
+instead of ending a download early. The export endpoint caps the selection
+at ``settings.PDF_EXPORT_MAX_INVOICES`` invoices to bound that wait. The
+archive is then assembled from the cached files one chunk at a time, so
+neither the rendered PDFs nor the archive are ever held in memory as a
+whole. PDFs are already compressed, so entries are stored rather than
+deflated.
+"""
+import re
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+
+from .exports import invoice_filter
+from .models import Invoice
+from .pdf import get_cached_pdf, open_cached_pdf, render_to_cache
+from .workers import discard_shared_process_pool, process_pool, shared_process_pool
+from .zipstream import ZipStream
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def export_queryset(user, client=None, date_from=None, date_to=None, status=None):
+    """Invoices of ``user`` matching the export filters, oldest first"""
+    return (
+        Invoice.objects
+        .filter(invoice_filter(user, client=client, date_from=date_from, date_to=date_to, status=status))
+        .select_related('client', 'user')
+        .only('invoice_number', 'updated_at', 'client__updated_at', 'user__profile_updated_at')
+        .order_by('issue_date', 'id')
+    )
+
+
+def pdf_filename(invoice):
+    # Invoice numbers are typed in by users: keep them from naming directories
+    number = re.sub(r'\.{2,}', '.', re.sub(r'[/\\]+', '-', invoice.invoice_number))
+    return f'invoice_{number}.pdf'
+
+
+def render_pdf(invoice_id, force=False):
+    """Render one invoice into the PDF cache unless it is already there; runs in a worker"""
+    invoice = (
+        Invoice.objects
+        .select_related('client', 'user')
+        .prefetch_related('line_items')
+        .get(pk=invoice_id)
+    )
+    path = None if force else get_cached_pdf(invoice)
+    return str(path or render_to_cache(invoice))
+
+
+def render_missing_pdfs(invoices, processes=1):
+    """
+    Render the PDFs of ``invoices`` that are not cached yet with ``processes``
+    worker processes and return the invoices. The first rendering error is
+    raised once the renders still queued have been cancelled.
+    """
+    invoices = list(invoices)
+    missing = [invoice.pk for invoice in invoices if get_cached_pdf(invoice) is None]
+
+    if missing and processes <= 1:
+        for invoice_id in missing:
+            render_pdf(invoice_id)
+    elif missing:
+        pool = shared_process_pool(processes)
+        futures = [pool.submit(render_pdf, invoice_id) for invoice_id in missing]
+        try:
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            discard_shared_process_pool(processes)
+            raise
+        except BaseException:
+            # Do not keep rendering the rest of a failed export
+            for future in futures:
+                future.cancel()
+            raise
+    return invoices
+
+
+def open_pdf(invoice):
+    """Open the cached PDF of ``invoice``, rendering it again if it was replaced or removed meanwhile"""
+    return open_cached_pdf(invoice) or open(render_pdf(invoice.pk), 'rb')
+
+
+def stream_zip(entries, opener=open):
+    """
+    Yield a ZIP archive of ``(name, source)`` entries as a sequence of byte
+    chunks; ``opener(source)`` returns the binary file to read an entry from.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, source in entries:
+            with opener(source) as entry, archive.open(name, 'w') as target:
+                while chunk := entry.read(CHUNK_SIZE):
+                    target.write(chunk)
+                    yield from stream.drain()
+            yield from stream.drain()
+    yield from stream.drain()
+
+
+def stream_invoice_zip(invoices, processes=1):
+    """
+    Render the missing PDFs of ``invoices``, then return a generator of the
+    byte chunks of their ZIP archive. Rendering errors are raised here,
+    before any byte is produced.
+    """
+    names = set()
+    entries = []
+    for invoice in render_missing_pdfs(invoices, processes):
+        name = pdf_filename(invoice)
+        if name in names:
+            # Numbers that only differ in the characters replaced above
+            name = f'{name[:-4]}_{invoice.pk}.pdf'
+        names.add(name)
+        entries.append((name, invoice))
+    return stream_zip(entries, opener=open_pdf)
+
+
+def measure_throughput(invoice_ids, processes):
+    """Re-render ``invoice_ids`` with ``processes`` workers; return PDFs per second"""
+    started = time.perf_counter()
+    if processes <= 1:
+        for invoice_id in invoice_ids:
+            render_pdf(invoice_id, force=True)
+    else:
+        with process_pool(processes) as pool:
+            list(pool.map(render_pdf, invoice_ids, [True] * len(invoice_ids), chunksize=4))
+    return len(invoice_ids) / (time.perf_counter() - started)
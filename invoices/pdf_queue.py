@@ -0,0 +1,113 @@
+"""
+Database-backed queue for rendering invoice PDFs in the background.
+
+Requests enqueue a PdfRenderJob for the current PDF version of an invoice;
+``run_worker`` (the ``run_pdf_worker`` management command) claims pending
+jobs with an atomic UPDATE and renders them in a local process pool. No
+external broker is involved.
+"""
+import time
+from concurrent.futures import wait
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Invoice, PdfRenderJob
+from .pdf import pdf_version, render_to_cache
+from .workers import process_pool
+
+
+MAX_ATTEMPTS = 3
+# Running jobs older than this are assumed to belong to a dead worker
+STALE_AFTER = timedelta(minutes=5)
+
+
+def enqueue_pdf(invoice):
+    """Return the render job for the current version of an invoice's PDF, creating it if needed"""
+    version = pdf_version(invoice)
+    try:
+        with transaction.atomic():
+            job, created = PdfRenderJob.objects.get_or_create(invoice=invoice, version=version)
+    except IntegrityError:
+        job = PdfRenderJob.objects.get(invoice=invoice, version=version)
+        created = False
+
+    if created:
+        # Jobs for older versions are obsolete
+        PdfRenderJob.objects.filter(invoice=invoice).exclude(pk=job.pk).delete()
+    elif job.status == PdfRenderJob.STATUS_FAILED and job.attempts < MAX_ATTEMPTS:
+        PdfRenderJob.objects.filter(pk=job.pk, status=PdfRenderJob.STATUS_FAILED).update(
+            status=PdfRenderJob.STATUS_PENDING
+        )
+        job.status = PdfRenderJob.STATUS_PENDING
+    return job
+
+
+def claim_jobs(limit):
+    """Atomically mark up to ``limit`` pending jobs as running and return their ids"""
+    now = timezone.now()
+    claimable = (
+        Q(status=PdfRenderJob.STATUS_PENDING)
+        | Q(status=PdfRenderJob.STATUS_RUNNING, started_at__lt=now - STALE_AFTER)
+    )
+    candidates = list(
+        PdfRenderJob.objects.filter(claimable).order_by('created_at').values_list('pk', flat=True)[:limit]
+    )
+
+    claimed = []
+    for pk in candidates:
+        # Only one worker can win the conditional UPDATE for a given job
+        won = PdfRenderJob.objects.filter(claimable, pk=pk).update(
+            status=PdfRenderJob.STATUS_RUNNING,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if won:
+            claimed.append(pk)
+    return claimed
+
+
+def render_job(job_id):
+    """Render one claimed job; runs inside a worker process"""
+    job = PdfRenderJob.objects.get(pk=job_id)
+    try:
+        invoice = (
+            Invoice.objects
+            .select_related('client', 'user')
+            .prefetch_related('line_items')
+            .get(pk=job.invoice_id)
+        )
+        render_to_cache(invoice)
+    except Exception as exc:
+        status = (
+            PdfRenderJob.STATUS_FAILED if job.attempts >= MAX_ATTEMPTS else PdfRenderJob.STATUS_PENDING
+        )
+        PdfRenderJob.objects.filter(pk=job_id).update(
+            status=status, error=repr(exc), finished_at=timezone.now()
+        )
+        return False
+
+    PdfRenderJob.objects.filter(pk=job_id).update(
+        status=PdfRenderJob.STATUS_DONE, error='', finished_at=timezone.now()
+    )
+    return True
+
+
+def run_worker(processes=2, poll_interval=1.0, once=False, log=None):
+    """Claim and render jobs until interrupted, or until the queue is empty with ``once``"""
+    with process_pool(processes) as pool:
+        while True:
+            job_ids = claim_jobs(limit=processes * 2)
+            if job_ids:
+                started = time.perf_counter()
+                futures = [pool.submit(render_job, job_id) for job_id in job_ids]
+                wait(futures)
+                if log:
+                    succeeded = sum(1 for future in futures if future.result())
+                    log(f'Rendered {succeeded}/{len(job_ids)} PDFs in {time.perf_counter() - started:.2f}s')
+            elif once:
+                return
+            else:
+                time.sleep(poll_interval)
@@ -0,0 +1,282 @@
+"""
+Full-text search over a user's clients and invoices.
+
+Every client and invoice has one SearchDocument row with its searchable
+words, lowercased, stripped of accents and separated by single spaces: the
+client's name as the title and its email, phone and address as the body;
+the invoice number as the title and its notes and line item descriptions as
+the body. Migration 0008 indexes the documents outside the ORM:
+
+* SQLite: the FTS5 table ``invoices_searchdocument_fts``, filled by triggers
+  on the document table. Every word is indexed as ``u<user id>_<word>``, so
+  a term only ever matches its owner's documents and the index holds one
+  short posting list per user and word instead of one huge list per word.
+  Ranked with bm25, title weighted above body.
+* PostgreSQL: the generated tsvector column ``search_vector`` with a GIN
+  index, title weighted above body. Ranked with ts_rank_cd.
+
+Matches are ranked in SQL and only the RANKED_RESULTS best are returned, so
+a page never loads more than that many ids however common the words are.
+Other databases fall back to a case-insensitive ``LIKE`` on the documents,
+title matches first.
+
+Documents are rewritten when the transaction that changed a client, invoice
+or line item commits, once per object however many rows changed. Writers
+that bypass signals (imports, seeding) call ``index_clients`` and
+``index_invoices`` themselves; ``rebuild_search_index`` recreates everything.
+"""
+import re
+import unicodedata
+
+from django.db import connections, router, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Client, Invoice, InvoiceItem, SearchDocument
+
+
+FTS_TABLE = 'invoices_searchdocument_fts'
+# bm25 weights of the FTS5 columns: title, body
+BM25_WEIGHTS = (10.0, 1.0)
+# Best matches that are returned; the rest are not reachable
+RANKED_RESULTS = 500
+# Words of a query that are matched; the rest are ignored
+MAX_TERMS = 8
+CHUNK_SIZE = 1000
+
+
+def words(text):
+    """The words of ``text``, lowercased and stripped of accents, as they are indexed"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    return re.findall(r'\w+', folded)
+
+
+def search_terms(query):
+    """The words of ``query`` that are searched for, each matched as a prefix"""
+    return words(query)[:MAX_TERMS]
+
+
+def _client_document(row):
+    phone = row['phone'] or ''
+    # The phone number is also indexed as one word so it can be typed without spaces
+    body = [row['email'], phone, re.sub(r'\D', '', phone), row['address'], row['city']]
+    return SearchDocument(
+        user_id=row['user_id'],
+        client_id=row['id'],
+        title=' '.join(words(row['name'])),
+        body=' '.join(words(' '.join(part for part in body if part))),
+    )
+
+
+def _invoice_document(row, descriptions):
+    # Repeated descriptions add nothing to the match
+    body = [row['notes'] or ''] + list(dict.fromkeys(descriptions))
+    return SearchDocument(
+        user_id=row['user_id'],
+        invoice_id=row['id'],
+        title=' '.join(words(row['invoice_number'])),
+        body=' '.join(words(' '.join(body))),
+    )
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _write(documents, stale):
+    """Insert ``documents``, first deleting the ``stale`` ones they replace, if any"""
+    if stale is None:
+        SearchDocument.objects.bulk_create(documents)
+        return
+    with transaction.atomic():
+        stale.delete()
+        SearchDocument.objects.bulk_create(documents)
+
+
+def index_clients(client_ids, replace=True):
+    """
+    Rewrite the search documents of the given clients. Pass ``replace=False``
+    for clients just created, which have no documents to delete yet.
+    """
+    for chunk in _chunks(client_ids):
+        rows = Client.objects.filter(pk__in=chunk).values(
+            'id', 'user_id', 'name', 'email', 'phone', 'address', 'city',
+        )
+        _write(
+            [_client_document(row) for row in rows],
+            SearchDocument.objects.filter(client_id__in=chunk) if replace else None,
+        )
+
+
+def index_invoices(invoice_ids, replace=True):
+    """
+    Rewrite the search documents of the given invoices. Pass ``replace=False``
+    for invoices just created, which have no documents to delete yet.
+    """
+    for chunk in _chunks(invoice_ids):
+        descriptions = {}
+        items = InvoiceItem.objects.filter(invoice_id__in=chunk).order_by('pk')
+        for invoice_id, description in items.values_list('invoice_id', 'description'):
+            descriptions.setdefault(invoice_id, []).append(description)
+
+        rows = Invoice.objects.filter(pk__in=chunk).values('id', 'user_id', 'invoice_number', 'notes')
+        _write(
+            [_invoice_document(row, descriptions.get(row['id'], ())) for row in rows],
+            SearchDocument.objects.filter(invoice_id__in=chunk) if replace else None,
+        )
+
+
+def optimize_search_index():
+    """
+    Merge the FTS5 index into one segment after a bulk load; writes made a
+    few at a time are merged incrementally by FTS5 itself.
+    """
+    connection = connections[router.db_for_write(SearchDocument)]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def rebuild_search_index(users=None):
+    """Recreate the search documents of ``users`` (all users by default)"""
+    clients = Client.objects.order_by()
+    invoices = Invoice.objects.order_by()
+    if users is not None:
+        clients = clients.filter(user__in=users)
+        invoices = invoices.filter(user__in=users)
+    client_ids = list(clients.values_list('pk', flat=True))
+    invoice_ids = list(invoices.values_list('pk', flat=True))
+    index_clients(client_ids)
+    index_invoices(invoice_ids)
+    optimize_search_index()
+    return len(client_ids), len(invoice_ids)
+
+
+def _pending():
+    db = transaction.get_connection()
+    if not hasattr(db, 'search_index_pending'):
+        db.search_index_pending = (set(), set())
+    return db.search_index_pending
+
+
+def _index_pending():
+    clients, invoices = _pending()
+    client_ids, invoice_ids = list(clients), list(invoices)
+    clients.clear()
+    invoices.clear()
+    index_clients(client_ids)
+    index_invoices(invoice_ids)
+
+
+def schedule_index(client_ids=(), invoice_ids=()):
+    """
+    Rewrite the documents of the given clients and invoices once the current
+    transaction commits, so a form saving an invoice and all its line items
+    rewrites the invoice's document once, with the final items.
+    """
+    clients, invoices = _pending()
+    clients.update(client_ids)
+    invoices.update(invoice_ids)
+    if transaction.get_connection().in_atomic_block:
+        # Every call registers a callback; the first one to run indexes
+        # everything pending and leaves nothing for the others. Ids left
+        # behind by a rollback are indexed, harmlessly, with the next commit.
+        transaction.on_commit(_index_pending)
+    else:
+        _index_pending()
+
+
+class SearchResults:
+    """
+    The documents of ``user`` matching ``query``, best first.
+
+    Counted and sliced lazily so it can be handed to a Paginator. A single
+    query against the full-text index returns the ids of the RANKED_RESULTS
+    best matches, from which both the count and every page are taken; a
+    page then loads only its own documents.
+    """
+
+    def __init__(self, user, query):
+        self.user = user
+        self.terms = search_terms(query)
+        self.connection = connections[router.db_for_read(SearchDocument)]
+        self._ids = None
+
+    def _query(self):
+        """SQL and parameters selecting the ``(id, score)`` of the best matches, lower scores better"""
+        vendor = self.connection.vendor
+        if vendor == 'sqlite':
+            weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+            sql = (
+                f'SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY score, rowid DESC LIMIT %s'
+            )
+            return sql, [' AND '.join(f'"u{self.user.pk}_{term}"*' for term in self.terms), RANKED_RESULTS]
+        if vendor == 'postgresql':
+            sql = (
+                "SELECT id, -ts_rank_cd(search_vector, query) AS score FROM invoices_searchdocument, "
+                "to_tsquery('simple', %s) query WHERE user_id = %s AND search_vector @@ query "
+                'ORDER BY score, id DESC LIMIT %s'
+            )
+            return sql, [' & '.join(f'{term}:*' for term in self.terms), self.user.pk, RANKED_RESULTS]
+        return None
+
+    def _fallback_rows(self):
+        """``(id, score)`` of the best matches without a full-text index: title matches, then the rest"""
+        in_title = Q()
+        matches = Q()
+        for term in self.terms:
+            in_title &= Q(title__icontains=term)
+            matches &= Q(title__icontains=term) | Q(body__icontains=term)
+        return list(
+            SearchDocument.objects
+            .using(self.connection.alias)
+            .filter(matches, user=self.user)
+            .annotate(score=Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField()))
+            .order_by('score', '-pk')
+            .values_list('pk', 'score')[:RANKED_RESULTS]
+        )
+
+    @property
+    def ids(self):
+        """Ids of the matching documents, best first"""
+        if self._ids is None:
+            rows = []
+            query = self._query() if self.terms else None
+            if query is not None:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(*query)
+                    rows = cursor.fetchall()
+            elif self.terms:
+                rows = self._fallback_rows()
+            rows.sort(key=lambda row: (row[1], -row[0]))
+            self._ids = [row[0] for row in rows]
+        return self._ids
+
+    def count(self):
+        """The number of matches, at most RANKED_RESULTS"""
+        return len(self.ids)
+
+    def __len__(self):
+        return self.count()
+
+    @property
+    def truncated(self):
+        """Whether there may be more matches than the best ones returned"""
+        return self.count() >= RANKED_RESULTS
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('SearchResults only supports slicing without a step')
+        ids = self.ids[index]
+        if not ids:
+            return []
+        documents = (
+            SearchDocument.objects
+            .filter(user=self.user, pk__in=ids)
+            .select_related('client', 'invoice__client')
+            .in_bulk()
+        )
+        return [documents[pk] for pk in ids if pk in documents]
@@ -0,0 +1,187 @@
+"""
+Realistic demo data for load tests and benchmarks.
+
+``seed_demo_data`` creates users with clients, invoices and line items shaped
+like real usage rather than uniform rows: a few clients receive most of the
+invoices, amounts are log-normally distributed, most invoices are in HTG,
+the number of line items per invoice varies, issue dates spread over the
+last two years, and the status follows the due date (old invoices are mostly
+paid, some overdue; recent ones are drafts or sent).
+
+Rows are written with ``bulk_create`` in chunks, and the invoices' spread
+out ``created_at``/``updated_at`` are written back with ``bulk_update``,
+since ``bulk_create`` stamps them with now(). The summary table (and with it
+the page caches) and the search documents are rebuilt afterwards, since
+bulk writes bypass the signals that normally maintain them.
+"""
+import math
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Client, Invoice, InvoiceItem
+from .numbering import format_invoice_number
+from .search import rebuild_search_index
+from .summary import rebuild_summary
+from .totals import expected_totals
+
+
+CHUNK_SIZE = 5000
+HISTORY_DAYS = 2 * 365
+PAYMENT_TERMS = (15, 30, 30, 30, 45, 60)
+
+BUSINESS_WORDS = (
+    'Atelier', 'Boulangerie', 'Pharmacie', 'Quincaillerie', 'Transport', 'Imprimerie',
+    'Studio', 'Garage', 'Restaurant', 'Hôtel', 'Clinique', 'École', 'Agence', 'Dépôt',
+)
+NAMES = (
+    'Jean', 'Pierre', 'Marie', 'Joseph', 'Louis', 'Toussaint', 'Dessalines', 'Pétion',
+    'Christophe', 'Célestin', 'Baptiste', 'Étienne', 'Lafontant', 'Charles', 'Augustin',
+)
+CITIES = ('Port-au-Prince', 'Cap-Haïtien', 'Gonaïves', 'Les Cayes', 'Jacmel', 'Pétion-Ville', 'Saint-Marc')
+SERVICES = (
+    'Consulting', 'Delivery', 'Installation', 'Maintenance', 'Printing', 'Catering',
+    'Repair', 'Training', 'Translation', 'Design', 'Transport', 'Cleaning',
+)
+
+
+def _client(rng, user, index):
+    name = f'{rng.choice(BUSINESS_WORDS)} {rng.choice(NAMES)} {index}'
+    slug = name.lower().replace(' ', '.')
+    return Client(
+        user=user,
+        name=name,
+        email=f'{slug}@example.com' if rng.random() < 0.7 else None,
+        phone=f'+509 {rng.randint(2000, 4999)}-{rng.randint(0, 9999):04d}' if rng.random() < 0.8 else None,
+        city=rng.choice(CITIES),
+    )
+
+
+def _status(rng, due_date, today):
+    """Old invoices are mostly paid, recent ones drafts or sent"""
+    if due_date < today:
+        return rng.choices(('paid', 'overdue', 'canceled'), (80, 15, 5))[0]
+    return rng.choices(('draft', 'sent', 'paid'), (25, 60, 15))[0]
+
+
+def _item_count(rng, mean):
+    """At least one item, geometrically distributed around ``mean``"""
+    if mean <= 1:
+        return 1
+    return 1 + round(rng.expovariate(1 / (mean - 1)))
+
+
+def _items(rng, count):
+    items = []
+    for _ in range(count):
+        quantity = Decimal(rng.choices((1, 1, 1, 2, 3, 5, 10, 25), k=1)[0])
+        # Log-normal unit prices: mostly a few hundred, sometimes tens of thousands
+        unit_price = Decimal(str(round(min(math.exp(rng.gauss(6, 1.3)), 500_000), 2)))
+        items.append(InvoiceItem(
+            description=f'{rng.choice(SERVICES)} {rng.choice(("service", "package", "hours", "supplies"))}',
+            quantity=quantity,
+            unit_price=unit_price,
+            line_total=(quantity * unit_price).quantize(Decimal('0.01')),
+        ))
+    return items
+
+
+def _invoices(rng, user, clients, count, items_per_invoice, today):
+    """Yield unsaved invoices with their ``seeded_items``, oldest first"""
+    # Heavy-tailed client activity: a few regular clients, many occasional ones
+    weights = [rng.paretovariate(1.2) for _ in clients]
+    issue_dates = sorted(today - timedelta(days=rng.randint(0, HISTORY_DAYS)) for _ in range(count))
+    numbers = {}
+    tz = timezone.get_current_timezone()
+
+    for issue_date in issue_dates:
+        due_date = issue_date + timedelta(days=rng.choice(PAYMENT_TERMS))
+        numbers[issue_date.year] = numbers.get(issue_date.year, 0) + 1
+        items = _items(rng, _item_count(rng, items_per_invoice))
+        tax_percent = Decimal(rng.choices(('0', '10'), (40, 60))[0])
+        discount_percent = Decimal(rng.choices(('0', '5', '10'), (85, 10, 5))[0])
+        totals = expected_totals(sum(item.line_total for item in items), tax_percent, discount_percent)
+        created_at = datetime.combine(issue_date, time(rng.randint(7, 18), rng.randint(0, 59)), tz)
+
+        invoice = Invoice(
+            user=user,
+            client=rng.choices(clients, weights)[0],
+            invoice_number=format_invoice_number(issue_date.year, numbers[issue_date.year]),
+            issue_date=issue_date,
+            due_date=due_date,
+            status=_status(rng, due_date, today),
+            currency=rng.choices(('HTG', 'USD'), (80, 20))[0],
+            tax_percent=tax_percent,
+            discount_percent=discount_percent,
+            notes=rng.choice(('', '', '', 'Thank you for your business.', 'Payment by MonCash accepted.')),
+            created_at=created_at,
+            updated_at=created_at,
+            **totals,
+        )
+        invoice.seeded_items = items
+        yield invoice
+
+
+def bulk_create_backdated(model, objs, fields, batch_size=1000):
+    """
+    ``bulk_create`` ``objs`` keeping the values of their ``auto_now`` and
+    ``auto_now_add`` ``fields``, which ``bulk_create`` replaces with now()
+    """
+    values = [[getattr(obj, field) for field in fields] for obj in objs]
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    for obj, row in zip(objs, values):
+        for field, value in zip(fields, row):
+            setattr(obj, field, value)
+    # bulk_update writes the values as they are, without pre_save()
+    model.objects.bulk_update(objs, fields, batch_size=batch_size)
+    return objs
+
+
+def _write_invoices(invoices):
+    bulk_create_backdated(Invoice, invoices, ['created_at', 'updated_at'])
+    items = []
+    for invoice in invoices:
+        for item in invoice.seeded_items:
+            item.invoice = invoice
+            items.append(item)
+    InvoiceItem.objects.bulk_create(items, batch_size=1000)
+    return len(items)
+
+
+def seed_demo_data(users, clients, invoices, items, prefix='demo', password=None, seed=None):
+    """
+    Create ``users`` users with ``clients`` clients each, ``invoices`` invoices
+    per client on average and ``items`` line items per invoice on average.
+
+    Usernames are ``<prefix>-<n>``. Returns the counts of created rows.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    User = get_user_model()
+    counts = {'users': 0, 'clients': 0, 'invoices': 0, 'line_items': 0}
+
+    for user_index in range(users):
+        with transaction.atomic():
+            user = User.objects.create_user(f'{prefix}-{user_index}', password=password)
+            user_clients = Client.objects.bulk_create(
+                [_client(rng, user, index) for index in range(clients)], batch_size=1000,
+            )
+            pending = []
+            for invoice in _invoices(rng, user, user_clients, clients * invoices, items, today):
+                pending.append(invoice)
+                if len(pending) >= CHUNK_SIZE:
+                    counts['line_items'] += _write_invoices(pending)
+                    counts['invoices'] += len(pending)
+                    pending = []
+            counts['line_items'] += _write_invoices(pending)
+            counts['invoices'] += len(pending)
+
+            rebuild_summary([user])
+            rebuild_search_index([user])
+        counts['users'] += 1
+        counts['clients'] += len(user_clients)
+    return counts
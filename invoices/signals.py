@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_user_cache_version
+from .models import Client, Invoice, InvoiceItem
+from .pdf import schedule_pdf_deletion
+from .search import schedule_index
+from .summary import apply_summary_delta, to_amount
+
+
+# Set while invoices are deleted by code that updates the summary and the
+# owner's cache version for the whole batch itself (see bulk.py)
+_batched_deletes = ContextVar('batched_invoice_deletes', default=False)
+
+
+@contextmanager
+def batched_invoice_deletes():
+    """Mute the per-invoice summary and cache updates of the deletes made inside the block"""
+    token = _batched_deletes.set(True)
+    try:
+        yield
+    finally:
+        _batched_deletes.reset(token)
+
+
+@receiver(pre_save, sender=Invoice)
+def load_invoice_summary_state(sender, instance, **kwargs):
+    """Fetch the stored values of invoices that were not loaded from the database"""
+    if instance.pk and not hasattr(instance, '_summary_state'):
+        stored = (
+            Invoice.objects
+            .filter(pk=instance.pk)
+            .values_list('user_id', 'status', 'currency', 'total')
+            .first()
+        )
+        if stored:
+            instance._summary_state = stored[:3] + (to_amount(stored[3]),)
+
+
+@receiver(post_save, sender=Invoice)
+def update_invoice_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    """Move the invoice's count and amount to its current summary row"""
+    if raw:
+        return
+
+    previous = None if created else getattr(instance, '_summary_state', None)
+    current = (instance.user_id, instance.status, instance.currency, to_amount(instance.total))
+
+    if previous is None:
+        apply_summary_delta(*current[:3], 1, current[3])
+    elif previous[:3] == current[:3]:
+        apply_summary_delta(*current[:3], 0, current[3] - previous[3])
+    else:
+        apply_summary_delta(*previous[:3], -1, -previous[3])
+        apply_summary_delta(*current[:3], 1, current[3])
+
+    instance._summary_state = current
+
+
+def _deleted_with_owner(instance, origin):
+    """
+    Whether ``instance`` is being deleted along with its owner. The owner's
+    summary rows are deleted by the same cascade, before its invoices.
+    """
+    User = get_user_model()
+    if isinstance(origin, User):
+        return origin.pk == instance.user_id
+    return isinstance(origin, QuerySet) and issubclass(origin.model, User)
+
+
+@receiver(post_delete, sender=Invoice)
+def update_invoice_summary_on_delete(sender, instance, origin=None, **kwargs):
+    """Remove a deleted invoice, including cascaded deletes, from the summary"""
+    if _batched_deletes.get() or _deleted_with_owner(instance, origin):
+        return
+    user_id, status, currency, total = getattr(
+        instance,
+        '_summary_state',
+        (instance.user_id, instance.status, instance.currency, to_amount(instance.total)),
+    )
+    apply_summary_delta(user_id, status, currency, -1, -total)
+
+
+@receiver(post_delete, sender=Invoice)
+def delete_invoice_pdfs(sender, instance, **kwargs):
+    """Remove the cached PDFs of a deleted invoice, also in batched and cascaded deletes"""
+    schedule_pdf_deletion([instance.pk])
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invalidate_user_cache(sender, instance, raw=False, signal=None, **kwargs):
+    """Drop the cached pages of the owner of a changed client or invoice"""
+    if signal is post_delete and sender is Invoice and _batched_deletes.get():
+        return
+    if not raw:
+        bump_user_cache_version(instance.user_id)
+
+
+@receiver(post_save, sender=InvoiceItem)
+def invalidate_user_cache_for_item(sender, instance, raw=False, **kwargs):
+    """
+    Drop the cached pages of the owner of a changed line item.
+
+    Deletes and total changes are handled by totals.apply_line_total_delta,
+    which already knows the owner; a post_delete receiver here would also
+    turn the cascade delete of an invoice's items into one query per item.
+    """
+    if raw:
+        return
+    if InvoiceItem.invoice.is_cached(instance):
+        user_id = instance.invoice.user_id
+    else:
+        user_id = Invoice.objects.filter(pk=instance.invoice_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_user_cache_version(user_id)
+
+
+@receiver(post_save, sender=Client)
+def index_client(sender, instance, raw=False, **kwargs):
+    """Rewrite the client's search document once the transaction commits"""
+    if not raw:
+        schedule_index(client_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=InvoiceItem)
+def index_invoice(sender, instance, raw=False, **kwargs):
+    """
+    Rewrite the search document of a changed invoice, or of the invoice of a
+    changed line item, once the transaction commits. Deleted line items are
+    handled by InvoiceItem.delete().
+    """
+    if not raw:
+        schedule_index(invoice_ids=[instance.invoice_id if sender is InvoiceItem else instance.pk])
@@ -0,0 +1,106 @@
+"""
+Invoice statistics shared by the dashboards and the invoice list.
+
+Dashboards read the per-status counts and amounts from the denormalized
+UserInvoiceSummary rows. ``aggregate_invoice_stats`` computes the same figures
+in a single conditional aggregation over the user's invoices, grouped by
+currency, for callers that need them straight from the Invoice table.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from .cache import cached_for_user
+from .models import Invoice, UserInvoiceSummary
+
+
+STATUSES = [status for status, _label in Invoice.STATUS_CHOICES]
+
+
+def _aggregate_rows(user):
+    """Return one row per currency with a count and amount for every status"""
+    aggregates = {}
+    for status in STATUSES:
+        aggregates[f'{status}_count'] = Count('id', filter=Q(status=status))
+        aggregates[f'{status}_amount'] = Sum('total', filter=Q(status=status))
+
+    return (
+        Invoice.objects
+        .filter(user=user)
+        .order_by()
+        .values('currency')
+        .annotate(**aggregates)
+    )
+
+
+def build_stats(rows):
+    """
+    Fold per-currency rows into the context used by the dashboard templates.
+
+    Each row is a mapping with a ``currency`` key plus ``<status>_count`` and
+    ``<status>_amount`` keys. Counts are summed across currencies; amounts are
+    reported per currency in ``currency_totals`` and, for backwards
+    compatibility, summed across currencies in the top-level keys.
+    """
+    counts = {status: 0 for status in STATUSES}
+    currency_totals = []
+
+    for row in sorted(rows, key=lambda r: r['currency']):
+        amounts = {status: row[f'{status}_amount'] or Decimal('0') for status in STATUSES}
+        invoice_count = 0
+        for status in STATUSES:
+            counts[status] += row[f'{status}_count']
+            invoice_count += row[f'{status}_count']
+
+        if not invoice_count:
+            continue
+
+        total_amount = sum(amounts.values(), Decimal('0'))
+        currency_totals.append({
+            'currency': row['currency'],
+            'invoice_count': invoice_count,
+            'total_amount': total_amount,
+            'total_paid': amounts['paid'],
+            'total_outstanding': total_amount - amounts['paid'],
+        })
+
+    stats = {f'{status}_count': counts[status] for status in STATUSES}
+    stats['total_invoices'] = sum(counts.values())
+    stats['unpaid_count'] = stats['total_invoices'] - counts['paid']
+    stats['total_amount'] = sum((c['total_amount'] for c in currency_totals), Decimal('0'))
+    stats['total_paid'] = sum((c['total_paid'] for c in currency_totals), Decimal('0'))
+    stats['total_outstanding'] = sum((c['total_outstanding'] for c in currency_totals), Decimal('0'))
+    stats['currency_totals'] = currency_totals
+    return stats
+
+
+def _summary_rows(user):
+    """Return the summary rows for a user in the same shape as ``_aggregate_rows``"""
+    rows = {}
+    for summary in UserInvoiceSummary.objects.filter(user=user):
+        row = rows.get(summary.currency)
+        if row is None:
+            row = {'currency': summary.currency}
+            for status in STATUSES:
+                row[f'{status}_count'] = 0
+                row[f'{status}_amount'] = None
+            rows[summary.currency] = row
+        if summary.status in STATUSES:
+            row[f'{summary.status}_count'] = summary.invoice_count
+            row[f'{summary.status}_amount'] = summary.total_amount
+    return rows.values()
+
+
+def aggregate_invoice_stats(user):
+    """Return invoice counts and amounts for a user by scanning their invoices once"""
+    return build_stats(_aggregate_rows(user))
+
+
+def get_invoice_stats(user):
+    """Return invoice counts and amounts for a user from the summary table"""
+    return build_stats(_summary_rows(user))
+
+
+def get_cached_invoice_stats(user):
+    """get_invoice_stats() cached until the user's invoices change"""
+    return cached_for_user(user.pk, 'invoice-stats', lambda: get_invoice_stats(user))
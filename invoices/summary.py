@@ -0,0 +1,134 @@
+"""
+Maintenance of the denormalized UserInvoiceSummary table.
+
+Every invoice write applies a small delta to the (user, status, currency)
+row it belongs to. ``rebuild_summary`` and ``verify_summary`` recompute the
+table from the Invoice rows for repairs and consistency checks.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .cache import bump_cache_versions
+from .models import Invoice, UserInvoiceSummary
+
+
+CENT = Decimal('0.01')
+
+
+def to_amount(value):
+    """Round an in-memory amount the way the 2-decimal columns store it"""
+    return Decimal(value).quantize(CENT)
+
+
+def apply_summary_delta(user_id, status, currency, count, amount):
+    """Add ``count`` invoices and ``amount`` to a user's summary row"""
+    if not count and not amount:
+        return
+
+    rows = UserInvoiceSummary.objects.filter(user_id=user_id, status=status, currency=currency)
+    updated = rows.update(
+        invoice_count=F('invoice_count') + count,
+        total_amount=F('total_amount') + amount,
+    )
+    # A missing row is only created for invoices being added; removing from
+    # a row that is already gone (e.g. its owner is being deleted) is a no-op
+    if updated or count <= 0:
+        return
+
+    try:
+        with transaction.atomic():
+            UserInvoiceSummary.objects.create(
+                user_id=user_id,
+                status=status,
+                currency=currency,
+                invoice_count=count,
+                total_amount=amount,
+            )
+    except IntegrityError:
+        # Another transaction created the row in the meantime
+        rows.update(
+            invoice_count=F('invoice_count') + count,
+            total_amount=F('total_amount') + amount,
+        )
+
+
+def _computed_rows(users=None):
+    """Aggregate the Invoice table into summary rows keyed by (user, status, currency)"""
+    invoices = Invoice.objects.order_by()
+    if users is not None:
+        invoices = invoices.filter(user__in=users)
+
+    rows = invoices.values('user_id', 'status', 'currency').annotate(
+        invoice_count=Count('id'),
+        total_amount=Sum('total'),
+    )
+    return {
+        (row['user_id'], row['status'], row['currency']): (
+            row['invoice_count'],
+            row['total_amount'] or Decimal('0'),
+        )
+        for row in rows
+    }
+
+
+def _stored_rows(users=None):
+    summaries = UserInvoiceSummary.objects.all()
+    if users is not None:
+        summaries = summaries.filter(user__in=users)
+
+    return {
+        (summary.user_id, summary.status, summary.currency): (
+            summary.invoice_count,
+            summary.total_amount,
+        )
+        for summary in summaries
+        if summary.invoice_count or summary.total_amount
+    }
+
+
+@transaction.atomic
+def rebuild_summary(users=None):
+    """Recompute summary rows from scratch, for all users or only ``users``"""
+    summaries = UserInvoiceSummary.objects.all()
+    if users is not None:
+        summaries = summaries.filter(user__in=users)
+    affected = set(summaries.values_list('user_id', flat=True))
+    summaries.delete()
+
+    computed = _computed_rows(users)
+    UserInvoiceSummary.objects.bulk_create(
+        [
+            UserInvoiceSummary(
+                user_id=user_id,
+                status=status,
+                currency=currency,
+                invoice_count=count,
+                total_amount=amount,
+            )
+            for (user_id, status, currency), (count, amount) in computed.items()
+        ],
+        batch_size=1000,
+    )
+    # Stats cached from the previous summary rows are no longer valid
+    bump_cache_versions(affected | {user_id for user_id, _status, _currency in computed})
+    return len(computed)
+
+
+def verify_summary(users=None):
+    """
+    Compare the stored summary with the Invoice table.
+
+    Returns a list of ``(key, stored, expected)`` tuples for every
+    (user_id, status, currency) key that has drifted.
+    """
+    computed = _computed_rows(users)
+    stored = _stored_rows(users)
+    empty = (0, Decimal('0'))
+
+    return [
+        (key, stored.get(key, empty), computed.get(key, empty))
+        for key in sorted(set(computed) | set(stored))
+        if stored.get(key, empty) != computed.get(key, empty)
+    ]
@@ -0,0 +1,45 @@
+from django import template
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from invoices.cache import cached_for_user
+
+
+register = template.Library()
+
+
+class UserCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        user = context['request'].user
+        parts = [translation.get_language()] + [value.resolve(context) for value in self.vary_on]
+        content = cached_for_user(
+            user.pk,
+            self.name.resolve(context),
+            lambda: self.nodelist.render(context),
+            *parts,
+        )
+        return mark_safe(content)
+
+
+@register.tag
+def usercache(parser, token):
+    """
+    Cache a template fragment for the current user until their data changes::
+
+        {% usercache "name" [vary_on ...] %} ... {% endusercache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least one argument.")
+    nodelist = parser.parse(('endusercache',))
+    parser.delete_first_token()
+    return UserCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -1,3 +1,1802 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+
+from . import pdf, workers
+from .benchmarks import build_report, build_scenarios, compare_reports, run_client_benchmark
+from .bulk import bulk_change_status, bulk_delete
+from .cache import cache_stats, get_user_cache_version
+from .checks import check_page_cache
+from .exports import escape_formula, stream_export
+from .imports import import_clients, import_invoices
+from .models import Client, Invoice, InvoiceItem, PdfRenderJob, SearchDocument, UserInvoiceSummary
+from .numbering import allocate_invoice_number, format_invoice_number, next_invoice_number
+from .overdue import mark_overdue_invoices
+from .pagination import encode_cursor
+from .pdf_export import export_queryset, stream_invoice_zip
+from .pdf_queue import claim_jobs, enqueue_pdf
+from .search import SearchResults, rebuild_search_index
+from .seeding import seed_demo_data
+from .stats import _aggregate_rows, aggregate_invoice_stats, get_cached_invoice_stats
+from .summary import rebuild_summary, verify_summary
+from .totals import find_total_drift, repair_totals
+from .views import InvoiceListView
+from .xlsx import CONTENT_TYPE as XLSX_CONTENT_TYPE, stream_xlsx_export
+
+
+def seed_invoices(user, clients=1, invoices_per_client=1, items_per_invoice=1):
+    """Create clients, invoices and line items for ``user`` without per-row signals"""
+    today = date.today()
+    client_objs = Client.objects.bulk_create([
+        Client(user=user, name=f'Client {i}', email=f'client{i}@example.com')
+        for i in range(clients)
+    ])
+    invoice_objs = Invoice.objects.bulk_create([
+        Invoice(
+            user=user,
+            client=client,
+            invoice_number=f'INV-{client.pk}-{i:05d}',
+            issue_date=today,
+            due_date=today + timedelta(days=30),
+            status=('draft', 'sent', 'paid', 'overdue')[i % 4],
+            currency=('HTG', 'USD')[i % 2],
+            subtotal=Decimal('100.00') * items_per_invoice,
+            total=Decimal('100.00') * items_per_invoice,
+        )
+        for client in client_objs
+        for i in range(invoices_per_client)
+    ])
+    InvoiceItem.objects.bulk_create([
+        InvoiceItem(
+            invoice=invoice,
+            description=f'Item {i}',
+            quantity=Decimal('1'),
+            unit_price=Decimal('100.00'),
+            line_total=Decimal('100.00'),
+        )
+        for invoice in invoice_objs
+        for i in range(items_per_invoice)
+    ])
+    return client_objs, invoice_objs
+
+
+class QueryBudgetMixin:
+    """
+    Pin the number of queries a page runs so N+1 regressions fail loudly.
+
+    Every budget includes the session and user lookups done by the
+    authentication middleware, and must hold for every seeded data size
+    with a cold page cache.
+    """
+
+    SIZES = (1, 5, 25)
+
+    def assert_budget(self, budget, url_for):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                Client.objects.filter(user=self.user).delete()
+                clients, invoices = seed_invoices(
+                    self.user, clients=size, invoices_per_client=2, items_per_invoice=size
+                )
+                # Budgets are for a cold cache; bulk seeding does not invalidate it
+                cache.clear()
+                url = url_for(clients, invoices)
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Query budgets for the user-facing invoice and client pages"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_invoice_list(self):
+        self.assert_budget(4, lambda clients, invoices: reverse('invoice_list'))
+
+    def test_invoice_list_filtered(self):
+        self.assert_budget(4, lambda clients, invoices: reverse('invoice_list') + '?status=paid')
+
+    def test_invoice_detail(self):
+        self.assert_budget(4, lambda clients, invoices: reverse('invoice_detail', args=[invoices[0].pk]))
+
+    def test_invoice_edit(self):
+        self.assert_budget(5, lambda clients, invoices: reverse('invoice_update', args=[invoices[0].pk]))
+
+    def test_invoice_dashboard(self):
+        self.assert_budget(5, lambda clients, invoices: reverse('invoice_dashboard'))
+
+    def test_core_dashboard(self):
+        self.assert_budget(3, lambda clients, invoices: reverse('dashboard'))
+
+    def test_client_list(self):
+        self.assert_budget(3, lambda clients, invoices: reverse('client_list'))
+
+    def test_client_detail(self):
+        self.assert_budget(4, lambda clients, invoices: reverse('client_detail', args=[clients[0].pk]))
+
+
+class InvoiceStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.clients, self.invoices = seed_invoices(self.user, clients=3, invoices_per_client=5, items_per_invoice=2)
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        seed_invoices(other, clients=2, invoices_per_client=3)
+        rebuild_summary()
+
+    def assert_stats_match_invoices(self):
+        stats = get_cached_invoice_stats(self.user)
+        self.assertEqual(stats, aggregate_invoice_stats(self.user))
+
+        invoices = Invoice.objects.filter(user=self.user)
+        self.assertEqual(stats['total_invoices'], invoices.count())
+        self.assertEqual(stats['paid_count'], invoices.filter(status='paid').count())
+        self.assertEqual(stats['total_amount'], invoices.aggregate(total=Sum('total'))['total'] or 0)
+        self.assertEqual(
+            stats['total_paid'], invoices.filter(status='paid').aggregate(total=Sum('total'))['total'] or 0,
+        )
+        for row in stats['currency_totals']:
+            self.assertEqual(row['invoice_count'], invoices.filter(currency=row['currency']).count())
+        return stats
+
+    def test_aggregate_is_one_query(self):
+        with self.assertNumQueries(1):
+            aggregate_invoice_stats(self.user)
+
+    def test_cached_stats_match_a_direct_aggregate(self):
+        stats = self.assert_stats_match_invoices()
+        self.assertEqual(stats['total_invoices'], 15)
+        self.assertEqual([row['currency'] for row in stats['currency_totals']], ['HTG', 'USD'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_invoice_stats(self.user), stats)
+
+    def test_invoice_writes_invalidate_the_cached_stats(self):
+        self.assert_stats_match_invoices()
+
+        invoice = Invoice.objects.get(pk=self.invoices[0].pk)
+        invoice.status = 'paid'
+        invoice.save()
+        self.assertEqual(self.assert_stats_match_invoices()['paid_count'], 4)
+
+        item = invoice.line_items.first()
+        item.unit_price = Decimal('250.00')
+        item.save()
+        self.assert_stats_match_invoices()
+
+        Invoice.objects.create(
+            user=self.user, client=self.clients[0], invoice_number='INV-NEW',
+            issue_date=date.today(), due_date=date.today(), currency='USD',
+        )
+        self.assertEqual(self.assert_stats_match_invoices()['total_invoices'], 16)
+
+        Invoice.objects.get(pk=self.invoices[1].pk).delete()
+        self.assertEqual(self.assert_stats_match_invoices()['total_invoices'], 15)
+
+        bulk_change_status(self.user, [invoice.pk for invoice in self.invoices], 'sent')
+        self.assertEqual(self.assert_stats_match_invoices()['sent_count'], 14)
+
+
+class ClientBillingStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+
+    def test_with_billing_stats_matches_invoices(self):
+        clients, invoices = seed_invoices(self.user, clients=2, invoices_per_client=4, items_per_invoice=2)
+
+        with self.assertNumQueries(1):
+            annotated = list(Client.objects.filter(user=self.user).with_billing_stats())
+            totals = {client.pk: client.billing_totals() for client in annotated}
+
+        for client in clients:
+            client_invoices = [invoice for invoice in invoices if invoice.client_id == client.pk]
+            expected = []
+            for currency in ('HTG', 'USD'):
+                in_currency = [invoice for invoice in client_invoices if invoice.currency == currency]
+                billed = sum(invoice.total for invoice in in_currency)
+                paid = sum(invoice.total for invoice in in_currency if invoice.status == 'paid')
+                expected.append({
+                    'currency': currency,
+                    'invoice_count': len(in_currency),
+                    'billed': billed,
+                    'paid': paid,
+                    'outstanding': billed - paid,
+                })
+            self.assertEqual(totals[client.pk], expected)
+            self.assertEqual(client.invoices_count(), len(client_invoices))
+            self.assertEqual(client.total_billed(), sum(invoice.total for invoice in client_invoices))
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        _clients, invoices = seed_invoices(self.user, clients=1, invoices_per_client=8)
+        # Half of the invoices share one created_at, so ids must break the tie
+        tie = timezone.now() - timedelta(days=1)
+        for offset, invoice in enumerate(invoices):
+            created_at = tie if offset % 2 else tie + timedelta(minutes=offset)
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=created_at)
+        self.expected = list(
+            Invoice.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        paginate_by = mock.patch.object(InvoiceListView, 'paginate_by', 3)
+        paginate_by.start()
+        self.addCleanup(paginate_by.stop)
+
+    def page(self, cursor=None, **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('invoice_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj'], [invoice.pk for invoice in response.context['invoices']]
+
+    def test_next_and_previous_cursors_walk_the_list(self):
+        first, first_ids = self.page()
+        self.assertFalse(first.has_previous())
+        self.assertIsNone(first.previous_cursor)
+
+        second, second_ids = self.page(first.next_cursor)
+        third, third_ids = self.page(second.next_cursor)
+        self.assertFalse(third.has_next())
+        self.assertIsNone(third.next_cursor)
+        # Every invoice exactly once, in (-created_at, -id) order across the tie
+        self.assertEqual(first_ids + second_ids + third_ids, self.expected)
+
+        back, back_ids = self.page(third.previous_cursor)
+        self.assertEqual(back_ids, second_ids)
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+        self.assertEqual(self.page(back.previous_cursor)[1], first_ids)
+
+    def test_cursor_keeps_the_status_filter(self):
+        sent = self.expected[1::2] + self.expected[:1]
+        Invoice.objects.filter(user=self.user).update(status='draft')
+        Invoice.objects.filter(pk__in=sent).update(status='sent')
+        sent.sort(key=self.expected.index)
+
+        page, ids = self.page(status='sent')
+        self.assertEqual(ids, sent[:3])
+        self.assertEqual(self.page(page.next_cursor, status='sent')[1], sent[3:])
+
+        response = self.client.get(reverse('invoice_list'), {'status': 'sent'})
+        self.assertContains(response, f'status=sent&amp;cursor={page.next_cursor}')
+
+    def test_malformed_cursors_show_the_first_page(self):
+        first_ids = self.page()[1]
+        malformed = [
+            'garbage', '%%%', 'bg', encode_cursor('x', Invoice.objects.get(pk=self.expected[0])),
+            urlsafe_base64_encode(b'n|yesterday|1'), urlsafe_base64_encode(b'n|2026-01-01T00:00:00|x'),
+            urlsafe_base64_encode(b'\xff\xfe'),
+        ]
+        for cursor in malformed:
+            with self.subTest(cursor=cursor):
+                page, ids = self.page(cursor)
+                self.assertEqual(ids, first_ids)
+                self.assertFalse(page.has_previous())
+
+
+class InvoiceNumberingTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+
+    def test_allocation_continues_after_existing_numbers(self):
+        year = date.today().year
+        client = Client.objects.create(user=self.user, name='Client')
+        Invoice.objects.create(
+            user=self.user, client=client, invoice_number=f'INV-{year}-00007',
+            issue_date=date.today(), due_date=date.today(),
+        )
+
+        self.assertEqual(next_invoice_number(self.user), f'INV-{year}-00008')
+        self.assertEqual(allocate_invoice_number(self.user.pk), f'INV-{year}-00008')
+        self.assertEqual(allocate_invoice_number(self.user.pk), f'INV-{year}-00009')
+
+    def test_allocation_cost_is_constant(self):
+        seed_invoices(self.user, clients=5, invoices_per_client=20)
+        allocate_invoice_number(self.user.pk)
+
+        # UPDATE the sequence row and read it back, inside a savepoint
+        with self.assertNumQueries(4):
+            allocate_invoice_number(self.user.pk)
+
+    def test_blank_number_is_allocated_on_save(self):
+        client = Client.objects.create(user=self.user, name='Client')
+        numbers = {
+            Invoice.objects.create(
+                user=self.user, client=client, invoice_number='',
+                issue_date=date.today(), due_date=date.today(),
+            ).invoice_number
+            for _ in range(3)
+        }
+        self.assertEqual(len(numbers), 3)
+
+    def test_future_number_chosen_on_edit_is_not_allocated_again(self):
+        self.client.force_login(self.user)
+        customer = Client.objects.create(user=self.user, name='Client')
+        item = [{'description': 'Line', 'quantity': '1', 'unit_price': '10'}]
+        self.client.post(reverse('invoice_create'), invoice_post_data(customer, item))
+        invoice = Invoice.objects.get(user=self.user)
+        future = next_invoice_number(self.user)
+
+        existing = [{
+            'id': invoice.line_items.get().pk, 'invoice': invoice.pk,
+            'description': 'Line', 'quantity': '1', 'unit_price': '10',
+        }]
+        data = invoice_post_data(customer, [], invoice_number=future, initial_items=existing)
+        response = self.client.post(reverse('invoice_update', args=[invoice.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.invoice_number, future)
+
+        response = self.client.post(reverse('invoice_create'), invoice_post_data(customer, item))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Invoice.objects.exclude(pk=invoice.pk).get().invoice_number,
+            format_invoice_number(date.today().year, 3),
+        )
+
+    def test_future_number_typed_on_create_is_kept_and_skipped(self):
+        self.client.force_login(self.user)
+        customer = Client.objects.create(user=self.user, name='Client')
+        item = [{'description': 'Line', 'quantity': '1', 'unit_price': '10'}]
+        year = timezone.localdate().year
+        typed = format_invoice_number(year, 42)
+
+        data = invoice_post_data(customer, item, invoice_number=typed)
+        data['initial-invoice_number'] = next_invoice_number(self.user)
+        self.assertEqual(self.client.post(reverse('invoice_create'), data).status_code, 302)
+        self.assertEqual(Invoice.objects.get(user=self.user).invoice_number, typed)
+
+        response = self.client.post(reverse('invoice_create'), invoice_post_data(customer, item))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Invoice.objects.exclude(invoice_number=typed).get().invoice_number,
+            format_invoice_number(year, 43),
+        )
+
+    def test_kept_suggestion_gets_the_next_free_number(self):
+        self.client.force_login(self.user)
+        customer = Client.objects.create(user=self.user, name='Client')
+        item = [{'description': 'Line', 'quantity': '1', 'unit_price': '10'}]
+        suggestion = next_invoice_number(self.user)
+        # Another invoice takes the previewed number before the form is submitted
+        allocate_invoice_number(self.user.pk)
+
+        data = invoice_post_data(customer, item, invoice_number=suggestion)
+        data['initial-invoice_number'] = suggestion
+        self.assertEqual(self.client.post(reverse('invoice_create'), data).status_code, 302)
+        self.assertEqual(
+            Invoice.objects.get(user=self.user).invoice_number,
+            format_invoice_number(timezone.localdate().year, 2),
+        )
+
+    def test_highest_existing_number_compares_numerically(self):
+        year = timezone.localdate().year
+        client = Client.objects.create(user=self.user, name='Client')
+        Invoice.objects.bulk_create([
+            Invoice(
+                user=self.user, client=client, invoice_number=number,
+                issue_date=date.today(), due_date=date.today(),
+            )
+            for number in (f'INV-{year}-99999', f'INV-{year}-100000', f'INV-{year}-0000999999')
+        ])
+        self.assertEqual(next_invoice_number(self.user), f'INV-{year}-100001')
+
+    @override_settings(TIME_ZONE='America/Port-au-Prince')
+    def test_series_follows_the_local_year(self):
+        # 03:00 UTC on New Year's Day is still 22:00 on New Year's Eve in Port-au-Prince
+        now = datetime(2031, 1, 1, 3, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            self.assertEqual(allocate_invoice_number(self.user.pk), 'INV-2030-00001')
+
+
+def invoice_post_data(client, items, invoice_number='', initial_items=()):
+    """Build the POST payload of the invoice form with ``items`` as new line items"""
+    data = {
+        'client': client.pk,
+        'invoice_number': invoice_number,
+        'issue_date': date.today().isoformat(),
+        'due_date': (date.today() + timedelta(days=30)).isoformat(),
+        'currency': 'HTG',
+        'tax_percent': '10',
+        'discount_percent': '5',
+        'status': 'draft',
+        'notes': '',
+        'line_items-TOTAL_FORMS': str(len(initial_items) + len(items)),
+        'line_items-INITIAL_FORMS': str(len(initial_items)),
+        'line_items-MIN_NUM_FORMS': '1',
+        'line_items-MAX_NUM_FORMS': '1000',
+    }
+    rows = list(initial_items) + list(items)
+    for index, row in enumerate(rows):
+        for key, value in row.items():
+            data[f'line_items-{index}-{key}'] = value
+    return data
+
+
+class InvoiceSaveTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.customer = Client.objects.create(user=self.user, name='Wholesale Customer')
+
+    def test_create_writes_invoice_once_and_items_in_bulk(self):
+        items = [
+            {'description': f'Line {i}', 'quantity': '2', 'unit_price': '1.25'}
+            for i in range(200)
+        ]
+        data = invoice_post_data(self.customer, items)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('invoice_create'), data)
+        self.assertEqual(response.status_code, 302)
+
+        statements = [query['sql'] for query in queries]
+        invoice_writes = [
+            sql for sql in statements
+            if sql.startswith(('INSERT INTO "invoices_invoice" ', 'UPDATE "invoices_invoice" '))
+        ]
+        item_writes = [sql for sql in statements if sql.startswith('INSERT INTO "invoices_invoiceitem"')]
+        self.assertEqual(len(invoice_writes), 1)
+        self.assertLessEqual(len(item_writes), 2)
+
+        invoice = Invoice.objects.get(user=self.user)
+        self.assertEqual(invoice.line_items.count(), 200)
+        self.assertEqual(invoice.subtotal, Decimal('500.00'))
+        self.assertEqual(invoice.tax_amount, Decimal('50.00'))
+        self.assertEqual(invoice.discount_amount, Decimal('25.00'))
+        self.assertEqual(invoice.total, Decimal('525.00'))
+
+    def test_edit_updates_adds_and_deletes_items(self):
+        self.client.post(reverse('invoice_create'), invoice_post_data(self.customer, [
+            {'description': 'Keep', 'quantity': '1', 'unit_price': '10'},
+            {'description': 'Change', 'quantity': '1', 'unit_price': '10'},
+            {'description': 'Drop', 'quantity': '1', 'unit_price': '10'},
+        ]))
+        invoice = Invoice.objects.get(user=self.user)
+        keep, change, drop = invoice.line_items.order_by('pk')
+
+        existing = [
+            {'id': keep.pk, 'invoice': invoice.pk, 'description': 'Keep', 'quantity': '1', 'unit_price': '10'},
+            {'id': change.pk, 'invoice': invoice.pk, 'description': 'Changed', 'quantity': '3', 'unit_price': '10'},
+            {'id': drop.pk, 'invoice': invoice.pk, 'description': 'Drop', 'quantity': '1', 'unit_price': '10',
+             'DELETE': 'on'},
+        ]
+        data = invoice_post_data(
+            self.customer,
+            [{'description': 'New', 'quantity': '2', 'unit_price': '5'}],
+            invoice_number=invoice.invoice_number,
+            initial_items=existing,
+        )
+        response = self.client.post(reverse('invoice_update', args=[invoice.pk]), data)
+        self.assertEqual(response.status_code, 302)
+
+        invoice.refresh_from_db()
+        self.assertEqual(
+            sorted(invoice.line_items.values_list('description', 'line_total')),
+            [('Changed', Decimal('30.00')), ('Keep', Decimal('10.00')), ('New', Decimal('10.00'))],
+        )
+        self.assertEqual(invoice.subtotal, Decimal('50.00'))
+        self.assertEqual(invoice.total, Decimal('52.50'))
+
+    def test_invalid_items_do_not_create_an_invoice(self):
+        data = invoice_post_data(self.customer, [{'description': 'No price', 'quantity': '1', 'unit_price': ''}])
+        response = self.client.post(reverse('invoice_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Invoice.objects.exists())
+
+
+class InvoiceSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client_obj = Client.objects.create(user=self.user, name='Client')
+
+    def create_invoice(self, number, total, status='draft', currency='HTG'):
+        invoice = Invoice(
+            user=self.user, client=self.client_obj, invoice_number=number,
+            issue_date=date.today(), due_date=date.today(),
+            status=status, currency=currency, subtotal=Decimal(total), total=Decimal(total),
+        )
+        invoice.save(update_totals=False)
+        return invoice
+
+    def summary(self):
+        return {
+            (row.status, row.currency): (row.invoice_count, row.total_amount)
+            for row in UserInvoiceSummary.objects.filter(user=self.user)
+            if row.invoice_count or row.total_amount
+        }
+
+    def test_create_adds_to_the_summary(self):
+        self.create_invoice('INV-1', '100.00')
+        self.create_invoice('INV-2', '50.00')
+        self.create_invoice('INV-3', '10.00', currency='USD')
+
+        self.assertEqual(self.summary(), {
+            ('draft', 'HTG'): (2, Decimal('150.00')),
+            ('draft', 'USD'): (1, Decimal('10.00')),
+        })
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_status_and_currency_changes_move_the_invoice(self):
+        invoice = self.create_invoice('INV-1', '100.00')
+        self.create_invoice('INV-2', '50.00')
+
+        invoice.status = 'paid'
+        invoice.save(update_totals=False)
+        self.assertEqual(self.summary(), {
+            ('draft', 'HTG'): (1, Decimal('50.00')),
+            ('paid', 'HTG'): (1, Decimal('100.00')),
+        })
+
+        # An instance not loaded from the database moves from its stored row
+        stale = Invoice.objects.get(pk=invoice.pk)
+        del stale._summary_state
+        stale.currency = 'USD'
+        stale.save(update_totals=False)
+        self.assertEqual(self.summary(), {
+            ('draft', 'HTG'): (1, Decimal('50.00')),
+            ('paid', 'USD'): (1, Decimal('100.00')),
+        })
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_delete_removes_the_invoice(self):
+        invoice = self.create_invoice('INV-1', '100.00')
+        self.create_invoice('INV-2', '50.00')
+
+        invoice.delete()
+        self.assertEqual(self.summary(), {('draft', 'HTG'): (1, Decimal('50.00'))})
+
+        # Cascaded deletes are removed too
+        self.client_obj.delete()
+        self.assertEqual(self.summary(), {})
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_rebuild_repairs_drift(self):
+        self.create_invoice('INV-1', '100.00', status='sent')
+        UserInvoiceSummary.objects.filter(user=self.user).update(invoice_count=7, total_amount=Decimal('1.00'))
+        UserInvoiceSummary.objects.create(
+            user=self.user, status='paid', currency='USD', invoice_count=1, total_amount=Decimal('5.00'),
+        )
+        self.assertEqual(len(verify_summary([self.user])), 2)
+
+        self.assertEqual(rebuild_summary([self.user]), 1)
+        self.assertEqual(self.summary(), {('sent', 'HTG'): (1, Decimal('100.00'))})
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_deleting_a_user_with_invoices(self):
+        self.create_invoice('INV-1', '100.00')
+        self.create_invoice('INV-2', '50.00', status='paid')
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('profile_delete'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(UserInvoiceSummary.objects.exists())
+        # No summary row may point at the deleted user once the transaction commits
+        connection.check_constraints()
+
+    def test_removing_from_a_missing_row_does_not_create_it(self):
+        invoice = self.create_invoice('INV-1', '100.00')
+        UserInvoiceSummary.objects.all().delete()
+
+        invoice.delete()
+        self.assertFalse(UserInvoiceSummary.objects.exists())
+
+
+class IncrementalTotalsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        client = Client.objects.create(user=self.user, name='Client')
+        self.invoice = Invoice.objects.create(
+            user=self.user, client=client, invoice_number='INV-1',
+            issue_date=date.today(), due_date=date.today(),
+            tax_percent=Decimal('10'), discount_percent=Decimal('5'),
+        )
+        self.invoice.save()
+
+    def assert_totals(self, subtotal):
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.subtotal, Decimal(subtotal))
+        self.assertEqual(self.invoice.total, Decimal(subtotal) * Decimal('1.05'))
+        self.assertEqual(list(find_total_drift(Invoice.objects.filter(pk=self.invoice.pk))), [])
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_item_save_and_delete_shift_totals(self):
+        first = InvoiceItem.objects.create(invoice=self.invoice, description='A', quantity=2, unit_price=10)
+        second = InvoiceItem.objects.create(invoice=self.invoice, description='B', quantity=1, unit_price=40)
+        self.assert_totals('60.00')
+
+        first.quantity = 5
+        first.save()
+        self.assert_totals('90.00')
+
+        second.delete()
+        self.assert_totals('50.00')
+
+    def test_item_save_cost_does_not_depend_on_item_count(self):
+        for i in range(30):
+            InvoiceItem.objects.create(invoice=self.invoice, description=str(i), quantity=1, unit_price=1)
+        item = InvoiceItem.objects.select_related('invoice').filter(invoice=self.invoice).first()
+        item.unit_price = Decimal('3')
+
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        self.assertFalse(any('SUM(' in query['sql'] for query in queries))
+        self.assertLess(len(queries), 12)
+        self.assert_totals('32.00')
+
+    def stored_totals(self):
+        """The totals as the database stores them, bypassing the ORM's rounding on read"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT subtotal, tax_amount, discount_amount, total FROM invoices_invoice WHERE id = %s',
+                [self.invoice.pk],
+            )
+            return [Decimal(str(value)) for value in cursor.fetchone()]
+
+    def test_item_edits_store_rounded_totals(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(tax_percent=Decimal('8.25'), discount_percent=Decimal('3.35'))
+        self.invoice.refresh_from_db()
+        first = InvoiceItem.objects.create(invoice=self.invoice, description='A', quantity=1, unit_price='13.37')
+        InvoiceItem.objects.create(invoice=self.invoice, description='B', quantity=3, unit_price='0.99')
+        first.unit_price = Decimal('13.41')
+        first.save()
+
+        for value in self.stored_totals():
+            self.assertEqual(value, value.quantize(Decimal('0.01')))
+        self.assertEqual(list(find_total_drift(Invoice.objects.filter(pk=self.invoice.pk))), [])
+        self.assertEqual(verify_summary([self.user]), [])
+
+        # A full save recomputes the same totals and leaves the summary alone
+        self.invoice.refresh_from_db()
+        self.invoice.save()
+        self.assertEqual(self.stored_totals()[3], Decimal('17.18'))
+        self.assertEqual(verify_summary([self.user]), [])
+
+    def test_reconcile_repairs_drift(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='A', quantity=2, unit_price=10)
+        Invoice.objects.filter(pk=self.invoice.pk).update(subtotal=Decimal('1.00'), total=Decimal('1.00'))
+
+        self.assertEqual(len(list(find_total_drift())), 1)
+        self.assertEqual(repair_totals(), 1)
+        self.assert_totals('20.00')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Checks SQLite query plans')
+class InvoiceIndexTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.clients, _invoices = seed_invoices(self.user, clients=3, invoices_per_client=10)
+
+    def assert_plan(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index}\b')
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_hot_queries_use_their_indexes(self):
+        invoices = Invoice.objects.filter(user=self.user)
+        today = date.today()
+        cases = {
+            'invoice_user_created_idx': invoices.order_by('-created_at', '-id')[:51],
+            'invoice_user_status_idx': invoices.filter(status='paid').order_by('-created_at', '-id')[:51],
+            'invoice_user_totals_idx': _aggregate_rows(self.user),
+            'invoice_user_unpaid_due_idx': (
+                invoices.exclude(status='paid').filter(due_date__lt=today).order_by('due_date')[:51]
+            ),
+            'invoice_client_created_idx': Invoice.objects.filter(client=self.clients[0]).order_by('-created_at')[:51],
+            'client_user_created_idx': Client.objects.filter(user=self.user).order_by('-created_at', '-id')[:51],
+        }
+        for index, queryset in cases.items():
+            with self.subTest(index=index):
+                self.assert_plan(queryset, index)
+
+    def test_overdue_sweep_uses_the_status_due_index(self):
+        plan = Invoice.objects.filter(status='sent', due_date__lt=date.today()).explain()
+        self.assertIn('INDEX invoice_status_due_idx', plan)
+
+    def test_benchmark_command_runs_and_rolls_back(self):
+        invoices = Invoice.objects.count()
+        output = io.StringIO()
+        call_command('benchmark_indexes', invoices=200, users=2, iterations=1, stdout=output)
+
+        report = output.getvalue()
+        self.assertIn('USING INDEX invoice_user_created_idx', report)
+        self.assertIn('Summary (median ms)', report)
+        self.assertIn('list first page', report)
+        # The seeded rows and the dropped indexes are rolled back
+        self.assertEqual(Invoice.objects.count(), invoices)
+        self.assert_plan(Invoice.objects.filter(user=self.user).order_by('-created_at', '-id'), 'invoice_user_created_idx')
+
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """The admin changelists must not query the client or owner of every row"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_invoice_changelist(self):
+        self.assert_budget(5, lambda clients, invoices: reverse('admin:invoices_invoice_changelist'))
+
+    def test_invoice_item_changelist(self):
+        self.assert_budget(5, lambda clients, invoices: reverse('admin:invoices_invoiceitem_changelist'))
+
+    def test_client_changelist(self):
+        self.assert_budget(6, lambda clients, invoices: reverse('admin:invoices_client_changelist'))
+
+
+class PdfQueueTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir.name, PDF_ASYNC_RENDERING=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        _clients, (self.invoice,) = seed_invoices(self.user)
+        self.invoice = Invoice.objects.select_related('client').get(pk=self.invoice.pk)
+
+    def test_enqueue_is_idempotent_per_version(self):
+        first = enqueue_pdf(self.invoice)
+        self.assertEqual(enqueue_pdf(self.invoice).pk, first.pk)
+
+        self.invoice.notes = 'Changed'
+        self.invoice.save(update_totals=False)
+        second = enqueue_pdf(self.invoice)
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(list(PdfRenderJob.objects.values_list('pk', flat=True)), [second.pk])
+
+    def test_jobs_are_claimed_once(self):
+        job = enqueue_pdf(self.invoice)
+        self.assertEqual(claim_jobs(limit=5), [job.pk])
+        self.assertEqual(claim_jobs(limit=5), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PdfRenderJob.STATUS_RUNNING, 1))
+
+    def test_view_returns_202_until_rendered(self):
+        url = reverse('invoice_pdf', args=[self.invoice.pk])
+        with mock.patch.object(pdf, 'WEASYPRINT_INSTALLED', True):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], reverse('invoice_pdf_status', args=[self.invoice.pk]))
+        self.assertEqual(self.client.get(response['Location']).json()['status'], PdfRenderJob.STATUS_PENDING)
+
+        # Simulate the worker having rendered the current version
+        pdf.cached_pdf_path(self.invoice).write_bytes(b'%PDF-1.4 cached')
+        self.assertTrue(self.client.get(response['Location']).json()['ready'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 cached')
+
+
+    @override_settings(PDF_ASYNC_RENDERING=False)
+    def test_missing_pdf_is_rendered_in_the_request(self):
+        def render_to_cache(invoice):
+            path = pdf.cached_pdf_path(invoice)
+            path.write_bytes(b'%PDF-1.4 rendered')
+            return path
+
+        with mock.patch.object(pdf, 'WEASYPRINT_INSTALLED', True), \
+                mock.patch('invoices.pdf.render_to_cache', side_effect=render_to_cache) as render:
+            response = self.client.get(reverse('invoice_pdf', args=[self.invoice.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 rendered')
+        render.assert_called_once()
+
+    def test_cached_pdfs_are_removed_with_the_invoice(self):
+        cache = Path(self.cache_dir.name)
+        own = [cache / f'{self.invoice.pk}-old.pdf', pdf.cached_pdf_path(self.invoice)]
+        others = [cache / f'{self.invoice.pk}0-other.pdf', cache / f'{self.invoice.pk}-render.tmp']
+        for path in own + others:
+            path.write_bytes(b'%PDF')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.delete()
+        self.assertEqual([path.exists() for path in own + others], [False, False, True, True])
+
+    def test_bulk_deleted_invoices_lose_their_cached_pdfs(self):
+        path = pdf.cached_pdf_path(self.invoice)
+        path.write_bytes(b'%PDF')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_delete(self.user, [self.invoice.pk])
+        self.assertFalse(path.exists())
+
+
+class PdfExportTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        _clients, self.invoices = seed_invoices(self.user, clients=2, invoices_per_client=2)
+        # Pretend every PDF was already rendered by the worker
+        for invoice in export_queryset(self.user):
+            pdf.cached_pdf_path(invoice).write_bytes(f'%PDF {invoice.invoice_number}'.encode())
+
+    def test_stream_zip_contains_filtered_invoices(self):
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_invoice_zip(export_queryset(self.user, status='draft')))))
+        drafts = Invoice.objects.filter(user=self.user, status='draft')
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'invoice_{invoice.invoice_number}.pdf' for invoice in drafts),
+        )
+        for invoice in drafts:
+            self.assertEqual(
+                archive.read(f'invoice_{invoice.invoice_number}.pdf'),
+                f'%PDF {invoice.invoice_number}'.encode(),
+            )
+
+    def test_export_view_streams_zip(self):
+        with mock.patch.object(pdf, 'WEASYPRINT_INSTALLED', True):
+            response = self.client.get(reverse('invoice_export_pdf'), {'client': self.invoices[0].client_id})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 2)
+
+    def test_render_failure_is_reported_before_streaming(self):
+        invoice = self.invoices[0]
+        pdf.cached_pdf_path(invoice).unlink()
+        with mock.patch.object(pdf, 'WEASYPRINT_INSTALLED', True), \
+                mock.patch('invoices.pdf_export.render_to_cache', side_effect=RuntimeError('render failed')), \
+                self.assertLogs('invoices.views', 'ERROR'):
+            response = self.client.get(reverse('invoice_export_pdf'))
+        self.assertRedirects(response, reverse('invoice_list'), fetch_redirect_response=False)
+
+    def test_entry_names_cannot_leave_the_archive(self):
+        first, second = self.invoices[:2]
+        Invoice.objects.filter(pk=first.pk).update(invoice_number='../../etc/passwd')
+        Invoice.objects.filter(pk=second.pk).update(invoice_number='..-..-etc-passwd')
+        for invoice in export_queryset(self.user).filter(pk__in=[first.pk, second.pk]):
+            pdf.cached_pdf_path(invoice).write_bytes(b'%PDF')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_invoice_zip(export_queryset(self.user)))))
+        names = archive.namelist()
+        self.assertIn('invoice_.-.-etc-passwd.pdf', names)
+        self.assertIn(f'invoice_.-.-etc-passwd_{second.pk}.pdf', names)
+        self.assertEqual(len(set(names)), len(self.invoices))
+        self.assertFalse(any('/' in name or '..' in name for name in names))
+
+
+    @override_settings(PDF_EXPORT_MAX_INVOICES=3)
+    def test_export_view_caps_the_selection(self):
+        with mock.patch.object(pdf, 'WEASYPRINT_INSTALLED', True), \
+                mock.patch('invoices.views.stream_invoice_zip') as stream:
+            response = self.client.get(reverse('invoice_export_pdf'), follow=True)
+        self.assertRedirects(response, reverse('invoice_list'))
+        self.assertContains(response, 'Select at most 3 invoices')
+        stream.assert_not_called()
+
+    def test_pdf_removed_while_streaming_is_rendered_again(self):
+        invoice = export_queryset(self.user).first()
+        chunks = stream_invoice_zip(export_queryset(self.user))
+        # A concurrent render of a newer version dropped this one
+        pdf.cached_pdf_path(invoice).unlink()
+
+        def render_to_cache(invoice):
+            path = pdf.cached_pdf_path(invoice)
+            path.write_bytes(b'%PDF rendered again')
+            return path
+
+        with mock.patch('invoices.pdf_export.render_to_cache', side_effect=render_to_cache):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(archive.read(f'invoice_{invoice.invoice_number}.pdf'), b'%PDF rendered again')
+        self.assertEqual(len(archive.namelist()), len(self.invoices))
+
+    def test_requests_share_one_worker_pool(self):
+        with mock.patch('invoices.workers.process_pool', side_effect=lambda processes: mock.Mock()) as start:
+            pool = workers.shared_process_pool(3)
+            self.assertIs(workers.shared_process_pool(3), pool)
+            workers.discard_shared_process_pool(3)
+            self.assertIsNot(workers.shared_process_pool(3), pool)
+            workers.discard_shared_process_pool(3)
+        self.assertEqual(start.call_count, 2)
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+class PdfResourceTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf.downscaled_image.cache_clear()
+
+        self.logo = Path(self.media_root.name) / 'logos' / 'logo.png'
+        self.logo.parent.mkdir()
+        Image.new('RGB', (2000, 1000), 'red').save(self.logo)
+
+    def test_logo_is_read_from_disk_and_downscaled_once(self):
+        url = 'http://localhost/media/logos/logo.png'
+        for _ in range(3):
+            fetched = pdf.fetch_local_url(url)
+        self.assertEqual(fetched['mime_type'], 'image/png')
+        with Image.open(io.BytesIO(fetched['string'])) as image:
+            self.assertEqual(image.size, (320, 160))
+        self.assertEqual(pdf.downscaled_image.cache_info().misses, 1)
+
+        # A replaced logo is decoded again
+        Image.new('RGB', (100, 100), 'blue').save(self.logo)
+        os.utime(self.logo, ns=(time.time_ns() + 10**9,) * 2)
+        with Image.open(io.BytesIO(pdf.fetch_local_url(url)['string'])) as image:
+            self.assertEqual(image.size, (100, 100))
+
+    def test_only_local_static_and_media_files_are_fetched(self):
+        self.assertIsNone(pdf.fetch_local_url('http://localhost/media/../../etc/passwd'))
+        self.assertIsNone(pdf.fetch_local_url('https://example.com/logo.png'))
+        self.assertEqual(
+            pdf.fetch_local_url('http://localhost/static/css/invoice_pdf.css')['mime_type'], 'text/css'
+        )
+
+
+class CsvExportTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        seed_invoices(self.user, clients=2, invoices_per_client=4, items_per_invoice=3)
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_header_is_sent_before_any_query(self):
+        chunks = stream_export('line-items', self.user)
+        with self.assertNumQueries(0):
+            header = next(chunks)
+        self.assertTrue(header.startswith('invoice_number,client,'))
+        self.assertEqual(len(list(csv.reader(io.StringIO(''.join(chunks))))), 24)
+
+    def test_exports_apply_status_filter(self):
+        rows = self.read_csv(self.client.get(reverse('export_csv', args=['invoices']), {'status': 'paid'}))
+        self.assertEqual(rows[0][:2], ['invoice_number', 'client'])
+        self.assertEqual(len(rows) - 1, 2)
+        self.assertTrue(all(row[4] == 'paid' for row in rows[1:]))
+
+        rows = self.read_csv(self.client.get(reverse('export_csv', args=['line-items']), {'status': 'paid'}))
+        self.assertEqual(len(rows) - 1, 6)
+
+        rows = self.read_csv(self.client.get(reverse('export_csv', args=['clients'])))
+        self.assertEqual(len(rows) - 1, 2)
+
+    def test_unknown_dataset_is_404(self):
+        self.assertEqual(self.client.get(reverse('export_csv', args=['users'])).status_code, 404)
+
+    def test_formula_like_text_is_escaped_and_imported_back(self):
+        customer = Client.objects.filter(user=self.user).first()
+        customer.name = '=HYPERLINK("http://evil.example","Open")'
+        customer.phone = '+509 2940-4000'
+        customer.notes = "'@cmd"
+        customer.save()
+        InvoiceItem.objects.filter(invoice__client=customer).update(description='-2+3')
+
+        rows = csv.reader(io.StringIO(''.join(stream_export('clients', self.user))))
+        (name, _email, phone, *_rest, notes, _created), = [row for row in rows if row[0].startswith("'")]
+        self.assertEqual(name, '\'=HYPERLINK("http://evil.example","Open")')
+        self.assertEqual((phone, notes), ("'+509 2940-4000", "''@cmd"))
+        # Amounts are numbers, not text, and keep their sign
+        self.assertEqual(escape_formula(Decimal('-5.00')), Decimal('-5.00'))
+
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        clients_csv = ''.join(stream_export('clients', self.user))
+        items_csv = ''.join(stream_export('line-items', self.user, client=customer))
+        self.assertEqual(import_clients(other, io.StringIO(clients_csv)).errors, [])
+        imported = Client.objects.get(user=other, name=customer.name)
+        self.assertEqual((imported.phone, imported.notes), (customer.phone, customer.notes))
+        result = import_invoices(other, io.StringIO(items_csv))
+        self.assertEqual((result.created, result.errors), (4, []))
+        self.assertEqual(
+            set(InvoiceItem.objects.filter(invoice__user=other).values_list('description', flat=True)), {'-2+3'},
+        )
+
+    def read_xlsx(self, chunks):
+        """The cells of the workbook's sheet as ``[(type, text)]`` rows"""
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as workbook:
+            self.assertIn('[Content_Types].xml', workbook.namelist())
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        return [
+            [(cell.get('t', 'n'), ''.join(cell.itertext())) for cell in row.findall('s:c', namespace)]
+            for row in sheet.iterfind('s:sheetData/s:row', namespace)
+        ]
+
+    def test_xlsx_export_has_the_rows_of_the_csv_export(self):
+        customer = Client.objects.filter(user=self.user).first()
+        customer.name = '=1+1 & <Sons>\x01'
+        customer.save()
+        chunks = stream_xlsx_export('invoices', self.user, status='paid')
+        with self.assertNumQueries(0):
+            next(chunks)
+        rows = self.read_xlsx(chunks)
+
+        csv_rows = list(csv.reader(io.StringIO(''.join(stream_export('invoices', self.user, status='paid')))))
+        self.assertEqual(len(rows), len(csv_rows))
+        self.assertEqual([text for _type, text in rows[0]], csv_rows[0])
+        for row, csv_row in zip(rows[1:], csv_rows[1:]):
+            # Control characters XML cannot hold are dropped
+            texts = [text for _type, text in row]
+            self.assertEqual(texts[:6], [value.removeprefix("'").replace('\x01', '') for value in csv_row[:6]])
+            # Amounts are numeric cells, text is never a formula
+            self.assertEqual(row[11][0], 'n')
+            self.assertEqual(Decimal(row[11][1]), Decimal(csv_row[11]))
+            self.assertTrue(all(cell_type in ('n', 'inlineStr') for cell_type, _text in row))
+        self.assertIn(('inlineStr', '=1+1 & <Sons>'), [row[1] for row in rows[1:]])
+
+    def test_xlsx_export_view(self):
+        response = self.client.get(reverse('export_xlsx', args=['line-items']), {'status': 'paid'})
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertIn('line-items.xlsx', response['Content-Disposition'])
+        self.assertEqual(len(self.read_xlsx(response.streaming_content)) - 1, 6)
+        self.assertEqual(self.client.get(reverse('export_xlsx', args=['users'])).status_code, 404)
+
+    def test_csv_and_pdf_exports_select_the_same_invoices(self):
+        customer = Client.objects.filter(user=self.user).first()
+        Invoice.objects.filter(user=self.user).update(issue_date=date.today() - timedelta(days=10))
+        Invoice.objects.filter(user=self.user, client=customer, status='paid').update(issue_date=date.today())
+        filter_sets = [
+            {},
+            {'status': 'paid'},
+            {'client': customer},
+            {'date_from': date.today() - timedelta(days=1)},
+            {'date_to': date.today() - timedelta(days=1), 'status': 'draft'},
+        ]
+        for filters in filter_sets:
+            with self.subTest(filters=filters):
+                csv_rows = list(csv.reader(io.StringIO(''.join(stream_export('invoices', self.user, **filters)))))
+                pdf_numbers = [invoice.invoice_number for invoice in export_queryset(self.user, **filters)]
+                self.assertEqual([row[0] for row in csv_rows[1:]], pdf_numbers)
+
+
+class CsvImportTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_clients_are_imported_with_row_errors(self):
+        lines = io.StringIO(
+            'name,email,city\n'
+            'Acme,acme@example.com,Jacmel\n'
+            ',nobody@example.com,Cap-Haitien\n'
+            'Beta,not-an-email,\n'
+        )
+        result = import_clients(self.user, lines)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _message in result.errors], [3, 4])
+        self.assertEqual(Client.objects.get(user=self.user).country, 'Haiti')
+
+    def test_invoices_are_grouped_numbered_and_totalled(self):
+        Client.objects.create(user=self.user, name='Acme')
+        lines = io.StringIO(
+            'invoice_number,client,issue_date,tax_percent,description,quantity,unit_price\n'
+            'A-1,Acme,2026-01-05,10,Design,2,50\n'
+            'A-1,Acme,2026-01-05,10,Hosting,1,30.50\n'
+            ',acme,2026-01-06,,Support,3,10\n'
+            ',Unknown,2026-01-06,,Support,1,10\n'
+            'A-2,Acme,not-a-date,,Support,1,10\n'
+        )
+        with CaptureQueriesContext(connection) as queries:
+            result = import_invoices(self.user, lines, chunk_size=1)
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _message in result.errors], [5, 6])
+
+        first = Invoice.objects.get(user=self.user, invoice_number='A-1')
+        self.assertEqual((first.subtotal, first.tax_amount, first.total), (
+            Decimal('130.50'), Decimal('13.05'), Decimal('143.55')
+        ))
+        self.assertEqual(first.due_date, date(2026, 2, 4))
+        self.assertEqual(first.line_items.count(), 2)
+        second = Invoice.objects.get(user=self.user, client__name='Acme', issue_date=date(2026, 1, 6))
+        self.assertEqual(second.invoice_number, format_invoice_number(date.today().year, 1))
+        self.assertEqual(list(find_total_drift(Invoice.objects.filter(user=self.user))), [])
+        self.assertEqual(verify_summary([self.user]), [])
+        self.assertLess(len(queries), 25)
+
+    @override_settings(TIME_ZONE='America/Port-au-Prince')
+    def test_defaults_follow_the_local_date(self):
+        Client.objects.create(user=self.user, name='Acme')
+        # 03:00 UTC on New Year's Day is still New Year's Eve in Port-au-Prince
+        now = datetime(2031, 1, 1, 3, 0, tzinfo=dt_timezone.utc)
+        lines = io.StringIO('client,description,unit_price\nAcme,Support,10\n')
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            result = import_invoices(self.user, lines)
+        self.assertEqual(result.created, 1)
+        invoice = Invoice.objects.get(user=self.user)
+        self.assertEqual(invoice.issue_date, date(2030, 12, 31))
+        self.assertEqual(invoice.invoice_number, 'INV-2030-00001')
+
+    def test_series_numbers_are_kept_and_reserved(self):
+        customer = Client.objects.create(user=self.user, name='Acme')
+        year = timezone.localdate().year
+        past, current = format_invoice_number(year - 1, 7), format_invoice_number(year, 42)
+        allocate_invoice_number(self.user.pk, year - 1)
+        lines = io.StringIO(
+            'invoice_number,client,description,unit_price\n'
+            f'{past},Acme,Old work,10\n'
+            f'{current},Acme,Support,10\n'
+            ',Acme,Hosting,10\n'
+        )
+        result = import_invoices(self.user, lines)
+        self.assertEqual((result.created, result.errors), (3, []))
+        self.assertEqual(
+            set(Invoice.objects.filter(user=self.user).values_list('invoice_number', flat=True)),
+            {past, current, format_invoice_number(year, 43)},
+        )
+
+        self.assertEqual(allocate_invoice_number(self.user.pk, year - 1), format_invoice_number(year - 1, 8))
+        invoice = Invoice.objects.create(
+            user=self.user, client=customer, invoice_number='',
+            issue_date=date.today(), due_date=date.today(),
+        )
+        self.assertEqual(invoice.invoice_number, format_invoice_number(year, 44))
+
+    def test_duplicate_invoice_numbers_are_rejected(self):
+        _clients, (invoice,) = seed_invoices(self.user)
+        lines = io.StringIO(f'invoice_number,client,description,unit_price\n{invoice.invoice_number},Client 0,X,1\n')
+        result = import_invoices(self.user, lines)
+        self.assertEqual(result.created, 0)
+        self.assertIn('invoice_number', result.errors[0][1])
+
+    def test_upload_view_reports_result(self):
+        upload = SimpleUploadedFile('clients.csv', b'\xef\xbb\xbfname\nAcme\n', content_type='text/csv')
+        response = self.client.post(reverse('import_csv'), {'dataset': 'clients', 'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertTrue(Client.objects.filter(user=self.user, name='Acme').exists())
+
+
+class OverdueSweepTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        seed_invoices(self.user, clients=3, invoices_per_client=8)
+        rebuild_summary([self.user])
+        Invoice.objects.filter(user=self.user).update(due_date=timezone.localdate() - timedelta(days=1))
+
+    def test_sweep_is_set_based_and_idempotent(self):
+        sent = Invoice.objects.filter(user=self.user, status='sent').count()
+        self.assertGreater(sent, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(mark_overdue_invoices(batch_size=2), sent)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "invoices_invoice"')]
+        self.assertEqual(len(updates), -(-sent // 2))
+
+        self.assertFalse(Invoice.objects.filter(user=self.user, status='sent').exists())
+        self.assertEqual(verify_summary([self.user]), [])
+        self.assertEqual(mark_overdue_invoices(), 0)
+
+    def test_invoices_not_yet_due_are_left_alone(self):
+        Invoice.objects.filter(user=self.user).update(due_date=timezone.localdate())
+        self.assertEqual(mark_overdue_invoices(), 0)
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.clients, self.invoices = seed_invoices(self.user, clients=3, invoices_per_client=2)
+        rebuild_summary([self.user])
+
+    def test_warm_pages_skip_the_database(self):
+        for name in ('invoice_dashboard', 'client_list', 'dashboard'):
+            with self.subTest(page=name):
+                self.client.get(reverse(name))
+                # Only the session and user lookups remain
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+        hits, misses, _rate = cache_stats()['invoice-stats']
+        self.assertEqual((hits, misses), (3, 1))
+
+    def test_writes_invalidate_cached_pages(self):
+        self.assertEqual(self.client.get(reverse('invoice_dashboard')).context['paid_count'], 0)
+
+        invoice = Invoice.objects.filter(user=self.user, status='draft').first()
+        self.client.get(reverse('invoice_change_status', args=[invoice.pk, 'paid']))
+        response = self.client.get(reverse('invoice_dashboard'))
+        self.assertEqual(response.context['paid_count'], 1)
+
+        Client.objects.create(user=self.user, name='Newest client')
+        self.assertContains(self.client.get(reverse('client_list')), 'Newest client')
+        self.assertContains(self.client.get(reverse('invoice_dashboard')), 'Newest client')
+
+        item = InvoiceItem.objects.filter(invoice__user=self.user).latest('invoice_id')
+        item.unit_price = Decimal('999.00')
+        item.save()
+        self.assertContains(self.client.get(reverse('invoice_dashboard')), '999.00')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_zero_timeout_turns_the_cache_off(self):
+        self.client.get(reverse('client_list'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('client_list'))
+        self.assertEqual(cache_stats()['client-list'], (0, 0, None))
+
+    def test_check_rejects_a_process_local_page_cache(self):
+        self.assertEqual([error.id for error in check_page_cache(None)], ['invoices.E001'])
+        with override_settings(PAGE_CACHE_TIMEOUT=0):
+            self.assertEqual(check_page_cache(None), [])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_page_cache(None), [])
+
+    def test_other_users_are_not_invalidated(self):
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        version = get_user_cache_version(other.pk)
+        Client.objects.create(user=self.user, name='Mine')
+        self.assertEqual(get_user_cache_version(other.pk), version)
+
+
+class DemoDataTests(TestCase):
+
+    def test_seeded_data_is_consistent(self):
+        counts = seed_demo_data(users=2, clients=5, invoices=4, items=3, seed=1)
+        self.assertEqual(counts['users'], 2)
+        self.assertEqual(counts['clients'], 10)
+        self.assertEqual(counts['invoices'], 40)
+        self.assertEqual(InvoiceItem.objects.count(), counts['line_items'])
+        self.assertGreaterEqual(counts['line_items'], 40)
+
+        self.assertEqual(list(find_total_drift(Invoice.objects.all())), [])
+        self.assertEqual(verify_summary(), [])
+        numbers = Invoice.objects.filter(user__username='demo-0').values_list('invoice_number', flat=True)
+        self.assertEqual(len(set(numbers)), 20)
+        # Issue dates are spread over the history instead of all being today
+        self.assertGreater(Invoice.objects.values('issue_date').distinct().count(), 1)
+        self.assertFalse(Invoice.objects.filter(created_at__date__gt=timezone.localdate()).exists())
+        # So are the timestamps, without touching the shared auto_now fields
+        self.assertGreater(Invoice.objects.values('created_at').distinct().count(), 20)
+        self.assertFalse(Invoice.objects.filter(updated_at__lt=F('created_at')).exists())
+        self.assertTrue(Invoice._meta.get_field('created_at').auto_now_add)
+        self.assertTrue(Invoice._meta.get_field('updated_at').auto_now)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_client_benchmark_report(self):
+        seed_demo_data(users=1, clients=3, invoices=2, items=2, seed=1)
+        user = get_user_model().objects.get(username='demo-0')
+        scenarios = [scenario for scenario in build_scenarios(user) if scenario.available]
+        self.assertIn('invoice_edit', [scenario.name for scenario in scenarios])
+
+        results = run_client_benchmark(user, scenarios, requests=2)
+        for name, stats in results.items():
+            with self.subTest(scenario=name):
+                self.assertEqual((stats['requests'], stats['errors']), (2, 0))
+                self.assertGreater(stats['queries_max'], 0)
+
+        report = build_report(user, results)
+        self.assertEqual(report['dataset']['clients'], 3)
+        self.assertEqual(compare_reports(report, report, threshold=0), [])
+
+    def test_compare_reports_flags_slower_scenarios(self):
+        baseline = {
+            'client': {'invoice_list': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries_max': 3}},
+            'http': {'scenarios': {'invoice_list': {'p50_ms': 10.0, 'p95_ms': 20.0}}},
+        }
+        current = {
+            'client': {
+                'invoice_list': {'p50_ms': 10.5, 'p95_ms': 30.0, 'queries_max': 4},
+                'invoice_pdf': {'p50_ms': 500.0, 'p95_ms': 900.0},
+            },
+            'http': {'scenarios': {'invoice_list': {'p50_ms': 12.0, 'p95_ms': 20.0}}},
+        }
+        regressions = compare_reports(baseline, current, threshold=10)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('client invoice_list: p95_ms'))
+        self.assertIn('queries 3 -> 4', regressions[1])
+        self.assertTrue(regressions[2].startswith('http invoice_list: p50_ms'))
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer = Client.objects.create(
+                user=self.user, name='Hôtel Montana', email='reservations@montana.ht',
+                phone='+509 2940-4000', city='Pétion-Ville',
+            )
+
+    def search(self, query, user=None):
+        return [document.client or document.invoice for document in SearchResults(user or self.user, query)[:20]]
+
+    def create_invoice(self, items, **fields):
+        data = invoice_post_data(self.customer, items)
+        data.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('invoice_create'), data).status_code, 302)
+        return Invoice.objects.filter(user=self.user).latest('pk')
+
+    def test_clients_match_by_prefix_without_accents(self):
+        for query in ('hotel mont', 'MONTANA', 'reservations@montana', 'petion', '50929404000', '2940 40'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [self.customer])
+        self.assertEqual(self.search('montana resort'), [])
+        self.assertEqual(self.search('  ,;  '), [])
+
+    def test_documents_follow_invoice_and_item_changes(self):
+        invoice = self.create_invoice(
+            [{'description': 'Solar generator', 'quantity': '1', 'unit_price': '10'}],
+            notes='Delivered to Jacmel',
+        )
+        self.assertEqual(self.search('generator'), [invoice])
+        self.assertEqual(self.search('jacmel'), [invoice])
+        self.assertEqual(self.search(invoice.invoice_number), [invoice])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item = invoice.line_items.get()
+            item.description = 'Water cistern'
+            item.save()
+        self.assertEqual(self.search('generator'), [])
+        self.assertEqual(self.search('cistern'), [invoice])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.search('cistern'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.delete()
+        self.assertFalse(SearchDocument.objects.filter(user=self.user, invoice__isnull=False).exists())
+
+    def test_results_are_ranked_and_private(self):
+        invoice = self.create_invoice([{'description': 'Montana shuttle', 'quantity': '1', 'unit_price': '10'}])
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        with self.captureOnCommitCallbacks(execute=True):
+            other_client = Client.objects.create(user=other, name='Montana')
+
+        # The client named Montana ranks above the newer invoice mentioning it in an item
+        self.assertEqual(self.search('montana'), [self.customer, invoice])
+        self.assertEqual(self.search('montana', other), [other_client])
+
+    def test_search_page_is_paginated(self):
+        for i in range(25):
+            self.create_invoice([{'description': f'Consulting {i}', 'quantity': '1', 'unit_price': '10'}])
+
+        # Session, user, the ranked matches and the page's documents with their objects
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('search'), {'q': 'consult'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 25)
+        self.assertEqual(len(response.context['results']), 20)
+        self.assertContains(response, 'page=2')
+
+        response = self.client.get(reverse('search'), {'q': 'consult', 'page': 2})
+        self.assertEqual(len(response.context['results']), 5)
+        self.assertEqual(self.client.get(reverse('search')).status_code, 200)
+
+    @mock.patch('invoices.search.RANKED_RESULTS', 10)
+    def test_only_the_best_matches_are_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            oldest = Client.objects.create(user=self.user, name='Consulting Group')
+        invoices = [
+            self.create_invoice([{'description': f'Consulting {i}', 'quantity': '1', 'unit_price': '10'}])
+            for i in range(12)
+        ]
+        results = SearchResults(self.user, 'consulting')
+        self.assertEqual((results.count(), results.truncated), (10, True))
+        # The title match written first still ranks first, ahead of newer body matches
+        self.assertEqual(results[:1][0].client, oldest)
+        self.assertEqual({document.invoice for document in results[1:20]}, set(invoices[3:]))
+
+    def test_other_databases_fall_back_to_a_title_first_scan(self):
+        invoice = self.create_invoice([{'description': 'Montana shuttle', 'quantity': '1', 'unit_price': '10'}])
+        results = SearchResults(self.user, 'Montana')
+        with mock.patch.object(results, '_query', return_value=None):
+            self.assertEqual([document.client or document.invoice for document in results[:20]], [
+                self.customer, invoice,
+            ])
+        self.assertEqual(SearchResults(self.user, 'nowhere')._fallback_rows(), [])
+
+    def test_bulk_writes_are_indexed(self):
+        import_clients(self.user, io.StringIO('name,city\nCassava Depot,Les Cayes\n'))
+        self.assertEqual([client.name for client in self.search('cassava')], ['Cassava Depot'])
+
+        seed_invoices(self.user, clients=2, invoices_per_client=2)
+        self.assertEqual(self.search('item'), [])
+        self.assertEqual(rebuild_search_index([self.user]), (4, 4))
+        self.assertEqual(len(self.search('item')), 4)
+
+
+class ClientAutocompleteTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        Client.objects.bulk_create([
+            Client(user=self.user, name=name, city='Jacmel')
+            for name in ('Épicerie Centrale', 'Epicerie  du Port', 'Garage Moderne', 'Hôtel Montana')
+        ])
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        Client.objects.create(user=other, name='Epicerie Voisine')
+
+    def suggest(self, **params):
+        response = self.client.get(reverse('client_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_matches_are_normalized_ordered_and_limited(self):
+        # Session, user and one query on the (user, name_normalized) index
+        with self.assertNumQueries(3):
+            data = self.suggest(q='EPIC')
+        self.assertEqual([client['name'] for client in data['results']], ['Épicerie Centrale', 'Epicerie  du Port'])
+        self.assertFalse(data['more'])
+        self.assertEqual([client['name'] for client in self.suggest(q='epicerie du')['results']], ['Epicerie  du Port'])
+        self.assertEqual(self.suggest(q='centrale')['results'], [])
+
+        data = self.suggest(limit=2)
+        self.assertEqual(len(data['results']), 2)
+        self.assertTrue(data['more'])
+        self.assertEqual(len(self.suggest(limit='many')['results']), 4)
+
+    def test_name_changes_update_the_normalized_name(self):
+        client = Client.objects.get(name='Garage Moderne')
+        client.name = 'Gérance  Moderne'
+        client.save(update_fields=['name'])
+        client.refresh_from_db()
+        self.assertEqual(client.name_normalized, 'gerance moderne')
+
+    def test_prefix_lookup_uses_the_name_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+        clients = Client.objects.filter(user=self.user).name_startswith('epi').order_by('name_normalized')
+        plan = clients.explain()
+        self.assertIn('client_user_name_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_invoice_form_renders_the_chosen_client_only(self):
+        customer = Client.objects.get(name='Hôtel Montana')
+        response = self.client.get(reverse('invoice_create'), {'client': customer.pk})
+        self.assertContains(response, 'value="Hôtel Montana"')
+        for name in ('Centrale', 'Garage Moderne', 'Voisine'):
+            self.assertNotContains(response, name)
+        self.assertContains(response, f'name="client" value="{customer.pk}"')
+
+    def test_chosen_client_is_validated_server_side(self):
+        foreign = Client.objects.get(name='Epicerie Voisine')
+        for value in (foreign.pk, 'abc', '²', '9' * 30, ''):
+            with self.subTest(value=value):
+                data = invoice_post_data(foreign, [{'description': 'Item', 'quantity': '1', 'unit_price': '10'}])
+                data['client'] = value
+                response = self.client.post(reverse('invoice_create'), data)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('client', response.context['form'].errors)
+        self.assertFalse(Invoice.objects.exists())
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.clients, self.invoices = seed_invoices(self.user, clients=3, invoices_per_client=2, items_per_invoice=2)
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        self.foreign_clients, self.foreign_invoices = seed_invoices(other)
+
+    def get(self, name, *args, status=200, **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_list_is_scoped_paginated_and_sparse(self):
+        # Session, user, the page's timestamps, and the invoices with their client
+        with self.assertNumQueries(4):
+            data = self.get('api_invoice_list', fields='id,total,client', limit=4).json()
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(set(data['results'][0]), {'id', 'total', 'client'})
+        self.assertEqual(set(data['results'][0]['client']), {'id', 'name', 'email'})
+        self.assertIsNone(data['previous_cursor'])
+
+        second = self.get('api_invoice_list', fields='id', limit=4, cursor=data['next_cursor']).json()
+        ids = [row['id'] for row in data['results'] + second['results']]
+        self.assertEqual(ids, sorted((invoice.pk for invoice in self.invoices), reverse=True))
+        self.assertIsNone(second['next_cursor'])
+
+        clients = self.get('api_client_list').json()['results']
+        self.assertEqual({row['id'] for row in clients}, {client.pk for client in self.clients})
+        self.assertNotIn('name_normalized', clients[0])
+
+    def test_fields_drive_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get('api_invoice_list', fields='id,status')
+        self.assertFalse(any('invoices_client' in query['sql'] for query in queries))
+        self.assertFalse(any('invoices_invoiceitem' in query['sql'] for query in queries))
+
+        # ... plus one prefetch of every line item on the page
+        with self.assertNumQueries(5):
+            data = self.get('api_invoice_list', fields='id,line_items').json()
+        self.assertEqual(sum(len(row['line_items']) for row in data['results']), 12)
+
+    def test_detail_and_line_items(self):
+        invoice = self.invoices[0]
+        data = self.get('api_invoice_detail', invoice.pk).json()
+        self.assertEqual(data['invoice_number'], invoice.invoice_number)
+        self.assertEqual(data['total'], '200.00')
+        self.assertEqual([item['description'] for item in data['line_items']], ['Item 0', 'Item 1'])
+
+        items = self.get('api_invoice_line_items', invoice.pk, fields='description,line_total').json()['results']
+        self.assertEqual(items[0], {'description': 'Item 0', 'line_total': '100.00'})
+        self.assertEqual(self.get('api_client_detail', self.clients[0].pk).json()['name'], 'Client 0')
+
+        self.get('api_invoice_detail', self.foreign_invoices[0].pk, status=404)
+        self.get('api_invoice_line_items', self.foreign_invoices[0].pk, status=404)
+        self.get('api_client_detail', self.foreign_clients[0].pk, status=404)
+        self.get('api_invoice_detail', 2 ** 64, status=404)
+        self.get('api_invoice_line_items', 2 ** 64, status=404)
+        self.get('api_invoice_list', fields='id,secret', status=400)
+        self.assertEqual(self.client.get(reverse('api_invoice_list'), {'status': 'lost'}).status_code, 400)
+        for client in ('x', '²', '9' * 30):
+            with self.subTest(client=client):
+                self.assertEqual(self.client.get(reverse('api_invoice_list'), {'client': client}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('api_invoice_list')).status_code, 405)
+        self.client.logout()
+        self.get('api_invoice_list', status=401)
+
+    def test_unchanged_resources_are_not_modified(self):
+        invoice = self.invoices[0]
+        response = self.get('api_invoice_detail', invoice.pk)
+        etag = response['ETag']
+
+        # Session, user and the timestamp query
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_invoice_detail', args=[invoice.pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # A different field selection is a different representation
+        self.assertNotEqual(self.get('api_invoice_detail', invoice.pk, fields='id')['ETag'], etag)
+
+        # Line item edits that leave the totals unchanged still change the invoice
+        time.sleep(0.001)
+        item = invoice.line_items.first()
+        item.description = 'Renamed'
+        item.save()
+        response = self.client.get(reverse('api_invoice_detail', args=[invoice.pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['line_items'][0]['description'], 'Renamed')
+
+    def test_list_etag_follows_embedded_clients(self):
+        etag = self.get('api_invoice_list', fields='id,client')['ETag']
+        response = self.client.get(reverse('api_invoice_list'), {'fields': 'id,client'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        time.sleep(0.001)
+        client = self.clients[0]
+        client.name = 'Renamed'
+        client.save()
+        response = self.client.get(reverse('api_invoice_list'), {'fields': 'id,client'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', {row['client']['name'] for row in response.json()['results']})
+
+
+class BulkInvoiceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.clients, self.invoices = seed_invoices(self.user, clients=5, invoices_per_client=4, items_per_invoice=3)
+        other = get_user_model().objects.create_user('other', password='secret-pass-123')
+        _clients, self.foreign_invoices = seed_invoices(other)
+        rebuild_summary()
+        rebuild_search_index()
+
+    def post_json(self, name, payload):
+        return self.client.post(reverse(name), payload, content_type='application/json')
+
+    def test_status_change_is_set_based_and_reports_each_id(self):
+        ids = [invoice.pk for invoice in self.invoices]
+        already_paid = [invoice.pk for invoice in self.invoices if invoice.status == 'paid']
+        foreign = self.foreign_invoices[0].pk
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_json('invoice_bulk_status', {'ids': ids + [foreign, 'x'], 'status': 'paid'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        outcomes = {result['id']: result['outcome'] for result in data['results']}
+        self.assertEqual(outcomes[already_paid[0]], 'unchanged')
+        self.assertEqual(outcomes[foreign], 'not_found')
+        self.assertEqual(outcomes['x'], 'invalid')
+        self.assertEqual(data['counts'], {'updated': 15, 'unchanged': 5, 'not_found': 1, 'invalid': 1})
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "invoices_invoice"') for query in queries), 1)
+
+        self.assertEqual(Invoice.objects.filter(user=self.user).exclude(status='paid').count(), 0)
+        self.assertEqual(Invoice.objects.get(pk=foreign).status, 'draft')
+        self.assertEqual(verify_summary(), [])
+        self.assertEqual(self.client.get(reverse('invoice_dashboard')).context['paid_count'], 20)
+
+    def test_delete_cascades_in_bulk(self):
+        doomed = [invoice.pk for invoice in self.invoices[:12]]
+        enqueue_pdf(self.invoices[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.post_json('invoice_bulk_delete', {'ids': doomed + [self.foreign_invoices[0].pk]}).json()
+        self.assertEqual(data['counts'], {'deleted': 12, 'not_found': 1})
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 4)
+        self.assertEqual(sum('"invoices_invoiceitem"' in sql for sql in deletes), 1)
+
+        self.assertFalse(Invoice.objects.filter(pk__in=doomed).exists())
+        self.assertFalse(InvoiceItem.objects.filter(invoice_id__in=doomed).exists())
+        self.assertFalse(PdfRenderJob.objects.exists())
+        self.assertEqual(SearchDocument.objects.filter(user=self.user, invoice__isnull=False).count(), 8)
+        self.assertEqual(InvoiceItem.objects.count(), 8 * 3 + 1)
+        self.assertEqual(verify_summary(), [])
+        self.assertEqual(self.client.get(reverse('invoice_dashboard')).context['total_invoices'], 8)
+
+    def test_malformed_ids_are_invalid(self):
+        first = self.invoices[0].pk
+        malformed = ['²', '9' * 30, 2 ** 63, -1, 0, 1.5, True, None, [first]]
+        response = self.post_json('invoice_bulk_delete', {'ids': malformed + [str(first)]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['counts'], {'invalid': len(malformed), 'deleted': 1})
+
+        response = self.client.post(reverse('invoice_bulk_status'), {'ids': ['²', '9' * 30], 'status': 'paid'})
+        self.assertRedirects(response, reverse('invoice_list'), fetch_redirect_response=False)
+
+    def test_batches_are_applied_in_turn(self):
+        ids = [invoice.pk for invoice in self.invoices]
+        self.assertEqual(set(bulk_change_status(self.user, ids, 'canceled', batch_size=7).values()), {'updated'})
+        self.assertEqual(set(bulk_delete(self.user, ids[:10], batch_size=3).values()), {'deleted'})
+        self.assertEqual(Invoice.objects.filter(user=self.user, status='canceled').count(), 10)
+        self.assertEqual(verify_summary(), [])
+
+    def test_list_page_actions(self):
+        response = self.client.get(reverse('invoice_list'))
+        self.assertContains(response, 'name="ids"', count=20)
+
+        selected = [invoice.pk for invoice in self.invoices if invoice.status == 'draft']
+        response = self.client.post(
+            reverse('invoice_bulk_status'),
+            {'ids': selected, 'status': 'sent', 'next': reverse('invoice_list') + '?status=sent'},
+            follow=True,
+        )
+        self.assertRedirects(response, reverse('invoice_list') + '?status=sent')
+        self.assertContains(response, '5 invoices updated.')
+        self.assertEqual(len(response.context['invoices']), 10)
+
+        response = self.client.post(
+            reverse('invoice_bulk_delete'), {'ids': selected, 'next': 'https://example.com/'}, follow=True,
+        )
+        self.assertRedirects(response, reverse('invoice_list'))
+        self.assertContains(response, '5 invoices deleted.')
+
+        response = self.client.post(reverse('invoice_bulk_status'), {'ids': selected, 'status': 'lost'}, follow=True)
+        self.assertContains(response, 'Invalid status.')
+        self.assertEqual(self.post_json('invoice_bulk_status', {'ids': selected, 'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.post_json('invoice_bulk_delete', {'id': 1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('invoice_bulk_delete')).status_code, 405)
+
+
+class ConditionalInvoiceTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.user = get_user_model().objects.create_user('owner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        clients, invoices = seed_invoices(self.user, items_per_invoice=2)
+        self.customer, self.invoice = clients[0], invoices[0]
+
+    def get(self, name, *headers_from, **headers):
+        for response in headers_from:
+            headers.setdefault('HTTP_IF_NONE_MATCH', response['ETag'])
+        return self.client.get(reverse(name, args=[self.invoice.pk]), **headers)
+
+    def touch(self, obj, **changes):
+        time.sleep(0.001)
+        for field, value in changes.items():
+            setattr(obj, field, value)
+        obj.save()
+
+    def test_unchanged_detail_page_is_not_rendered_again(self):
+        # The first response sets the CSRF cookie, which the page's ETag includes
+        self.get('invoice_detail')
+        first = self.get('invoice_detail')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+
+        # Session, user and the invoice with its client and owner; no line items, no template
+        with self.assertNumQueries(3), self.assertTemplateNotUsed('invoices/invoice_detail.html'):
+            response = self.get('invoice_detail', first)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response = self.get('invoice_detail', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_page_changes_with_what_it_shows(self):
+        item = self.invoice.line_items.first()
+        self.customer.refresh_from_db()
+        changes = (
+            (item, {'description': 'Renamed item'}),
+            (self.customer, {'name': 'Renamed client'}),
+            (self.user, {'business_name': 'Renamed business'}),
+        )
+        self.get('invoice_detail')
+        for obj, fields in changes:
+            with self.subTest(model=type(obj).__name__):
+                first = self.get('invoice_detail')
+                self.assertEqual(self.get('invoice_detail', first).status_code, 304)
+                self.touch(obj, **fields)
+                response = self.get('invoice_detail', first)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, list(fields.values())[0])
+
+    def test_pages_with_messages_are_not_reused(self):
+        first = self.get('invoice_detail')
+        self.client.get(reverse('invoice_change_status', args=[self.invoice.pk, 'paid']))
+        response = self.get('invoice_detail', first)
+        self.assertContains(response, 'Invoice status changed to paid.')
+        self.assertNotIn('ETag', response)
+
+    def test_unchanged_pdf_is_not_rendered_or_read_again(self):
+        with override_settings(PDF_CACHE_DIR=self.tmp.name):
+            invoice = Invoice.objects.select_related('client', 'user').get(pk=self.invoice.pk)
+            pdf.cached_pdf_path(invoice).write_bytes(b'%PDF-1.7 cached')
+            first = self.get('invoice_pdf')
+            self.assertEqual(b''.join(first.streaming_content), b'%PDF-1.7 cached')
+            self.assertIn('ETag', first)
+
+            # Even without the cached file, the client's copy is current
+            pdf.cached_pdf_path(invoice).unlink()
+            with mock.patch('invoices.pdf.render_to_cache') as render:
+                response = self.get('invoice_pdf', first)
+            self.assertEqual(response.status_code, 304)
+            render.assert_not_called()
+
+    def test_profile_changes_give_the_pdf_a_new_version(self):
+        invoice = Invoice.objects.select_related('client', 'user').get(pk=self.invoice.pk)
+        version = pdf.pdf_version(invoice)
+        self.touch(self.user, logo='logos/new.png')
+        invoice = Invoice.objects.select_related('client', 'user').get(pk=self.invoice.pk)
+        self.assertNotEqual(pdf.pdf_version(invoice), version)
@@ -0,0 +1,121 @@
+"""
+Incremental maintenance of invoice totals.
+
+Saving or deleting a single line item shifts the invoice's subtotal by the
+change in that item's ``line_total`` instead of re-summing every line item.
+The invoice row is read with ``select_for_update``, the rounded tax,
+discount and total for the new subtotal are computed in Python, and all of
+them are written back with one UPDATE in the same transaction.
+
+``find_total_drift`` and ``repair_totals`` recompute totals from the line
+items to detect and fix any drift (e.g. rows changed with raw SQL).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import bump_user_cache_version
+from .models import Invoice
+from .summary import apply_summary_delta, rebuild_summary, to_amount
+
+
+TOTAL_FIELDS = ('subtotal', 'tax_amount', 'discount_amount', 'total')
+
+
+def apply_line_total_delta(invoice_id, delta, invoice=None):
+    """
+    Shift the totals of an invoice by ``delta``, the change in one line total,
+    with a locked read of the invoice row and one UPDATE of its totals.
+
+    ``invoice`` is an in-memory copy of the invoice (usually the line item's
+    cached ``invoice``) that is refreshed with the new totals so a later
+    ``save()`` of it does not account for the change twice.
+    """
+    invoices = Invoice.objects.filter(pk=invoice_id)
+    if not delta:
+        # The totals hold but the items changed: keep updated_at, which the
+        # API's ETags are derived from, moving
+        now = timezone.now()
+        invoices.update(updated_at=now)
+        if invoice is not None:
+            invoice.updated_at = now
+        return
+
+    with transaction.atomic():
+        # Lock the invoice so the percentages used below cannot change under us
+        row = (
+            invoices
+            .select_for_update()
+            .values('user_id', 'status', 'currency', 'subtotal', 'total', 'tax_percent', 'discount_percent')
+            .first()
+        )
+        if row is None:
+            return
+
+        # Write the rounded totals for the new subtotal rather than adding
+        # the unrounded tax and discount changes, which some databases (e.g.
+        # SQLite) would store with more than two decimals
+        totals = expected_totals(to_amount(row['subtotal'] + delta), row['tax_percent'], row['discount_percent'])
+        invoices.update(**totals, updated_at=timezone.now())
+        apply_summary_delta(
+            row['user_id'], row['status'], row['currency'], 0, totals['total'] - to_amount(row['total']),
+        )
+        bump_user_cache_version(row['user_id'])
+
+        if invoice is not None:
+            invoice.refresh_from_db(fields=TOTAL_FIELDS + ('updated_at',))
+            invoice._remember_summary_state()
+
+
+def expected_totals(subtotal, tax_percent, discount_percent):
+    """Return the totals an invoice should store for a given subtotal"""
+    invoice = Invoice(subtotal=subtotal, tax_percent=tax_percent, discount_percent=discount_percent)
+    invoice.calculate_totals(line_items=None)
+    return {field: to_amount(getattr(invoice, field)) for field in TOTAL_FIELDS}
+
+
+def find_total_drift(invoices=None, chunk_size=2000):
+    """
+    Yield ``(invoice, expected)`` for every invoice whose stored totals do not
+    match the sum of its line items. ``expected`` maps total fields to values.
+    """
+    if invoices is None:
+        invoices = Invoice.objects.all()
+
+    invoices = (
+        invoices
+        .order_by()
+        .only('user_id', 'tax_percent', 'discount_percent', *TOTAL_FIELDS)
+        .annotate(items_subtotal=Coalesce(
+            Sum('line_items__line_total'),
+            Value(Decimal('0')),
+            output_field=DecimalField(),
+        ))
+    )
+    for invoice in invoices.iterator(chunk_size=chunk_size):
+        expected = expected_totals(
+            to_amount(invoice.items_subtotal), invoice.tax_percent, invoice.discount_percent
+        )
+        if any(to_amount(getattr(invoice, field)) != value for field, value in expected.items()):
+            yield invoice, expected
+
+
+def repair_totals(invoices=None, batch_size=500):
+    """Rewrite drifted invoice totals and rebuild the affected summaries; return the repaired count"""
+    repaired = []
+    user_ids = set()
+    for invoice, expected in find_total_drift(invoices):
+        for field, value in expected.items():
+            setattr(invoice, field, value)
+        repaired.append(invoice)
+        user_ids.add(invoice.user_id)
+
+    with transaction.atomic():
+        Invoice.objects.bulk_update(repaired, TOTAL_FIELDS, batch_size=batch_size)
+        if user_ids:
+            # bulk_update bypasses the signals that keep the summary and caches in sync
+            rebuild_summary(users=sorted(user_ids))
+    return len(repaired)
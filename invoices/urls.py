@@ -1,9 +1,10 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Client URLs
     path('clients/', views.ClientListView.as_view(), name='client_list'),
+    path('clients/autocomplete/', views.client_autocomplete, name='client_autocomplete'),
     path('clients/add/', views.ClientCreateView.as_view(), name='client_create'),
     path('clients/<int:pk>/', views.ClientDetailView.as_view(), name='client_detail'),
     path('clients/<int:pk>/edit/', views.ClientUpdateView.as_view(), name='client_update'),
@@ -11,13 +12,30 @@ urlpatterns = [
     
     # Invoice URLs
     path('invoices/', views.InvoiceListView.as_view(), name='invoice_list'),
+    path('invoices/bulk/status/', views.bulk_invoice_status, name='invoice_bulk_status'),
+    path('invoices/bulk/delete/', views.bulk_invoice_delete, name='invoice_bulk_delete'),
+    path('invoices/export/pdf/', views.export_invoice_pdfs, name='invoice_export_pdf'),
+    path('export/<slug:dataset>.csv', views.export_csv, name='export_csv'),
+    path('export/<slug:dataset>.xlsx', views.export_xlsx, name='export_xlsx'),
+    path('import/', views.import_csv, name='import_csv'),
     path('invoices/add/', views.create_invoice, name='invoice_create'),
     path('invoices/<int:pk>/', views.InvoiceDetailView.as_view(), name='invoice_detail'),
     path('invoices/<int:pk>/edit/', views.edit_invoice, name='invoice_update'),
     path('invoices/<int:pk>/delete/', views.delete_invoice, name='invoice_delete'),
     path('invoices/<int:pk>/status/<str:status>/', views.change_invoice_status, name='invoice_change_status'),
     path('invoices/<int:pk>/pdf/', views.generate_invoice_pdf, name='invoice_pdf'),
+    path('invoices/<int:pk>/pdf/status/', views.invoice_pdf_status, name='invoice_pdf_status'),
     
     # Dashboard
     path('dashboard/', views.invoice_dashboard, name='invoice_dashboard'),
+    
+    # Search
+    path('search/', views.search, name='search'),
+    
+    # Read-only JSON API
+    path('api/invoices/', api.invoice_list, name='api_invoice_list'),
+    path('api/invoices/<int:pk>/', api.invoice_detail, name='api_invoice_detail'),
+    path('api/invoices/<int:pk>/line-items/', api.invoice_line_items, name='api_invoice_line_items'),
+    path('api/clients/', api.client_list, name='api_client_list'),
+    path('api/clients/<int:pk>/', api.client_detail, name='api_client_detail'),
 ]
\ No newline at end of file
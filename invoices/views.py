@@ -1,35 +1,73 @@
+import csv
+import io
+import json
+import logging
+from collections import Counter
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.template.loader import get_template
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.db.models import prefetch_related_objects
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, url_has_allowed_host_and_scheme
+from django.utils.translation import get_language
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+
+from core.db_routers import read_from_replica
+
+from . import bulk, pdf
+from .api import make_etag
+from .models import Client, Invoice, InvoiceItem, PdfRenderJob
+from .cache import cached_for_user
+from .exports import DATASETS as EXPORT_DATASETS, stream_export
+from .forms import ClientForm, CsvImportForm, InvoiceExportForm, InvoiceForm, InvoiceItemFormSet, parse_id
+from .imports import IMPORTERS
+from .pagination import KeysetPaginationMixin
+from .pdf_export import export_queryset, stream_invoice_zip
+from .pdf_queue import enqueue_pdf
+from .search import SearchResults
+from .stats import get_cached_invoice_stats
+from .xlsx import CONTENT_TYPE as XLSX_CONTENT_TYPE, stream_xlsx_export
 
-from .models import Client, Invoice, InvoiceItem
-from .forms import ClientForm, InvoiceForm, InvoiceItemFormSet
 
-# Try to import weasyprint for PDF generation
-try:
-    from weasyprint import HTML, CSS
-    WEASYPRINT_INSTALLED = True
-except ImportError:
-    WEASYPRINT_INSTALLED = False
+logger = logging.getLogger(__name__)
+
+
+# Rejected rows listed on the import page
+IMPORT_ERRORS_SHOWN = 500
+SEARCH_RESULTS_PER_PAGE = 20
+# Suggestions returned by the client picker, by default and at most
+CLIENT_AUTOCOMPLETE_LIMIT = 10
+CLIENT_AUTOCOMPLETE_MAX_LIMIT = 50
 
 
 # Client Views
-class ClientListView(LoginRequiredMixin, ListView):
+@method_decorator(read_from_replica, name='dispatch')
+class ClientListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Client
     template_name = 'invoices/client_list.html'
     context_object_name = 'clients'
     
     def get_queryset(self):
-        return Client.objects.filter(user=self.request.user)
+        return Client.objects.filter(user=self.request.user).with_billing_stats()
+    
+    def paginate_queryset(self, queryset, page_size):
+        # Cache whole pages until one of the user's clients or invoices changes
+        return cached_for_user(
+            self.request.user.pk,
+            'client-list',
+            lambda: super(ClientListView, self).paginate_queryset(queryset, page_size),
+            self.request.GET.get(self.cursor_kwarg, ''),
+        )
 
 
 class ClientDetailView(LoginRequiredMixin, DetailView):
@@ -38,11 +76,11 @@ class ClientDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'client'
     
     def get_queryset(self):
-        return Client.objects.filter(user=self.request.user)
+        return Client.objects.filter(user=self.request.user).with_billing_stats()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['invoices'] = self.object.invoices.all()
+        context['invoices'] = list(self.object.invoices.all())
         return context
 
 
@@ -87,14 +125,37 @@ class ClientDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+@login_required
+@read_from_replica
+def client_autocomplete(request):
+    """Clients of the user whose name starts with ``q``, for the client picker"""
+    try:
+        limit = int(request.GET.get('limit', CLIENT_AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = CLIENT_AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, CLIENT_AUTOCOMPLETE_MAX_LIMIT))
+    
+    clients = (
+        Client.objects
+        .filter(user=request.user)
+        .name_startswith(request.GET.get('q', ''))
+        .order_by('name_normalized', 'id')
+        .values('id', 'name', 'email', 'city')
+    )
+    # One extra row tells whether there are more matches than shown
+    results = list(clients[:limit + 1])
+    return JsonResponse({'results': results[:limit], 'more': len(results) > limit})
+
+
 # Invoice Views
-class InvoiceListView(LoginRequiredMixin, ListView):
+@method_decorator(read_from_replica, name='dispatch')
+class InvoiceListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Invoice
     template_name = 'invoices/invoice_list.html'
     context_object_name = 'invoices'
     
     def get_queryset(self):
-        queryset = Invoice.objects.filter(user=self.request.user)
+        queryset = Invoice.objects.filter(user=self.request.user).select_related('client')
         status = self.request.GET.get('status')
         if status:
             queryset = queryset.filter(status=status)
@@ -103,18 +164,9 @@ class InvoiceListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Add invoice stats
-        invoices = Invoice.objects.filter(user=self.request.user)
-        context['total_invoices'] = invoices.count()
-        context['draft_count'] = invoices.filter(status='draft').count()
-        context['sent_count'] = invoices.filter(status='sent').count()
-        context['paid_count'] = invoices.filter(status='paid').count()
-        context['overdue_count'] = invoices.filter(status='overdue').count()
-        
-        # Calculate total amounts
-        context['total_amount'] = invoices.aggregate(Sum('total'))['total__sum'] or 0
-        context['total_paid'] = invoices.filter(status='paid').aggregate(Sum('total'))['total__sum'] or 0
-        context['total_outstanding'] = invoices.exclude(status='paid').aggregate(Sum('total'))['total__sum'] or 0
+        # Add invoice stats (single summary query, cached until the invoices change)
+        context.update(get_cached_invoice_stats(self.request.user))
+        context['status_choices'] = Invoice.STATUS_CHOICES
         
         return context
 
@@ -125,7 +177,47 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'invoice'
     
     def get_queryset(self):
-        return Invoice.objects.filter(user=self.request.user)
+        return (
+            Invoice.objects
+            .filter(user=self.request.user)
+            .select_related('client', 'user')
+        )
+    
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # Pending messages are rendered into the page, which must then not be reused
+        conditional = not messages.get_messages(request)
+        if conditional:
+            # The page also depends on the language and on the CSRF token of its forms
+            etag = make_etag(
+                'invoice-page', pdf.pdf_version(self.object), get_language(),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            )
+            last_modified = pdf.last_modified(self.object)
+            not_modified = _not_modified(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+        
+        # Only pages that are rendered need the line items
+        prefetch_related_objects([self.object], 'line_items')
+        response = self.render_to_response(self.get_context_data(object=self.object))
+        if conditional:
+            _set_validators(response, etag, last_modified)
+        return response
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Invoices are private: browsers may keep them but must revalidate them
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _not_modified(request, etag, last_modified):
+    """A 304 (or 412) response if the client's copy is still current, otherwise None"""
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    return None if response is None else _set_validators(response, etag, last_modified)
 
 
 @login_required
@@ -142,33 +234,17 @@ def create_invoice(request):
     
     if request.method == 'POST':
         form = InvoiceForm(request.POST, user=request.user)
+        formset = InvoiceItemFormSet(request.POST, instance=form.instance)
         
-        if form.is_valid():
-            # Save the invoice first without committing
+        # Validate everything before writing so an invalid formset never
+        # leaves an orphaned invoice behind
+        if form.is_valid() and formset.is_valid():
             invoice = form.save(commit=False)
             invoice.user = request.user
-            invoice.save()  # Save to get an ID
-            
-            # Now process the formset with the saved invoice instance
-            formset = InvoiceItemFormSet(request.POST, instance=invoice)
+            formset.save_with_invoice(invoice)
             
-            if formset.is_valid():
-                # Save the formset items
-                formset.save()
-                
-                # Recalculate totals based on saved items
-                invoice.calculate_totals()
-                invoice.save()
-                
-                messages.success(request, _('Invoice created successfully.'))
-                return redirect('invoice_detail', pk=invoice.pk)
-            else:
-                # If formset is invalid, delete the invoice to avoid orphaned records
-                invoice.delete()
-                # Re-render the form with formset errors
-        
-        # Form is invalid, prepare formset for re-rendering
-        formset = InvoiceItemFormSet(request.POST)
+            messages.success(request, _('Invoice created successfully.'))
+            return redirect('invoice_detail', pk=invoice.pk)
     else:
         # GET request - new form
         form = InvoiceForm(user=request.user, initial=initial_data)
@@ -188,24 +264,14 @@ def edit_invoice(request, pk):
     
     if request.method == 'POST':
         form = InvoiceForm(request.POST, instance=invoice, user=request.user)
-        if form.is_valid():
-            # Save the form but don't recalculate totals yet
-            invoice = form.save()
-            
-            # Process the formset
-            formset = InvoiceItemFormSet(request.POST, instance=invoice)
-            if formset.is_valid():
-                # Save formset items
-                formset.save()
-                
-                # Now recalculate totals based on all items
-                invoice.calculate_totals()
-                invoice.save()
-                
-                messages.success(request, _('Invoice updated successfully.'))
-                return redirect('invoice_detail', pk=invoice.pk)
-        # If form is invalid, prepare formset for re-rendering
         formset = InvoiceItemFormSet(request.POST, instance=invoice)
+        if form.is_valid() and formset.is_valid():
+            # Save the invoice and all line item changes in one transaction
+            invoice = form.save(commit=False)
+            formset.save_with_invoice(invoice)
+            
+            messages.success(request, _('Invoice updated successfully.'))
+            return redirect('invoice_detail', pk=invoice.pk)
     else:
         # GET request - load existing invoice data
         form = InvoiceForm(instance=invoice, user=request.user)
@@ -243,7 +309,8 @@ def change_invoice_status(request, pk, status):
         return redirect('invoice_detail', pk=invoice.pk)
     
     invoice.status = status
-    invoice.save()
+    # Totals are maintained incrementally; only the status changes here
+    invoice.save(update_totals=False, update_fields=['status', 'updated_at'])
     
     status_labels = dict(Invoice.STATUS_CHOICES)
     messages.success(
@@ -254,73 +321,279 @@ def change_invoice_status(request, pk, status):
     return redirect('invoice_detail', pk=invoice.pk)
 
 
+class BulkRequestError(Exception):
+    """A bulk action request that cannot be applied"""
+
+
+def _wants_json(request):
+    return request.content_type == 'application/json' or 'application/json' in request.headers.get('Accept', '')
+
+
+def _bulk_request(request):
+    """``(ids, data)`` of a bulk action posted as JSON or by the invoice list's form"""
+    if request.content_type != 'application/json':
+        return request.POST.getlist('ids'), request.POST
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise BulkRequestError(_('The request body is not valid JSON.'))
+    if not isinstance(data, dict) or not isinstance(data.get('ids'), list):
+        raise BulkRequestError(_('Send the invoice ids as a list in "ids".'))
+    return data['ids'], data
+
+
+def _bulk_action(request, apply, done_message):
+    """
+    Run ``apply(ids, data)`` on the posted invoice ids. API clients get one
+    outcome per posted id, the invoice list's form a message and a redirect.
+    """
+    wants_json = _wants_json(request)
+    try:
+        ids, data = _bulk_request(request)
+        if len(ids) > bulk.MAX_IDS:
+            raise BulkRequestError(
+                _('At most %(count)d invoices can be changed at once.') % {'count': bulk.MAX_IDS}
+            )
+        parsed = [(value, parse_id(value)) for value in ids]
+        outcomes = apply([pk for _value, pk in parsed if pk is not None], data)
+    except BulkRequestError as exc:
+        if wants_json:
+            return JsonResponse({'error': str(exc)}, status=400)
+        messages.error(request, str(exc))
+        return _back_to_list(request)
+    
+    results = [
+        {'id': value, 'outcome': bulk.INVALID if pk is None else outcomes[pk]}
+        for value, pk in parsed
+    ]
+    counts = Counter(result['outcome'] for result in results)
+    if wants_json:
+        return JsonResponse({'results': results, 'counts': counts})
+    
+    if not ids:
+        messages.warning(request, _('No invoices were selected.'))
+    done = counts[bulk.UPDATED] + counts[bulk.DELETED]
+    if done:
+        messages.success(request, done_message % {'count': done})
+    missed = counts[bulk.NOT_FOUND] + counts[bulk.INVALID]
+    if missed:
+        messages.warning(request, _('%(count)d of the selected invoices could not be found.') % {'count': missed})
+    return _back_to_list(request)
+
+
+def _back_to_list(request):
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        return redirect(next_url)
+    return redirect('invoice_list')
+
+
+@login_required
+@require_POST
+def bulk_invoice_status(request):
+    """Set the status of many invoices with one UPDATE per batch"""
+    def apply(ids, data):
+        status = data.get('status')
+        if status not in dict(Invoice.STATUS_CHOICES):
+            raise BulkRequestError(_('Invalid status.'))
+        return bulk.bulk_change_status(request.user, ids, status)
+    
+    return _bulk_action(request, apply, _('%(count)d invoices updated.'))
+
+
+@login_required
+@require_POST
+def bulk_invoice_delete(request):
+    """Delete many invoices and their line items with set-based DELETEs"""
+    return _bulk_action(request, lambda ids, data: bulk.bulk_delete(request.user, ids), _('%(count)d invoices deleted.'))
+
+
 @login_required
 def generate_invoice_pdf(request, pk):
-    """Generate a PDF for an invoice"""
-    invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
+    """Serve an invoice PDF from the cache, rendering it if needed"""
+    invoice = get_object_or_404(Invoice.objects.select_related('client', 'user'), pk=pk, user=request.user)
+    
+    # A client holding the current version gets a 304 without the PDF being rendered or read
+    etag = make_etag('invoice-pdf', pdf.pdf_version(invoice))
+    last_modified = pdf.last_modified(invoice)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    
+    pdf_file = pdf.open_cached_pdf(invoice)
+    if pdf_file is None:
+        if not pdf.WEASYPRINT_INSTALLED:
+            messages.error(request, _('PDF generation is not available. Please install WeasyPrint.'))
+            return redirect('invoice_detail', pk=invoice.pk)
+        
+        if settings.PDF_ASYNC_RENDERING:
+            # Hand the rendering to run_pdf_worker and let the client poll
+            job = enqueue_pdf(invoice)
+            if job.status == PdfRenderJob.STATUS_FAILED:
+                messages.error(request, _('The PDF could not be generated. Please try again later.'))
+                return redirect('invoice_detail', pk=invoice.pk)
+            
+            status_url = reverse('invoice_pdf_status', args=[invoice.pk])
+            response = render(request, 'invoices/invoice_pdf_pending.html', {
+                'invoice': invoice,
+                'status_url': status_url,
+            }, status=202)
+            response['Location'] = status_url
+            response['Retry-After'] = '2'
+            return response
+        
+        pdf_file = pdf.open_cached_pdf(invoice, render=True)
+    
+    response = FileResponse(
+        pdf_file,
+        as_attachment=True,
+        filename=f'invoice_{invoice.invoice_number}.pdf',
+        content_type='application/pdf',
+    )
+    return _set_validators(response, etag, last_modified)
+
+
+@login_required
+def invoice_pdf_status(request, pk):
+    """Report whether the current version of an invoice PDF is ready"""
+    invoice = get_object_or_404(Invoice.objects.select_related('client', 'user'), pk=pk, user=request.user)
+    
+    if pdf.get_cached_pdf(invoice) is not None:
+        status = PdfRenderJob.STATUS_DONE
+    else:
+        job = (
+            PdfRenderJob.objects
+            .filter(invoice=invoice, version=pdf.pdf_version(invoice))
+            .values_list('status', flat=True)
+            .first()
+        )
+        status = job or PdfRenderJob.STATUS_PENDING
+    
+    return JsonResponse({
+        'status': status,
+        'ready': status == PdfRenderJob.STATUS_DONE,
+        'pdf_url': reverse('invoice_pdf', args=[invoice.pk]),
+    })
+
+
+@login_required
+def export_invoice_pdfs(request):
+    """Stream a ZIP archive with the PDFs of the invoices matching the filters"""
+    form = InvoiceExportForm(request.GET or None, user=request.user)
+    if request.GET and not form.is_valid():
+        messages.error(request, _('Invalid export filters.'))
+        return redirect('invoice_list')
+    filters = form.cleaned_data if form.is_bound else {}
     
-    if not WEASYPRINT_INSTALLED:
+    invoices = export_queryset(request.user, **filters)
+    if not pdf.WEASYPRINT_INSTALLED:
         messages.error(request, _('PDF generation is not available. Please install WeasyPrint.'))
-        return redirect('invoice_detail', pk=invoice.pk)
+        return redirect('invoice_list')
     
-    # Render the invoice template with context
-    template = get_template('invoices/invoice_pdf.html')
-    context = {
-        'invoice': invoice,
-        'user': request.user,
-        'line_items': invoice.line_items.all(),
-    }
-    html = template.render(context)
-    
-    # Create a PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
-    
-    # Generate PDF from HTML
-    HTML(string=html).write_pdf(
-        response,
-        stylesheets=[
-            CSS(string='@page { margin: 1cm; }')
-        ]
-    )
+    # Every missing PDF is rendered before the response starts, so a failure
+    # is reported here instead of cutting the download short; the cap keeps
+    # that wait well below the server's request timeout
+    if invoices.count() > settings.PDF_EXPORT_MAX_INVOICES:
+        messages.error(request, _(
+            'Select at most %(count)d invoices to download as PDFs, e.g. by narrowing the dates.'
+        ) % {'count': settings.PDF_EXPORT_MAX_INVOICES})
+        return redirect('invoice_list')
+    
+    try:
+        chunks = stream_invoice_zip(invoices, processes=settings.PDF_EXPORT_PROCESSES)
+    except Exception:
+        logger.exception('PDF export failed for user %s', request.user.pk)
+        messages.error(request, _('The PDFs could not be generated. Please try again.'))
+        return redirect('invoice_list')
+    
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+    return response
+
+
+def _export(request, dataset, stream, content_type, extension):
+    """Stream an export of ``dataset`` with the filters of InvoiceExportForm"""
+    if dataset not in EXPORT_DATASETS:
+        raise Http404
+    
+    form = InvoiceExportForm(request.GET or None, user=request.user)
+    if request.GET and not form.is_valid():
+        messages.error(request, _('Invalid export filters.'))
+        return redirect('invoice_list')
+    filters = form.cleaned_data if form.is_bound else {}
     
+    response = StreamingHttpResponse(stream(dataset, request.user, **filters), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{extension}"'
     return response
 
 
 @login_required
+def export_csv(request, dataset):
+    """Stream a CSV export of the user's invoices, line items or clients"""
+    return _export(request, dataset, stream_export, 'text/csv; charset=utf-8', 'csv')
+
+
+@login_required
+def export_xlsx(request, dataset):
+    """Stream an Excel workbook export of the user's invoices, line items or clients"""
+    return _export(request, dataset, stream_xlsx_export, XLSX_CONTENT_TYPE, 'xlsx')
+
+
+@login_required
+def import_csv(request):
+    """Import clients or invoices from an uploaded CSV file"""
+    result = None
+    if request.method == 'POST':
+        form = CsvImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            importer = IMPORTERS[form.cleaned_data['dataset']]
+            lines = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = importer(request.user, lines)
+            except (UnicodeDecodeError, csv.Error):
+                form.add_error('file', _('The file is not a valid UTF-8 CSV file.'))
+            else:
+                form = CsvImportForm(initial={'dataset': form.cleaned_data['dataset']})
+    else:
+        form = CsvImportForm(initial={'dataset': request.GET.get('dataset', 'clients')})
+    
+    return render(request, 'invoices/import_form.html', {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+    })
+
+
+@login_required
+@read_from_replica
 def invoice_dashboard(request):
     """Dashboard with invoice statistics"""
-    # Get all invoices for this user
-    invoices = Invoice.objects.filter(user=request.user)
-    
-    # Basic counts
-    total_invoices = invoices.count()
-    draft_count = invoices.filter(status='draft').count()
-    sent_count = invoices.filter(status='sent').count()
-    paid_count = invoices.filter(status='paid').count()
-    overdue_count = invoices.filter(status='overdue').count()
-    
-    # Calculate totals
-    total_amount = invoices.aggregate(Sum('total'))['total__sum'] or 0
-    total_paid = invoices.filter(status='paid').aggregate(Sum('total'))['total__sum'] or 0
-    total_outstanding = invoices.exclude(status='paid').aggregate(Sum('total'))['total__sum'] or 0
-    
-    # Recent invoices and clients
-    recent_invoices = invoices.order_by('-created_at')[:5]
-    recent_clients = Client.objects.filter(user=request.user).order_by('-created_at')[:5]
-    
-    # Context data
-    context = {
-        'total_invoices': total_invoices,
-        'draft_count': draft_count,
-        'sent_count': sent_count,
-        'paid_count': paid_count,
-        'overdue_count': overdue_count,
-        'total_amount': total_amount,
-        'total_paid': total_paid,
-        'total_outstanding': total_outstanding,
-        'recent_invoices': recent_invoices,
-        'recent_clients': recent_clients,
-    }
+    # Counts and totals for every status, cached until the invoices change
+    context = dict(get_cached_invoice_stats(request.user))
+    
+    # Recent invoices and clients; the template caches the rendered lists, so
+    # these querysets only run on a cache miss
+    context['recent_invoices'] = (
+        Invoice.objects.filter(user=request.user).select_related('client').order_by('-created_at')[:5]
+    )
+    context['recent_clients'] = (
+        Client.objects.filter(user=request.user)
+        .with_billing_stats()
+        .order_by('-created_at')[:5]
+    )
     
     return render(request, 'invoices/dashboard.html', context)
+
+
+@login_required
+@read_from_replica
+def search(request):
+    """Ranked full-text search over the user's clients and invoices"""
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(SearchResults(request.user, query), SEARCH_RESULTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'invoices/search.html', {
+        'query': query,
+        'page_obj': page_obj,
+        'results': page_obj.object_list,
+    })
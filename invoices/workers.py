@@ -0,0 +1,46 @@
+"""
+Process pools for CPU-bound work such as PDF rendering.
+
+Workers are spawned rather than forked so they never inherit (and corrupt)
+the parent's open database connections; each one sets Django up once and
+then opens its own connection on first use. Spawning and setting Django up
+takes seconds, so code running inside requests shares one long-lived pool
+per process (``shared_process_pool``) instead of starting its own.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _setup_django():
+    import django
+    django.setup()
+
+
+def process_pool(processes):
+    """Return a ProcessPoolExecutor with ``processes`` Django-ready workers"""
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_setup_django,
+    )
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def shared_process_pool(processes):
+    """Return this process's pool of ``processes`` workers, started on first use"""
+    with _shared_pools_lock:
+        if processes not in _shared_pools:
+            _shared_pools[processes] = process_pool(processes)
+        return _shared_pools[processes]
+
+
+def discard_shared_process_pool(processes):
+    """Drop a shared pool whose workers died, so the next call starts a new one"""
+    with _shared_pools_lock:
+        pool = _shared_pools.pop(processes, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
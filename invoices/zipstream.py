@@ -0,0 +1,26 @@
+"""
+ZIP archives written as a stream of byte chunks.
+
+``zipfile.ZipFile`` writes into a ZipStream, which is not seekable, so every
+entry is followed by a data descriptor instead of having its header patched
+afterwards, and the bytes produced so far can be drained and sent at any
+point while an entry is still being written.
+"""
+
+
+class ZipStream:
+    """Write-only file object collecting the bytes ZipFile produces until drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="profile_updated_at",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="Profile Updated At"
+            ),
+        ),
+    ]
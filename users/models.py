@@ -24,6 +24,10 @@ class User(AbstractUser):
         default='ht'
     )
     
+    # Changes whenever the profile is saved; invoice pages and PDFs show the
+    # business details and logo, so their versions include it
+    profile_updated_at = models.DateTimeField(_('Profile Updated At'), auto_now=True)
+    
     def __str__(self):
         return self.username
         